@@ -0,0 +1,175 @@
+"""
+bench_pipeline
+==============
+
+Timed and memory-measured benchmarks of each stage of the indicator pipeline,
+run against synthetic topic modules at several scales. For example:
+
+    python -m indicators.benchmarks.bench_pipeline --scales small medium
+
+Note that NUTS names are taken from a synthetic lookup, rather than from
+NutsFinder, so that the benchmarks measure the pipeline rather than downloads.
+"""
+
+from argparse import ArgumentParser
+from functools import partial
+from tempfile import TemporaryDirectory
+from unittest import mock
+import json
+import time
+import tracemalloc
+
+from indicators.benchmarks.synthetic import make_topic_module
+from indicators.core import core_utils, nlp_utils, nuts_utils
+from indicators.core.indicator_utils import prepare_file_data, sort_and_filter_data
+from indicators.two.thematic_indicators import generate_indicators, indicators_by_geo
+
+# (n_objects, n_geos, n_topics)
+SCALES = {
+    "small": (1_000, 20, 20),
+    "medium": (10_000, 100, 50),
+    "large": (100_000, 500, 150),
+}
+
+
+def clear_caches():
+    """Clear all module-level caches, so that each repeat is measured cold"""
+    nuts_utils.get_geo_lookup.cache_clear()
+    nlp_utils.parse_corex_topics.cache_clear()
+    nlp_utils.parse_corex_paths.cache_clear()
+    nlp_utils.get_corex_labels.cache_clear()
+    nlp_utils.get_topic_prevalence.cache_clear()
+
+
+def measure(func, repeat=3):
+    """Time `func()`, taking the best of `repeat` runs, and then measure the peak
+    (Python-allocated) memory in a separate run, since tracing slows `func` down.
+
+    Returns:
+        stats, result: Dict of `wall_time` (seconds) and `peak_memory` (MB),
+                       and the return value of the final call to `func`.
+    """
+    wall_times = []
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        func()
+        wall_times.append(time.perf_counter() - start)
+    clear_caches()
+    tracemalloc.start()
+    result = func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {"wall_time": min(wall_times), "peak_memory": peak / 2**20}, result
+
+
+def largest_geo_index(topic_module):
+    """The geo positions for the geography with the most objects"""
+    return max(
+        core_utils.object_getter(topic_module, geo_split=True),
+        key=lambda item: len(item[0]),
+    )[0]
+
+
+def bench_stages(topic_module, repeat=3):
+    """Benchmark each stage of the pipeline for this topic module
+
+    Returns:
+        stats (dict): Stats from `measure` for each stage
+    """
+    module = topic_module
+    geo_index = largest_geo_index(module)
+    all_geo_indexes = partial(core_utils.object_getter, module, geo_split=True)
+    stats = {}
+    stats["object_getter"], _ = measure(lambda: list(all_geo_indexes()), repeat)
+    stats["get_geo_lookup"], _ = measure(
+        lambda: nuts_utils.get_geo_lookup(module), repeat
+    )
+    stats["generate_indicators"], _ = measure(
+        lambda: generate_indicators(module, geo_index, None), repeat
+    )
+    stats["indicators_by_geo"], by_geo = measure(
+        lambda: indicators_by_geo(module), repeat
+    )
+    dataset, entity = "synthetic", module.model_config["metadata"]["entity_type"]
+    indicators = {dataset: {entity: by_geo}}
+    with mock.patch(
+        "indicators.core.indicator_utils.get_nuts_info_lookup",
+        return_value=module.nuts_info_lookup,
+    ):
+        stats["prepare_file_data"], file_data = measure(
+            lambda: prepare_file_data(indicators), repeat
+        )
+    stats["sort_and_filter_data"], _ = measure(
+        lambda: sort_and_filter_data(file_data), repeat
+    )
+    return stats
+
+
+def run_benchmarks(scales, repeat=3, seed=0):
+    """Run the benchmarks for each scale of synthetic data
+
+    Args:
+        scales (dict): Mapping of scale name to (n_objects, n_geos, n_topics)
+        repeat (int): Number of repeats per benchmark.
+    Returns:
+        results (list of dict): One row per (scale, stage)
+    """
+    results = []
+    for scale, (n_objects, n_geos, n_topics) in scales.items():
+        with TemporaryDirectory() as out_dir:
+            module = make_topic_module(
+                out_dir,
+                n_objects=n_objects,
+                n_geos=n_geos,
+                n_topics=n_topics,
+                seed=seed,
+            )
+            for stage, stats in bench_stages(module, repeat=repeat).items():
+                results.append(
+                    dict(
+                        scale=scale,
+                        n_objects=n_objects,
+                        n_geos=n_geos,
+                        n_topics=n_topics,
+                        stage=stage,
+                        **stats,
+                    )
+                )
+    return results
+
+
+def print_results(results):
+    header = f"{'scale':<8}{'stage':<24}{'wall_time (s)':>15}{'peak_memory (MB)':>18}"
+    print(header)
+    print("-" * len(header))
+    for row in results:
+        print(
+            f"{row['scale']:<8}{row['stage']:<24}"
+            f"{row['wall_time']:>15.4f}{row['peak_memory']:>18.2f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the indicator pipeline")
+    parser.add_argument("--scales", nargs="+", choices=SCALES, default=["small"])
+    parser.add_argument(
+        "--custom",
+        nargs=3,
+        type=int,
+        metavar=("N_OBJECTS", "N_GEOS", "N_TOPICS"),
+        help="Run at a custom scale, instead of the named scales",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Optionally save the results to this JSON")
+    args = parser.parse_args()
+
+    scales = {name: SCALES[name] for name in args.scales}
+    if args.custom is not None:
+        scales = {"custom": tuple(args.custom)}
+    results = run_benchmarks(scales, repeat=args.repeat, seed=args.seed)
+    print_results(results)
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,313 @@
+"""
+sqlite_fixture
+==============
+
+An SQLite stand-in for the production MySQL database, with the tables and
+columns which are queried by the topic modules (`arxiv_topics`, `nih_topics`
+and `cordis_topics`), filled with synthetic data at a configurable scale.
+The tables are copied from the nesta ORMs, so the topic modules' queries run
+unchanged against the fixture:
+
+    python -m indicators.benchmarks.sqlite_fixture fixture.db --scale medium
+    INDICATORS_DB_URL=sqlite:///fixture.db INDICATORS_PROFILE=report.json \\
+        python indicators/two/thematic_indicators.py
+
+Only the queried columns are copied, with their generic SQLAlchemy types, so
+that MySQL-specific column types and constraints needn't be supported by SQLite.
+"""
+
+from argparse import ArgumentParser
+from importlib import import_module
+from pathlib import Path
+import logging
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Column, MetaData, Table, create_engine, inspect
+
+from indicators.benchmarks.synthetic import make_objects
+from indicators.core.config import EU_COUNTRIES
+
+# The ORM and queried attributes of each table, by dataset
+TABLES = {
+    "arxiv": {
+        "articles": (
+            "nesta.core.orms.arxiv_orm.Article",
+            ("id", "abstract", "title", "created"),
+        ),
+        "institutes": (
+            "nesta.core.orms.grid_orm.Institute",
+            ("id", "latitude", "longitude", "country_code"),
+        ),
+        "links": (
+            "nesta.core.orms.arxiv_orm.ArticleInstitute",
+            ("article_id", "institute_id"),
+        ),
+    },
+    "nih": {
+        "projects": (
+            "nesta.core.orms.general_orm.NihProject",
+            (
+                "application_id",
+                "phr",
+                "abstract_text",
+                "project_title",
+                "project_start",
+                "total_cost",
+                "coordinates",
+                "is_eu",
+                "iso2",
+            ),
+        ),
+    },
+    "cordis": {
+        "projects": (
+            "nesta.core.orms.cordis_orm.Project",
+            ("rcn", "objective", "title", "start_date_code", "total_cost"),
+        ),
+        "organisations": (
+            "nesta.core.orms.cordis_orm.Organisation",
+            ("id", "country_code"),
+        ),
+        "links": (
+            "nesta.core.orms.cordis_orm.ProjectOrganisation",
+            ("project_rcn", "organization_id"),
+        ),
+    },
+}
+# Number of arXiv articles, NIH projects and CORDIS projects, and of arXiv
+# (GRID) institutes and CORDIS organisations
+SCALES = {
+    "small": dict(n_articles=1_000, n_nih=1_000, n_cordis=1_000, n_orgs=100),
+    "medium": dict(n_articles=50_000, n_nih=20_000, n_cordis=10_000, n_orgs=2_000),
+    "large": dict(n_articles=500_000, n_nih=200_000, n_cordis=50_000, n_orgs=20_000),
+}
+NON_EU_COUNTRIES = ["US", "CN", "JP", "CA", "IN"]
+
+
+def get_orm(path):
+    """Import an ORM class by its dotted path"""
+    module, name = path.rsplit(".", 1)
+    return getattr(import_module(module), name)
+
+
+def generic_type(sql_type):
+    """The generic (i.e. dialect-agnostic) equivalent of a column type"""
+    try:
+        return sql_type.as_generic()
+    except NotImplementedError:
+        return sql_type
+
+
+def copy_table(metadata, orm, attributes):
+    """Copy the ORM's table into `metadata`, with only the columns of the given
+    ORM attributes (with generic types, and without constraints other than
+    primary keys)
+
+    Returns:
+        table, names: The copied table, and the column name of each attribute
+    """
+    mapper = inspect(orm)
+    columns = [mapper.columns[attribute] for attribute in attributes]
+    table = Table(
+        mapper.local_table.name,
+        metadata,
+        *(
+            Column(
+                column.name, generic_type(column.type), primary_key=column.primary_key
+            )
+            for column in columns
+        ),
+    )
+    return table, dict(zip(attributes, (column.name for column in columns)))
+
+
+def make_texts(rng, n_texts, n_words=100, vocab_size=5_000, missing=0.0):
+    """Texts of Zipf-distributed words, of which a fraction `missing` are None"""
+    words = np.array([f"word{i}" for i in range(vocab_size)])
+    texts = [
+        " ".join(words[row]) for row in rng.zipf(1.3, (n_texts, n_words)) % vocab_size
+    ]
+    return [
+        None if drop else text
+        for text, drop in zip(texts, rng.random(n_texts) < missing)
+    ]
+
+
+def make_countries(rng, n, eu_fraction=0.7):
+    """ISO2 country codes, of which (roughly) `eu_fraction` are in the EU"""
+    is_eu = rng.random(n) < eu_fraction
+    return np.where(
+        is_eu, rng.choice(list(EU_COUNTRIES), n), rng.choice(NON_EU_COUNTRIES, n)
+    ).tolist()
+
+
+def make_lat_lon(rng, n):
+    """Random points in a box over mainland Europe"""
+    return rng.uniform(40, 55, n).round(6), rng.uniform(-5, 25, n).round(6)
+
+
+def make_links(rng, n_objects, n_targets, max_links):
+    """Link each object to between 1 and `max_links` (distinct) targets
+
+    Returns:
+        links (DataFrame): With columns `object` and `target` (positions)
+    """
+    n_links = rng.integers(1, max_links + 1, n_objects)
+    links = pd.DataFrame(
+        {
+            "object": np.repeat(np.arange(n_objects), n_links),
+            "target": rng.integers(0, n_targets, n_links.sum()),
+        }
+    )
+    return links.drop_duplicates()
+
+
+def make_arxiv_rows(rng, n_articles, n_institutes, max_links=3, seed=0):
+    objects = make_objects(n_articles, 1, seed=seed)
+    article_ids = [f"{2000 + id // 100_000}.{id % 100_000:05d}" for id in objects.id]
+    institute_ids = [f"grid.{i}" for i in range(n_institutes)]
+    latitude, longitude = make_lat_lon(rng, n_institutes)
+    no_geo = rng.random(n_institutes) < 0.05
+    links = make_links(rng, n_articles, n_institutes, max_links)
+    return {
+        "articles": {
+            "id": article_ids,
+            "abstract": make_texts(rng, n_articles, missing=0.02),
+            "title": [f"Article {id}" for id in article_ids],
+            "created": objects.created.dt.date.tolist(),
+        },
+        "institutes": {
+            "id": institute_ids,
+            "latitude": [None if drop else lat for lat, drop in zip(latitude, no_geo)],
+            "longitude": [
+                None if drop else lon for lon, drop in zip(longitude, no_geo)
+            ],
+            "country_code": make_countries(rng, n_institutes),
+        },
+        "links": {
+            "article_id": [article_ids[i] for i in links.object],
+            "institute_id": [institute_ids[i] for i in links.target],
+        },
+    }
+
+
+def make_nih_rows(rng, n_projects, seed=0):
+    objects = make_objects(n_projects, 1, seed=seed)
+    iso2 = make_countries(rng, n_projects, eu_fraction=0.1)
+    is_eu = [iso in EU_COUNTRIES for iso in iso2]
+    latitude, longitude = make_lat_lon(rng, n_projects)
+    no_geo = rng.random(n_projects) < 0.05
+    return {
+        "projects": {
+            "application_id": objects.id.tolist(),
+            "phr": make_texts(rng, n_projects, n_words=50, missing=0.1),
+            "abstract_text": make_texts(rng, n_projects, n_words=200, missing=0.1),
+            "project_title": [f"Project {id}" for id in objects.id],
+            "project_start": objects.created.dt.to_pydatetime().tolist(),
+            "total_cost": objects.funding.tolist(),
+            "coordinates": [
+                None if drop else {"lat": str(lat), "lon": str(lon)}
+                for lat, lon, drop in zip(latitude, longitude, no_geo)
+            ],
+            "is_eu": is_eu,
+            "iso2": iso2,
+        }
+    }
+
+
+def make_cordis_rows(rng, n_projects, n_organisations, max_links=5, seed=0):
+    objects = make_objects(n_projects, 1, seed=seed)
+    country_codes = make_countries(rng, n_organisations, eu_fraction=0.9)
+    missing = rng.random(n_organisations) < 0.02
+    links = make_links(rng, n_projects, n_organisations, max_links)
+    return {
+        "projects": {
+            "rcn": objects.id.tolist(),
+            "objective": make_texts(rng, n_projects, n_words=150),
+            "title": [f"Project {id}" for id in objects.id],
+            "start_date_code": objects.created.dt.date.tolist(),
+            "total_cost": objects.funding.tolist(),
+        },
+        "organisations": {
+            "id": list(range(n_organisations)),
+            "country_code": [
+                "" if drop else c for c, drop in zip(country_codes, missing)
+            ],
+        },
+        "links": {
+            "project_rcn": links.object.tolist(),
+            "organization_id": links.target.tolist(),
+        },
+    }
+
+
+def insert_rows(conn, table, names, rows, chunk_size=10_000):
+    """Insert columns of rows (keyed by ORM attribute) into the table, in chunks"""
+    columns = {names[attribute]: values for attribute, values in rows.items()}
+    records = [dict(zip(columns, row)) for row in zip(*columns.values())]
+    for start in range(0, len(records), chunk_size):
+        conn.execute(table.insert(), records[start : start + chunk_size])
+    return len(records)
+
+
+def build_fixture(
+    path,
+    n_articles=1_000,
+    n_nih=1_000,
+    n_cordis=1_000,
+    n_orgs=100,
+    seed=0,
+    chunk_size=10_000,
+):
+    """Create an SQLite database of the tables queried by the topic modules,
+    filled with synthetic data
+
+    Args:
+        path (path-like): Path of the SQLite file, which is overwritten.
+        n_articles (int): Number of arXiv articles (with one GRID institute
+                          for every ten articles).
+        n_nih (int): Number of NIH projects.
+        n_cordis (int): Number of CORDIS projects.
+        n_orgs (int): Number of CORDIS organisations.
+        seed (int): Random seed.
+        chunk_size (int): Number of rows to insert at once.
+    Returns:
+        url (str): The database URL, e.g. for `url` in `db.yaml` or for the
+                   INDICATORS_DB_URL environmental variable
+    """
+    rng = np.random.default_rng(seed)
+    rows = {
+        "arxiv": make_arxiv_rows(rng, n_articles, max(1, n_articles // 10), seed=seed),
+        "nih": make_nih_rows(rng, n_nih, seed=seed),
+        "cordis": make_cordis_rows(rng, n_cordis, n_orgs, seed=seed),
+    }
+    path = Path(path)
+    path.unlink(missing_ok=True)
+    url = f"sqlite:///{path}"
+    engine = create_engine(url)
+    metadata = MetaData()
+    tables = {
+        (dataset, name): copy_table(metadata, get_orm(orm), attributes)
+        for dataset, dataset_tables in TABLES.items()
+        for name, (orm, attributes) in dataset_tables.items()
+    }
+    metadata.create_all(engine)
+    with engine.begin() as conn:
+        for (dataset, name), (table, names) in tables.items():
+            n_rows = insert_rows(conn, table, names, rows[dataset][name], chunk_size)
+            logging.info(f"Inserted {n_rows} rows into {table.name}")
+    engine.dispose()
+    return url
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Build an SQLite fixture of the database")
+    parser.add_argument("path", help="Path of the SQLite file")
+    parser.add_argument("--scale", choices=SCALES, default="small")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    url = build_fixture(args.path, seed=args.seed, **SCALES[args.scale])
+    print(f"export INDICATORS_DB_URL={url}")
@@ -0,0 +1,235 @@
+"""
+synthetic
+=========
+
+Synthetic topic modules, following the topic modelling API described in
+`indicators/two/README.md` (`get_objects`, `get_lat_lon` or `get_nuts_to_id`,
+and `get_iso2_to_id`), along with a CorEx-shaped output directory, so that
+the indicator pipeline can be run without the production database.
+"""
+
+from functools import lru_cache
+from pathlib import Path
+from types import ModuleType
+
+import numpy as np
+import pandas as pd
+
+from indicators.core.config import EU_COUNTRIES
+from indicators.core.core_utils import project
+from indicators.core.label_utils import LABEL_STORE_DIR, write_label_store
+from indicators.core.nlp_utils import make_model_label
+from indicators.core.nuts_utils import iso_to_nuts
+
+COVID_TERMS = [
+    "covid_19",
+    "sars_cov_2",
+    "coronavirus",
+    "disease",
+    "patients",
+    "infection",
+    "clinical",
+    "pandemic",
+    "covid",
+    "cancer",
+]
+FROM_DATE = "2015-01-01"
+TO_DATE = "2021-07-01"
+BASE36 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+LOG_PROB_ON = np.log(0.99)
+LOG_PROB_OFF = np.log(1e-5)
+
+
+def make_nuts_codes(n_geos):
+    """Generate `n_geos` unique NUTS-3-like codes, distributed over EU countries,
+    along with the ISO2 code of each.
+
+    Returns:
+        codes (list of tuple): (iso2_code, nuts_3_code)
+    """
+    isos = [iso for iso in EU_COUNTRIES if iso_to_nuts(iso) is not None]
+    codes = []
+    for igeo in range(n_geos):
+        iso = isos[igeo % len(isos)]
+        idx = igeo // len(isos)
+        suffix = "".join(BASE36[(idx // 36**p) % 36] for p in (2, 1, 0))
+        codes.append((iso, f"{iso_to_nuts(iso)}{suffix}"))
+    return codes
+
+
+def make_nuts_info_lookup(nuts_codes):
+    """Mimic `get_nuts_info_lookup` for the synthetic NUTS codes (all levels)"""
+    lookup = {}
+    for code in nuts_codes:
+        for level in range(4):
+            _code = code[: 2 + level]
+            lookup[_code] = {
+                "nuts_name": f"Region {_code}",
+                "nuts_level": level,
+                "nuts_code": _code,
+            }
+    return lookup
+
+
+def make_objects(n_objects, n_geos, seed=0):
+    """Generate synthetic objects, and assign each to one geography
+
+    Returns:
+        objects (DataFrame): With columns `id`, `created`, `funding` and `geo`,
+                             where `geo` is the position in `make_nuts_codes`.
+    """
+    rng = np.random.default_rng(seed)
+    from_date, to_date = pd.to_datetime(FROM_DATE), pd.to_datetime(TO_DATE)
+    n_days = (to_date - from_date).days
+    created = from_date + pd.to_timedelta(rng.integers(0, n_days, n_objects), "D")
+    return pd.DataFrame(
+        {
+            "id": np.arange(n_objects),
+            "created": created,
+            "funding": rng.lognormal(mean=12, sigma=1, size=n_objects).round(2),
+            # Skew the number of objects per geography, as in the real data
+            "geo": rng.zipf(1.5, n_objects) % n_geos,
+        }
+    )
+
+
+def make_label_matrix(objects, n_topics, seed=0, topics_per_object=3):
+    """Generate a binary topic label matrix for the objects, in which the
+    first topic ("covid") only occurs after March 2020"""
+    rng = np.random.default_rng(seed)
+    n_objects = len(objects)
+    # Some topics are much more popular than others
+    popularity = rng.dirichlet(np.ones(n_topics))
+    labels = np.zeros((n_objects, n_topics), dtype=np.int8)
+    for _ in range(topics_per_object):
+        labels[np.arange(n_objects), rng.choice(n_topics, n_objects, p=popularity)] = 1
+    is_covid_era = (objects["created"] >= pd.to_datetime("2020-03-01")).values
+    labels[:, 0] = is_covid_era & (rng.random(n_objects) < 0.2)
+    return labels
+
+
+def write_corex_output(out_dir, labels, model_config, seed=0):
+    """Write the CorEx-shaped `topic-model-*` output directory, i.e. `topics.txt`,
+    `labels.txt`, `cont_labels.txt` and `most_deterministic_groups.txt`
+
+    Returns:
+        path (Path): The path to the topic model output directory
+    """
+    rng = np.random.default_rng(seed)
+    n_objects, n_topics = labels.shape
+    path = Path(out_dir) / make_model_label(**model_config)
+    path.mkdir(parents=True, exist_ok=True)
+    with open(path / "topics.txt", "w") as f:
+        for itopic in range(n_topics):
+            terms = (
+                COVID_TERMS if itopic == 0 else [f"term{itopic}_{i}" for i in range(10)]
+            )
+            if itopic % 17 == 16:  # Sprinkle in some antitopics
+                terms = [f"~{term}" for term in terms]
+            f.write(f"{itopic}:{','.join(terms)}\n")
+    row_label = np.arange(n_objects)[:, None]
+    np.savetxt(
+        path / "labels.txt", np.hstack([row_label, labels]), fmt="%d", delimiter=","
+    )
+    log_prob = np.where(labels == 1, LOG_PROB_ON, LOG_PROB_OFF)
+    np.savetxt(
+        path / "cont_labels.txt",
+        np.hstack([row_label, log_prob]),
+        fmt=["%d"] + ["%.10f"] * n_topics,
+        delimiter=",",
+    )
+    ntc = rng.normal(loc=0.01, scale=0.015, size=n_topics)
+    ntc[0] = 0.1  # i.e. the covid topic is never "fluffy"
+    with open(path / "most_deterministic_groups.txt", "w") as f:
+        f.write("Group num., NTC\n")
+        for itopic in np.argsort(-ntc):
+            f.write("%d, %0.3f\n" % (itopic, ntc[itopic]))
+    return path
+
+
+def make_topic_module(
+    out_dir, n_objects=1000, n_geos=50, n_topics=50, use_lat_lon=False, seed=0
+):
+    """Generate a synthetic topic module, and its CorEx output (and label store)
+    under `out_dir`, which can be passed anywhere that `arxiv_topics` (etc) can be
+    passed.
+
+    Args:
+        out_dir (path-like): Directory in which to write the CorEx output.
+        n_objects (int): Number of objects (articles or projects).
+        n_geos (int): Number of NUTS 3 geographies.
+        n_topics (int): Number of topics.
+        use_lat_lon (bool): Define `get_lat_lon`, which requires `NutsFinder`
+                            for the geographic lookup, rather than `get_nuts_to_id`.
+        seed (int): Random seed.
+    Returns:
+        topic_module (module): The synthetic topic module
+    """
+    rng = np.random.default_rng(seed)
+    objects = make_objects(n_objects, n_geos, seed=seed)
+    geo_codes = make_nuts_codes(n_geos)
+    model_config = {
+        "dataset_label": "synthetic",
+        "n_topics": n_topics,
+        "max_iter": 25,
+        "anchors": [COVID_TERMS],
+        "metadata": {"entity_type": "projects", "funding_currency": "€"},
+    }
+    labels = make_label_matrix(objects, n_topics, seed=seed)
+    path = write_corex_output(out_dir, labels, model_config, seed=seed)
+    write_label_store(
+        path / LABEL_STORE_DIR,
+        ids=objects.id,
+        created=objects.created,
+        probs=np.exp(np.where(labels == 1, LOG_PROB_ON, LOG_PROB_OFF)),
+    )
+
+    module = ModuleType(f"synthetic_topics_{n_objects}_{n_geos}_{n_topics}")
+    module.__file__ = str(Path(out_dir) / "synthetic_topics.py")
+    module.model_config = model_config
+    module.nuts_info_lookup = make_nuts_info_lookup(code for _, code in geo_codes)
+
+    @lru_cache()
+    def get_objects(from_date, fields=None):
+        if fields is not None:
+            return project(get_objects(from_date), fields)
+        return [
+            dict(
+                id=id,
+                text=f"text {id}",
+                title=f"title {id}",
+                created=created,
+                funding=funding,
+            )
+            for id, created, funding in zip(
+                objects.id, objects.created, objects.funding
+            )
+            if created >= pd.to_datetime(from_date)
+        ]
+
+    @lru_cache()
+    def get_iso2_to_id():
+        return [(id, geo_codes[geo][0]) for id, geo in zip(objects.id, objects.geo)]
+
+    @lru_cache()
+    def get_lat_lon():
+        # Random points in a box over mainland Europe
+        lat = rng.uniform(40, 55, n_objects)
+        lon = rng.uniform(-5, 25, n_objects)
+        return list(zip(objects.id, lat, lon))
+
+    def get_nuts_to_id():
+        # NUTS codes at all levels, as from NutsFinder
+        return [
+            (id, geo_codes[geo][1][: 2 + level])
+            for id, geo in zip(objects.id, objects.geo)
+            for level in range(4)
+        ]
+
+    module.get_objects = get_objects
+    module.get_iso2_to_id = get_iso2_to_id
+    if use_lat_lon:
+        module.get_lat_lon = get_lat_lon
+    else:
+        module.get_nuts_to_id = get_nuts_to_id
+    return module
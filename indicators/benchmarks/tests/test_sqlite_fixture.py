@@ -0,0 +1,97 @@
+from datetime import date
+from unittest import mock
+import os
+import pytest
+from sqlalchemy import create_engine, inspect
+
+from indicators.benchmarks.sqlite_fixture import TABLES, build_fixture, get_orm
+from indicators.core import db
+from indicators.two import arxiv_topics, nih_topics, cordis_topics
+
+FROM_DATE = "2015-01-01"
+QUERIES = {
+    arxiv_topics: ("get_data_version", "get_lat_lon", "get_iso2_to_id", "get_objects"),
+    nih_topics: (
+        "get_data_version",
+        "get_projects",
+        "get_lat_lon",
+        "get_iso2_to_id",
+        "get_objects",
+    ),
+    cordis_topics: ("get_data_version", "get_iso2_to_id", "get_objects"),
+}
+
+
+def clear_caches():
+    db.get_mysql_engine.cache_clear()
+    for module, names in QUERIES.items():
+        for name in names:
+            getattr(module, name).cache_clear()
+
+
+@pytest.fixture
+def fixture_url(tmp_path):
+    url = build_fixture(
+        tmp_path / "fixture.db", n_articles=200, n_nih=100, n_cordis=50, n_orgs=20
+    )
+    clear_caches()
+    with mock.patch.dict("os.environ", {"INDICATORS_DB_URL": url}):
+        yield url
+    clear_caches()  # i.e. don't leak the fixture's results into other tests
+
+
+def test_build_fixture(fixture_url):
+    inspector = inspect(create_engine(fixture_url))
+    for dataset_tables in TABLES.values():
+        for orm, attributes in dataset_tables.values():
+            mapper = inspect(get_orm(orm))
+            table_name = mapper.local_table.name
+            columns = {column["name"] for column in inspector.get_columns(table_name)}
+            # i.e. only the queried columns, by column name rather than attribute
+            assert columns == {mapper.columns[attr].name for attr in attributes}
+
+
+def test_topic_modules_against_fixture(fixture_url):
+    assert str(db.get_mysql_engine().url) == fixture_url
+    # arXiv
+    articles = arxiv_topics.get_objects(FROM_DATE)
+    columns = arxiv_topics.get_objects(FROM_DATE, fields=("id", "created"))
+    assert 0 < len(articles) <= 200
+    assert [article["id"] for article in articles] == list(columns["id"])
+    assert all(article["text"] is not None for article in articles)
+    assert len(arxiv_topics.get_lat_lon()) > 0
+    assert len(arxiv_topics.get_iso2_to_id()) >= 200
+    # NIH
+    projects = nih_topics.get_objects(FROM_DATE)
+    assert 0 < len(projects) <= 100
+    assert len(nih_topics.get_iso2_to_id()) == 100
+    assert all(isinstance(lat, float) for _, lat, _ in nih_topics.get_lat_lon())
+    # CORDIS
+    projects = cordis_topics.get_objects(FROM_DATE, fields=("id", "created", "funding"))
+    assert 0 < len(projects["id"]) <= 50
+    assert all(iso != "" for _, iso in cordis_topics.get_iso2_to_id())
+
+
+def test_disk_cache_against_fixture(fixture_url, tmp_path):
+    cache_dir = tmp_path / "cache"
+    with mock.patch.dict(os.environ, {"INDICATORS_CACHE_DIR": str(cache_dir)}):
+        articles = arxiv_topics.get_objects(FROM_DATE, fields=("id", "created"))
+        assert len(list(cache_dir.glob("arxiv/get_objects-*"))) == 1
+        # i.e. as in a new process, which reads the result from the disk cache
+        clear_caches()
+        with mock.patch("indicators.two.arxiv_topics.db_session") as mocked_session:
+            cached = arxiv_topics.get_objects(FROM_DATE, fields=("id", "created"))
+        mocked_session.assert_not_called()
+        assert (cached["id"] == articles["id"]).all()
+        # New data changes the data version, and so the result is refetched
+        engine = create_engine(fixture_url)
+        with engine.begin() as conn:
+            conn.execute(
+                arxiv_topics.Art.__table__.insert().values(
+                    id="9999.99999", abstract="new", created=date(2021, 6, 1)
+                )
+            )
+        clear_caches()
+        refetched = arxiv_topics.get_objects(FROM_DATE, fields=("id", "created"))
+        assert len(refetched["id"]) == len(articles["id"]) + 1
+        assert len(list(cache_dir.glob("arxiv/get_objects-*"))) == 2
@@ -0,0 +1,63 @@
+from indicators.benchmarks.synthetic import (
+    make_nuts_codes,
+    make_nuts_info_lookup,
+    make_objects,
+    make_label_matrix,
+    make_topic_module,
+    pd,
+)
+from indicators.benchmarks.bench_pipeline import measure
+from indicators.core.nlp_utils import get_corex_labels, parse_clean_topics
+
+
+def test_make_nuts_codes():
+    codes = make_nuts_codes(200)
+    assert len(set(code for _, code in codes)) == 200
+    assert all(len(code) == 5 for _, code in codes)
+    assert ("GB", "UK000") in codes
+
+
+def test_make_nuts_info_lookup():
+    lookup = make_nuts_info_lookup(["UK001"])
+    assert set(lookup) == {"UK", "UK0", "UK00", "UK001"}
+    assert lookup["UK00"]["nuts_level"] == 2
+
+
+def test_make_objects():
+    objects = make_objects(n_objects=100, n_geos=7)
+    assert len(objects) == 100
+    assert objects.id.is_unique
+    assert objects.geo.between(0, 6).all()
+    assert (objects.created >= pd.to_datetime("2015-01-01")).all()
+
+
+def test_make_label_matrix():
+    objects = make_objects(n_objects=100, n_geos=7)
+    labels = make_label_matrix(objects, n_topics=10)
+    assert labels.shape == (100, 10)
+    precovid = objects.created < pd.to_datetime("2020-03-01")
+    assert labels[precovid.values, 0].sum() == 0
+    assert labels[:, 1:].sum(axis=1).max() <= 3
+
+
+def test_make_topic_module(tmp_path):
+    module = make_topic_module(tmp_path, n_objects=100, n_geos=7, n_topics=20)
+    objects = module.get_objects(from_date="2015-01-01")
+    assert len(objects) == 100
+    assert set(objects[0]) == {"id", "text", "title", "created", "funding"}
+    assert len(module.get_iso2_to_id()) == 100
+    assert len(module.get_nuts_to_id()) == 400  # 4 NUTS levels per object
+    assert not hasattr(module, "get_lat_lon")
+
+    # The CorEx output can be read like any other topic module
+    labels = get_corex_labels(module)
+    assert labels.shape == (100, 20)
+    assert labels.columns[0] == "covid_19 sars_cov_2 coronavirus disease patients"
+    assert labels.columns[0] in parse_clean_topics(module).columns
+
+
+def test_measure():
+    stats, result = measure(lambda: list(range(1000)), repeat=2)
+    assert result == list(range(1000))
+    assert stats["wall_time"] > 0
+    assert stats["peak_memory"] > 0
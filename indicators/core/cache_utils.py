@@ -0,0 +1,384 @@
+"""
+cache_utils
+===========
+
+A persistent, cross-process cache of function results (e.g. of the topic
+modules' DB queries), such that a new process, test run or notebook needn't
+repeat the same slow queries:
+
+    @memory_cache()
+    @disk_cache("arxiv", version=get_data_version)
+    def get_objects(from_date, fields=None):
+        ...
+
+Each result is pickled and zlib-compressed to
+
+    {directory}/{namespace}/{function}-{key}.pkl.z
+
+where the key is a digest of the function's arguments and of the data version
+(e.g. the row count and max id of the queried tables), such that results are
+refetched once the data changes. Results also expire after `ttl` seconds, and
+can be invalidated explicitly with `invalidate` (or `func.cache_invalidate`).
+
+The cache is disabled unless `enabled` under `disk_cache` in `indicators.yaml`,
+or the environmental variable `INDICATORS_CACHE_DIR` is set (to the cache
+directory), in which case the data version isn't even probed.
+
+Large results are cached in memory with `memory_cache`, a drop-in replacement
+for `lru_cache()` (including `cache_info` and `cache_clear`), which registers
+each cached function with the `REGISTRY`. The estimated size of every result
+is counted against a global memory budget (`memory_cache` in `indicators.yaml`)
+and, once it is exceeded, the least recently used results of any function are
+released. Results can also be released explicitly, e.g. all of those of a
+topic module with `REGISTRY.clear(arxiv_topics)`.
+"""
+
+from collections import OrderedDict, namedtuple
+from collections.abc import Sequence, Set
+from functools import partial, wraps
+from itertools import islice
+from pathlib import Path
+from threading import RLock
+import json
+import logging
+import os
+import pickle
+import sys
+import time
+import zlib
+
+from indicators.core.config import INDICATORS
+from indicators.core.lazy_utils import CONFIGURED, LazyConfig
+from indicators.core.pipeline_utils import atomic_write, digest
+
+DISK_CACHE = LazyConfig(lambda: INDICATORS["disk_cache"])
+MEMORY_CACHE = LazyConfig(lambda: INDICATORS["memory_cache"])
+SUFFIX = ".pkl.z"
+MISSING = object()  # i.e. not cached, since None is a valid result
+SAMPLE_SIZE = 100  # items of large containers, from which to estimate their size
+CacheInfo = namedtuple(
+    "CacheInfo", ["hits", "misses", "maxsize", "currsize", "evictions", "nbytes"]
+)
+
+
+def cache_directory():
+    """The cache directory, or None if the cache is disabled"""
+    directory = os.environ.get("INDICATORS_CACHE_DIR")
+    if directory is None and DISK_CACHE["enabled"]:
+        directory = DISK_CACHE["directory"]
+    return None if directory is None else Path(directory).expanduser()
+
+
+def cache_key(args, kwargs, version):
+    """Digest of a function's arguments and the data version"""
+    spec = {"args": args, "kwargs": kwargs, "version": version}
+    return digest(json.dumps(spec, sort_keys=True, default=str).encode())[:16]
+
+
+def read_entry(path, ttl=None):
+    """The cached result at `path`, or MISSING if it is absent, expired or
+    unreadable (e.g. written by an incompatible version of a library)"""
+    try:
+        if ttl is not None and time.time() - path.stat().st_mtime > ttl:
+            return MISSING
+        return pickle.loads(zlib.decompress(path.read_bytes()))
+    except FileNotFoundError:
+        return MISSING
+    except Exception:
+        logging.warning(f"Ignoring unreadable cache entry {path}", exc_info=True)
+        return MISSING
+
+
+def write_entry(path, result, level=None):
+    level = DISK_CACHE["compression_level"] if level is None else level
+    path.parent.mkdir(parents=True, exist_ok=True)
+    data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+    atomic_write(path, zlib.compress(data, level))
+
+
+def disk_cache(namespace, version=None, ttl=CONFIGURED):
+    """Decorator which persists the results of a function to the disk cache
+    (see the module docstring). Apply it beneath `memory_cache` (or `lru_cache`),
+    such that the disk is only read once per process.
+
+    Args:
+        namespace (str): Namespace of the cached results, e.g. the dataset.
+        version (function, optional): Probe of the version of the data (e.g.
+                                      max id of the queried tables), which
+                                      forms part of the key of each result.
+        ttl (float, optional): Seconds after which results expire, or None to
+                               never expire. Defaults to the config.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            directory = cache_directory()
+            if directory is None:
+                return func(*args, **kwargs)
+            data_version = None if version is None else version()
+            key = cache_key(args, kwargs, data_version)
+            path = directory / namespace / f"{func.__name__}-{key}{SUFFIX}"
+            _ttl = DISK_CACHE["ttl"] if ttl is CONFIGURED else ttl
+            result = read_entry(path, _ttl)
+            if result is MISSING:
+                result = func(*args, **kwargs)
+                write_entry(path, result)
+            else:
+                logging.info(f"Read {namespace}.{func.__name__} from {path}")
+            return result
+
+        wrapper.cache_invalidate = partial(invalidate, namespace, func.__name__)
+        return wrapper
+
+    return decorator
+
+
+def invalidate(namespace=None, name=None):
+    """Delete the cached results of a function (by name) in a namespace, or of
+    all functions in a namespace, or else of everything
+
+    Returns:
+        n_deleted (int): Number of cached results deleted
+    """
+    directory = cache_directory()
+    if directory is None:
+        return 0
+    pattern = f"{namespace or '*'}/{name or '*'}-*{SUFFIX}"
+    n_deleted = 0
+    for path in directory.glob(pattern):
+        path.unlink(missing_ok=True)
+        n_deleted += 1
+    logging.info(f"Deleted {n_deleted} cached results from {directory}")
+    return n_deleted
+
+
+def sizeof(obj, _seen=None, _depth=0):
+    """Estimated size in bytes of an object, including its contents. The size
+    of large containers is extrapolated from a sample of their items, and
+    objects which are referenced more than once are only counted once.
+    """
+    seen = set() if _seen is None else _seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+    if hasattr(obj, "memory_usage"):  # i.e. pandas
+        usage = obj.memory_usage(deep=True)  # i.e. by column, if a DataFrame
+        return int(usage.sum() if hasattr(usage, "sum") else usage)
+    if hasattr(obj, "nbytes") and hasattr(obj, "dtype"):  # i.e. numpy
+        if obj.dtype.hasobject:
+            return sys.getsizeof(obj) + sample_size(obj.ravel(), seen, _depth)
+        return max(sys.getsizeof(obj), obj.nbytes)  # i.e. if a view, without its data
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float)) or _depth > 10:
+        return size
+    if isinstance(obj, dict):
+        return (
+            size
+            + sample_size(obj, seen, _depth)
+            + sample_size(obj.values(), seen, _depth)
+        )
+    if isinstance(obj, (Sequence, Set)):  # e.g. lists, or rows of a query
+        return size + sample_size(obj, seen, _depth)
+    if hasattr(obj, "__dict__"):
+        return size + sizeof(vars(obj), seen, _depth + 1)
+    return size
+
+
+def sample_size(items, seen, depth):
+    """Estimated total size of the items, from (up to) `SAMPLE_SIZE` of them"""
+    n_items = len(items)
+    if n_items <= SAMPLE_SIZE:
+        sample = items
+    elif isinstance(items, Sequence) or hasattr(items, "dtype"):
+        step = n_items // SAMPLE_SIZE
+        sample = (items[i] for i in range(0, step * SAMPLE_SIZE, step))
+    else:  # i.e. not indexable
+        sample = islice(items, SAMPLE_SIZE)
+    size = sum(sizeof(item, seen, depth + 1) for item in sample)
+    return size * max(n_items, SAMPLE_SIZE) // SAMPLE_SIZE if n_items else 0
+
+
+def make_key(args, kwargs):
+    """Hashable key of a function's arguments, as for `lru_cache`"""
+    return args + tuple(sorted(kwargs.items())) if kwargs else args
+
+
+class CacheRegistry:
+    """The in-memory caches of many functions, which share a memory budget.
+    Results are released in order of least recent use (over all caches) once
+    the budget is exceeded, except for the most recent result.
+
+    Args:
+        budget_mb (float, optional): Memory budget, or None for no limit. This
+                                     can also be a function returning the
+                                     budget (e.g. from the config), which is
+                                     only called once the budget is needed.
+    """
+
+    def __init__(self, budget_mb=None):
+        self._budget_mb = budget_mb
+        self.caches = []
+        self.entries = OrderedDict()  # {(cache, key): nbytes}, by least recent use
+        self.nbytes = 0
+        self.lock = RLock()
+
+    @property
+    def budget_mb(self):
+        if callable(self._budget_mb):
+            self._budget_mb = self._budget_mb()
+        return self._budget_mb
+
+    def register(self, cache):
+        with self.lock:
+            self.caches.append(cache)
+
+    def touch(self, cache, key):
+        self.entries.move_to_end((cache, key))
+
+    def add(self, cache, key, result, nbytes):
+        """Add a result to a cache, and then release results if over budget"""
+        with self.lock:
+            self.discard(cache, key)  # i.e. if computed concurrently
+            cache.results[key] = result
+            cache.nbytes += nbytes
+            self.entries[(cache, key)] = nbytes
+            self.nbytes += nbytes
+            self.enforce_budget()
+
+    def discard(self, cache, key):
+        with self.lock:
+            nbytes = self.entries.pop((cache, key), None)
+            if nbytes is None:
+                return False
+            del cache.results[key]
+            cache.nbytes -= nbytes
+            self.nbytes -= nbytes
+            return True
+
+    def set_budget(self, budget_mb):
+        with self.lock:
+            self._budget_mb = budget_mb
+            self.enforce_budget()
+
+    def enforce_budget(self):
+        if self.budget_mb is None:
+            return
+        budget = self.budget_mb * 1024**2
+        with self.lock:
+            while self.nbytes > budget and len(self.entries) > 1:
+                cache, key = next(iter(self.entries))
+                self.discard(cache, key)
+                cache.evictions += 1
+                logging.info(f"Released a result of {cache.name} from the cache")
+
+    def clear(self, module=None):
+        """Release every cached result or, if a module is given, only those of
+        the module's functions, or of any function called with the module
+        (e.g. `get_geo_lookup(arxiv_topics)`)
+
+        Returns:
+            n_released (int): Number of results released
+        """
+        with self.lock:
+            released = [
+                (cache, key)
+                for cache, key in self.entries
+                if module is None
+                or cache.module == module.__name__
+                or any(arg is module for arg in key)
+            ]
+            for cache, key in released:
+                self.discard(cache, key)
+        return len(released)
+
+    def stats(self):
+        """Hits, misses, evictions, size and memory of every cache, by name"""
+        with self.lock:
+            caches = {
+                cache.name: {
+                    "hits": cache.hits,
+                    "misses": cache.misses,
+                    "evictions": cache.evictions,
+                    "size": len(cache.results),
+                    "mb": cache.nbytes / 1024**2,
+                }
+                for cache in self.caches
+            }
+            return {
+                "mb": self.nbytes / 1024**2,
+                "budget_mb": self.budget_mb,
+                "caches": caches,
+            }
+
+
+REGISTRY = CacheRegistry(lambda: MEMORY_CACHE["budget_mb"])
+
+
+class MemoryCache:
+    """The in-memory cache of a function's results, in a `CacheRegistry`"""
+
+    def __init__(self, func, registry, sizeof=sizeof):
+        self.func = func
+        self.registry = registry
+        self.sizeof = sizeof
+        self.module = func.__module__
+        self.name = f"{func.__module__}.{func.__qualname__}"
+        self.results = {}
+        self.hits = self.misses = self.evictions = self.nbytes = 0
+        registry.register(self)
+
+    def __call__(self, *args, **kwargs):
+        key = make_key(args, kwargs)
+        with self.registry.lock:
+            result = self.results.get(key, MISSING)
+            if result is not MISSING:
+                self.hits += 1
+                self.registry.touch(self, key)
+                return result
+            self.misses += 1
+        # Not under the lock, such that other results can be computed concurrently
+        result = self.func(*args, **kwargs)
+        self.registry.add(self, key, result, self.sizeof(result))
+        return result
+
+    def cache_info(self):
+        with self.registry.lock:
+            return CacheInfo(
+                self.hits,
+                self.misses,
+                None,
+                len(self.results),
+                self.evictions,
+                self.nbytes,
+            )
+
+    def cache_clear(self):
+        with self.registry.lock:
+            for key in list(self.results):
+                self.registry.discard(self, key)
+            self.hits = self.misses = self.evictions = 0
+
+
+def memory_cache(registry=None, sizeof=sizeof):
+    """Decorator which caches a function's results in memory, as `lru_cache()`,
+    but within the (shared) memory budget of a `CacheRegistry`
+
+    Args:
+        registry (CacheRegistry, optional): Defaults to the global `REGISTRY`.
+        sizeof (function): Estimates the size in bytes of each result.
+    """
+
+    def decorator(func):
+        cache = MemoryCache(func, registry or REGISTRY, sizeof)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache(*args, **kwargs)
+
+        wrapper.cache = cache
+        wrapper.cache_info = cache.cache_info
+        wrapper.cache_clear = cache.cache_clear
+        return wrapper
+
+    return decorator
@@ -2,7 +2,19 @@ from pathlib import Path
 import os
 import yaml
 
+from indicators.core.lazy_utils import LazyConfig
+
 PATH_TO_HERE = Path(__file__).resolve().parent
+# Config constants, which are lazily loaded from YAML on first access
+YAML_CONSTANTS = {
+    "NUTS_EDGE_CASES": "nuts_edge_cases",
+    "EU_COUNTRIES": "eu_countries",
+    "ARXIV_CONFIG": "arxiv",
+    "NIH_CONFIG": "nih",
+    "CORDIS_CONFIG": "cordis",
+    "INDICATORS": "indicators",
+    "DB_CONFIG": "db",
+}
 
 
 def load_yaml(filename):
@@ -10,12 +22,24 @@ def load_yaml(filename):
         return yaml.safe_load(f)
 
 
+def __getattr__(name):
+    """Config constants, which are cached at module level as stand-ins that
+    only load the YAML on first use (see `LazyConfig`), such that importing
+    a constant (e.g. `from indicators.core.config import INDICATORS`) doesn't
+    parse its YAML"""
+    try:
+        filename = YAML_CONSTANTS[name]
+    except KeyError:
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    value = globals()[name] = LazyConfig(lambda: load_yaml(filename))
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(YAML_CONSTANTS))
+
+
 MYSQLDB_PATH = str(PATH_TO_HERE / "mysqldb.config")
-NUTS_EDGE_CASES = load_yaml("nuts_edge_cases")
-EU_COUNTRIES = load_yaml("eu_countries")
-ARXIV_CONFIG = load_yaml("arxiv")
-NIH_CONFIG = load_yaml("nih")
-CORDIS_CONFIG = load_yaml("cordis")
-INDICATORS = load_yaml("indicators")
+NUTS_INFO_PATH = PATH_TO_HERE / "nuts_info.csv"  # built by nuts_utils
 
 os.environ["MYSQLDB"] = MYSQLDB_PATH  # for nesta.get_mysql_engine
@@ -1,33 +1,138 @@
-from indicators.core.config import INDICATORS
+from indicators.core.config import INDICATORS, DB_CONFIG
 from indicators.core.nuts_utils import get_geo_lookup
-import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from indicators.core.lazy_utils import LazyModule
+import logging
 
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
 
-def object_getter(topic_module, geo_split=False):
+# The only object fields required for generating indicators (excl. weights)
+INDICATOR_FIELDS = ("id", "created")
+# Types of fields returned as arrays, otherwise inferred by numpy
+FIELD_DTYPES = {"created": "datetime64[ns]", "funding": float}
+
+
+def to_columns(rows, fields):
+    """Transpose rows (e.g. from a DB query) into a typed array per field
+
+    Args:
+        rows (iterable): Rows of values, in the order of `fields`.
+        fields (tuple): Field names.
+    Returns:
+        columns (dict): Of the form {field: array}
+    """
+    rows = list(rows)
+    columns = zip(*rows) if rows else [()] * len(fields)
+    return {
+        field: np.array(values, dtype=FIELD_DTYPES.get(field))
+        for field, values in zip(fields, columns)
+    }
+
+
+def project(objects, fields):
+    """Select `fields` from a list of object dicts, as `to_columns`"""
+    return to_columns((tuple(obj[f] for f in fields) for obj in objects), fields)
+
+
+def count_objects(objects):
+    """Number of objects, whether a list of objects or a dict of columns"""
+    if isinstance(objects, dict):
+        return len(next(iter(objects.values()), ()))
+    return len(objects)
+
+
+def make_id_index(object_ids):
+    """Index for interning object ids as their (int32) positions in `object_ids`
+
+    Returns:
+        id_index (tuple): The sorted ids, and the position of each sorted id
+    """
+    object_ids = np.asarray(object_ids)
+    order = np.argsort(object_ids, kind="stable").astype(np.int32)
+    return object_ids[order], order
+
+
+def to_positions(id_index, ids):
+    """Convert ids to their sorted positions, according to `make_id_index`.
+    Ids which are not in the index (e.g. objects before the start date) are dropped.
+
+    Args:
+        id_index (tuple): Output of `make_id_index`
+        ids (array-like): Object ids.
+    Returns:
+        positions (np.array): Sorted int32 positions
+    """
+    sorted_ids, order = id_index
+    ids = np.asarray(ids)
+    if len(sorted_ids) == 0 or len(ids) == 0:
+        return np.array([], dtype=np.int32)
+    idx = np.searchsorted(sorted_ids, ids).clip(max=len(sorted_ids) - 1)
+    found = sorted_ids[idx] == ids
+    return np.sort(order[idx[found]])
+
+
+def object_getter(topic_module, geo_split=False, geo_lookup=None):
     """Get all object from a given start date. `geo_split`
     alters the behaviour of the function, such that `geo_split=False`
     will yield an article, whereas `geo_split=False` yields
-    a tuple of (indexer, geo_code) where indexer can be used to slice
-    `articles`
+    a tuple of (positions, geo_code) where positions are int32 row
+    positions which can be used to slice `articles` (with `iloc`).
+    In the latter case, only the `INDICATOR_FIELDS` are fetched.
 
     Args:
         from_date (str, optional): Min object creation date. Defaults to "2015-01-0\
 1".
         geo_split (bool, optional): Alter the behaviour to return an indexer
                                     by geography code. Defaults to False.
+        geo_lookup (dict, optional): Only yield these geographies (of the form
+                                     given by `get_geo_lookup`), e.g. a shard.
+                                     Defaults to all geographies of the module.
 
     Yields:
         objects (list(dict))
     """
     from_date = INDICATORS["precovid_dates"]["from_date"]
-    objects = topic_module.get_objects(from_date=from_date)
     if geo_split:
-        nuts_to_id_lookup = get_geo_lookup(topic_module)
+        objects = topic_module.get_objects(from_date=from_date, fields=INDICATOR_FIELDS)
+        id_index = make_id_index(objects["id"])  # i.e. intern ids once per module
+        nuts_to_id_lookup = geo_lookup
+        if nuts_to_id_lookup is None:
+            nuts_to_id_lookup = get_geo_lookup(topic_module)
         for geo_code, ids in nuts_to_id_lookup.items():
-            indexes = list(obj["id"] in ids for obj in objects)
-            yield indexes, geo_code
+            yield to_positions(id_index, ids), geo_code
     else:
-        yield objects
+        yield topic_module.get_objects(from_date=from_date)
+
+
+def prefetch(*topic_modules, max_workers=None):
+    """Run the independent DB queries of each topic module concurrently on a
+    thread pool, so that the slow fetch phase overlaps rather than adding up.
+    Objects are fetched with the `INDICATOR_FIELDS` projection, as for indicators.
+    The queries are all cached, so results are simply retrieved from the cache
+    when they are subsequently called.
+
+    Args:
+        topic_modules (module): Topic modules, e.g. arxiv_topics, which specify
+                                their independent DB queries in `prefetch_queries`
+        max_workers (int, optional): Number of threads, otherwise as specified by
+                                     `prefetch_workers` in the `db.yaml` config.
+    """
+    from_date = INDICATORS["precovid_dates"]["from_date"]
+    queries = []
+    for module in topic_modules:
+        queries.append(
+            partial(module.get_objects, from_date=from_date, fields=INDICATOR_FIELDS)
+        )
+        queries += module.prefetch_queries
+    max_workers = max_workers or DB_CONFIG["prefetch_workers"]
+    logging.info(f"Prefetching {len(queries)} queries over {max_workers} threads")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(query) for query in queries]
+        # Raise any exceptions now, rather than later
+        for future in futures:
+            future.result()
 
 
 def flatten(nested_dict):
@@ -0,0 +1,180 @@
+"""
+corex_utils
+===========
+
+Extensions of the CorEx topic model. These are kept apart from `nlp_utils`
+so that `corextopic` is only imported when a model is actually trained, and
+so that trained models can be pickled (and unpickled) by reference to this
+module.
+"""
+
+import time
+
+import numpy as np
+from corextopic import corextopic as ct
+from scipy.sparse import csr_matrix
+
+# Fitted parameters which are sufficient for labelling documents with a model
+PARAMETERS = ("words", "alpha", "theta", "log_p_y", "lp0", "px_frac")
+INITIAL_SOFTNESS = 20  # CorEx's initial softness of alpha, `Corex.t`
+
+
+def save_parameters(topic_model, path):
+    """Persist the fitted parameters of a topic model, for warm-starting refits"""
+    np.savez_compressed(
+        path,
+        n_hidden=topic_model.n_hidden,
+        t=np.broadcast_to(topic_model.t, topic_model.alpha.shape[1:]),
+        **{name: np.asarray(getattr(topic_model, name)) for name in PARAMETERS},
+    )
+
+
+def load_parameters(path):
+    """Load parameters saved with `save_parameters`"""
+    with np.load(path, allow_pickle=False) as parameters:
+        return {name: parameters[name] for name in parameters.files}
+
+
+def align_vocabulary(parameters, words):
+    """Position of each of `words` in the vocabulary of the parameters, or -1
+    for words which are new"""
+    index = {word: i for i, word in enumerate(parameters["words"].tolist())}
+    return np.array([index.get(word, -1) for word in words], dtype=int)
+
+
+def make_model(parameters):
+    """A CorEx model from saved parameters, which can label documents
+    (over the same vocabulary) with `transform`"""
+    topic_model = ct.Corex(n_hidden=int(parameters["n_hidden"]))
+    for name in PARAMETERS:
+        setattr(topic_model, name, parameters[name])
+    topic_model.words = parameters["words"].tolist()
+    topic_model.n_visible = len(topic_model.words)
+    return topic_model
+
+
+class MonitoredCorex(ct.Corex):
+    """CorEx topic model which records the total correlation and wall time of each
+    iteration, and which optionally stops early once training has plateaued.
+
+    Args:
+        tol (float, optional): Stop once the absolute change in total correlation
+                               over an iteration, relative to the previous total
+                               correlation, falls below this.
+                               If None, only CorEx's own convergence check is used.
+        warm_start (dict, optional): Parameters of a previous model (from
+                                     `load_parameters`) from which to initialise
+                                     the fit, over an aligned vocabulary.
+        kwargs: Arguments for `corextopic.Corex`, e.g. `max_iter` and `n_hidden`.
+    """
+
+    def __init__(self, tol=None, warm_start=None, **kwargs):
+        super().__init__(**kwargs)
+        self.tol = tol
+        self.warm_start = warm_start
+        self.iteration_times = []
+
+    def fit_transform(
+        self, X, y=None, anchors=None, anchor_strength=1, words=None, docs=None
+    ):
+        self.iteration_times = []
+        self._tick = time.perf_counter()
+        if self.warm_start is None:
+            return super().fit_transform(
+                X,
+                anchors=anchors,
+                anchor_strength=anchor_strength,
+                words=words,
+                docs=docs,
+            )
+        return self.warm_fit_transform(X, anchors, anchor_strength, words, docs)
+
+    def initialize_parameters(self, X, words, docs):
+        super().initialize_parameters(X, words, docs)
+        if self.warm_start is not None:
+            # Inherit the previous weights (and their softness) of words which
+            # are in both vocabularies
+            old_index = align_vocabulary(self.warm_start, words)
+            shared = old_index >= 0
+            self.alpha[:, shared] = self.warm_start["alpha"][:, old_index[shared]]
+            self.t = np.full(len(words), INITIAL_SOFTNESS, dtype=float)
+            self.t[shared] = self.warm_start["t"][old_index[shared]]
+
+    def initial_labels(self, X, words):
+        """Label the documents with the previous model, by mapping the columns of
+        X onto the previous vocabulary (ignoring words which are new)"""
+        old_index = align_vocabulary(self.warm_start, words)
+        shared = np.flatnonzero(old_index >= 0)
+        mapping = csr_matrix(
+            (np.ones(len(shared)), (shared, old_index[shared])),
+            shape=(len(words), len(self.warm_start["words"])),
+        )
+        p_y_given_x, _ = make_model(self.warm_start).transform(X @ mapping, True)
+        return p_y_given_x
+
+    def warm_fit_transform(self, X, anchors, anchor_strength, words, docs):
+        """As `Corex.fit_transform`, except that the latent factors are initialised
+        by labelling the documents with the previous model, and that the topics
+        are never re-sorted, so that they keep their identities between fits"""
+        if words is None:
+            raise ValueError("Words are required to align the vocabulary")
+        if int(self.warm_start["n_hidden"]) != self.n_hidden:
+            raise ValueError("The previous model has a different number of topics")
+        X = self.preprocess(X)
+        self.initialize_parameters(X, words, docs)
+        if anchors is not None:
+            anchors = self.preprocess_anchors(list(anchors))
+        p_y_given_x = self.initial_labels(X, words)
+        for nloop in range(self.max_iter):
+            if nloop > 1:
+                for j in range(self.n_hidden):
+                    if self.sign[j, np.argmax(self.mis[j])] < 0:
+                        # Switch label for Y_j so that it is correlated with the top word
+                        p_y_given_x[:, j] = 1.0 - p_y_given_x[:, j]
+            self.log_p_y = self.calculate_p_y(p_y_given_x)
+            self.theta = self.calculate_theta(X, p_y_given_x, self.log_p_y)
+            if nloop > 0:  # Structure learning step
+                self.alpha = self.calculate_alpha(
+                    X, p_y_given_x, self.theta, self.log_p_y, self.tcs
+                )
+            if anchors is not None:
+                for a in ct.flatten(anchors):
+                    self.alpha[:, a] = 0
+                for ia, a in enumerate(anchors):
+                    self.alpha[ia, a] = anchor_strength
+            p_y_given_x, _, log_z = self.calculate_latent(X, self.theta)
+            self.update_tc(log_z)
+            self.print_verbose()
+            if self.convergence():
+                break
+        self.p_y_given_x, self.log_p_y_given_x, self.log_z = self.calculate_latent(
+            X, self.theta
+        )
+        self.mis = self.calculate_mis(self.theta, self.log_p_y)
+        return self.labels
+
+    def update_tc(self, log_z):
+        """Called once per iteration, after which convergence is checked"""
+        super().update_tc(log_z)
+        now = time.perf_counter()
+        self.iteration_times.append(now - self._tick)
+        self._tick = now
+
+    def convergence(self):
+        if super().convergence():
+            return True
+        # Skip the first iterations, before the structure has been learned
+        if self.tol is None or len(self.tc_history) < 3:
+            return False
+        previous, current = self.tc_history[-2:]
+        return abs(current - previous) < self.tol * abs(previous)
+
+    @property
+    def convergence_trace(self):
+        """Rows of (iteration, total correlation, wall time in seconds)"""
+        return [
+            (iteration, tc, seconds)
+            for iteration, (tc, seconds) in enumerate(
+                zip(self.tc_history, self.iteration_times)
+            )
+        ]
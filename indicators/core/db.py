@@ -1,13 +1,60 @@
 import os
-from indicators.core.config import MYSQLDB_PATH
+from functools import lru_cache
+from indicators.core.config import MYSQLDB_PATH, DB_CONFIG
 from nesta.core.orms.orm_utils import get_mysql_engine as _get_mysql_engine
+from nesta.core.orms.orm_utils import db_session
+from sqlalchemy import create_engine, func
 
 os.environ["MYSQLDB"] = MYSQLDB_PATH
 
 
+def make_pooled_engine(url, connect_args={}, **pool_kwargs):
+    """
+    Create an engine with an explicitly sized connection pool, as specified
+    in the `db.yaml` config, which can be overridden with `pool_kwargs`.
+    """
+    pool_kwargs = {**DB_CONFIG["pool"], **pool_kwargs}
+    return create_engine(url, connect_args=connect_args, **pool_kwargs)
+
+
+def get_db_url():
+    """
+    The URL of a database to use instead of the production database, from
+    the INDICATORS_DB_URL environmental variable or else `url` in `db.yaml`,
+    or None if not set.
+    """
+    return os.environ.get("INDICATORS_DB_URL") or DB_CONFIG["url"]
+
+
+@lru_cache()
 def get_mysql_engine():
     """
     Automatically retrieve credentials via config for
-    generating the MySQL engine via nesta.core.orms.orm_utils
+    generating the MySQL engine via nesta.core.orms.orm_utils,
+    and then return a single pooled engine for the whole process.
+    If a database URL is configured (see `get_db_url`), e.g. for an SQLite
+    fixture, then the engine connects to that database instead.
+    """
+    url = get_db_url()
+    if url is not None:
+        is_sqlite = url.startswith("sqlite")
+        connect_args = DB_CONFIG["sqlite_connect_args" if is_sqlite else "connect_args"]
+        return make_pooled_engine(url, connect_args=connect_args)
+    engine = _get_mysql_engine("MYSQLDB", "mysqldb", "production")
+    engine.dispose()  # Only used to retrieve the URL from the credentials
+    return make_pooled_engine(engine.url, connect_args=DB_CONFIG["connect_args"])
+
+
+def data_version(*columns):
+    """
+    A cheap probe of whether the data has changed (e.g. for keying cached
+    query results), i.e. the number of (non-null) values and the maximum value
+    of each column, such as the id or creation date of each queried table.
     """
-    return _get_mysql_engine("MYSQLDB", "mysqldb", "production")
+    with db_session(get_mysql_engine()) as session:
+        return tuple(
+            tuple(
+                str(value) for value in session.query(func.count(c), func.max(c)).one()
+            )
+            for c in columns
+        )
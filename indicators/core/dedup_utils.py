@@ -0,0 +1,143 @@
+"""
+dedup_utils
+===========
+
+Clustering of near-duplicate documents (e.g. NIH resubmissions, or variants of
+the same CORDIS project) with MinHash and locality-sensitive hashing, such that
+only one representative of each cluster need be fitted by the topic model.
+
+Documents are represented by the set of their (hashed) word shingles, and are
+considered near-duplicates if the Jaccard similarity of these sets, as
+estimated from their MinHash signatures, is at least the threshold.
+Candidate pairs are only compared if they share an LSH bucket.
+"""
+
+from zlib import crc32
+import logging
+
+import numpy as np
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+MAX_HASH = np.uint64(2**32 - 1)
+SHINGLE_PRIME = np.uint64(1_000_003)  # for combining the word hashes of a shingle
+
+
+def shingle(text, size=3):
+    """Hashes of the distinct word n-grams of the text (or of the whole text,
+    if it has fewer than `size` words), combined from the hash of each word"""
+    words = text.lower().split()
+    hashes = np.fromiter((crc32(w.encode()) for w in words), np.uint64, len(words))
+    size = max(1, min(size, len(words)))
+    n_shingles = len(words) - size + 1
+    shingles = hashes[:n_shingles].copy()
+    with np.errstate(over="ignore"):
+        for i in range(1, size):
+            shingles = shingles * SHINGLE_PRIME + hashes[i : i + n_shingles]
+    return np.unique(shingles)
+
+
+def make_hash_functions(num_perm, seed=0):
+    """Coefficients of `num_perm` random multiply-shift hash functions"""
+    rng = np.random.default_rng(seed)
+    a = rng.integers(1, 2**63, size=num_perm, dtype=np.uint64) * 2 + 1  # odd
+    b = rng.integers(0, 2**63, size=num_perm, dtype=np.uint64)
+    return a, b
+
+
+def minhash_signatures(texts, num_perm=128, shingle_size=3, seed=0, chunk_size=1000):
+    """MinHash signature of each text, i.e. the minimum of each of `num_perm`
+    hash functions over the text's shingles
+
+    Returns:
+        signatures (np.array): Of shape (n_texts, num_perm)
+    """
+    a, b = make_hash_functions(num_perm, seed)
+    signatures = np.full((len(texts), num_perm), MAX_HASH, dtype=np.uint32)
+    for start in range(0, len(texts), chunk_size):
+        shingles = [
+            shingle(text, shingle_size) for text in texts[start : start + chunk_size]
+        ]
+        lengths = np.array([len(s) for s in shingles])
+        if not lengths.any():
+            continue
+        # Hash the shingles of the whole chunk at once (with overflow, by design)
+        with np.errstate(over="ignore"):
+            hashes = (a[:, None] * np.concatenate(shingles) + b[:, None]) >> np.uint64(
+                32
+            )
+        offsets = np.cumsum(lengths) - lengths
+        nonempty = lengths > 0
+        # Reduce along the contiguous axis, i.e. over each text's shingles
+        signatures[start + np.flatnonzero(nonempty)] = np.minimum.reduceat(
+            hashes.astype(np.uint32), offsets[nonempty], axis=1
+        ).T
+    return signatures
+
+
+def lsh_bands(threshold, num_perm):
+    """Number of bands and rows per band, such that the probability of a pair
+    sharing a bucket rises steeply at the Jaccard similarity `threshold`, by
+    minimising the sum of the false positive and false negative rates"""
+    similarity = np.linspace(0, 1, 201)
+    best, best_error = None, np.inf
+    for bands in range(1, num_perm + 1):
+        rows = num_perm // bands
+        p_candidate = 1 - (1 - similarity**rows) ** bands
+        below = similarity < threshold
+        error = p_candidate[below].mean() + (1 - p_candidate[~below]).mean()
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+def find_near_duplicates(
+    texts, threshold=0.9, num_perm=128, shingle_size=3, seed=0, chunk_size=1000
+):
+    """Cluster near-duplicate texts, with the first text in each cluster
+    being its representative.
+
+    Args:
+        texts (list of str): The texts to cluster.
+        threshold (float): Minimum (estimated) Jaccard similarity of near-duplicates.
+        num_perm (int): Number of MinHash permutations.
+        shingle_size (int): Number of words in each shingle.
+        seed (int): Random seed of the hash functions.
+        chunk_size (int): Number of texts to hash at once.
+    Returns:
+        representatives, duplicate_of: The sorted positions of the representative
+                                        texts, and the index into `representatives`
+                                        of each text's representative (as for
+                                        `np.unique`'s `return_index` and
+                                        `return_inverse` respectively)
+    """
+    n_texts = len(texts)
+    signatures = minhash_signatures(texts, num_perm, shingle_size, seed, chunk_size)
+    bands, rows = lsh_bands(threshold, num_perm)
+    edges = []
+    for band in range(bands):
+        keys = np.ascontiguousarray(signatures[:, band * rows : (band + 1) * rows])
+        keys = keys.view(np.dtype((np.void, keys.itemsize * rows))).ravel()
+        _, first, bucket = np.unique(keys, return_index=True, return_inverse=True)
+        # Compare each text to the first text in its bucket
+        leader = first[bucket]
+        candidates = np.flatnonzero(leader != np.arange(n_texts))
+        similarity = (signatures[candidates] == signatures[leader[candidates]]).mean(1)
+        matched = similarity >= threshold
+        edges.append((candidates[matched], leader[candidates][matched]))
+    sources, targets = (np.concatenate(nodes) for nodes in zip(*edges))
+    graph = coo_matrix(
+        (np.ones(len(sources)), (sources, targets)), shape=(n_texts, n_texts)
+    )
+    _, component = connected_components(graph, directed=False)
+    # Renumber the clusters in order of their representative (first) text
+    _, first, cluster = np.unique(component, return_index=True, return_inverse=True)
+    order = np.argsort(first)
+    rank = np.empty_like(order)
+    rank[order] = np.arange(len(order))
+    representatives, duplicate_of = first[order], rank[cluster]
+    logging.info(
+        f"Found {n_texts - len(representatives)} near-duplicates "
+        f"among {n_texts} texts"
+    )
+    return representatives, duplicate_of
@@ -1,15 +1,36 @@
-from nesta.packages.geo_utils.country_iso_code import country_iso_code_to_name
-
 from indicators.core.config import INDICATORS
 from indicators.core.core_utils import flatten
+from indicators.core.lazy_utils import LazyModule
 from indicators.core.nuts_utils import get_nuts_info_lookup
+from indicators.core.profiling_utils import span, timed
 
-import boto3
-import pandas as pd
 from collections import defaultdict
 from pathlib import Path
 import logging
 
+boto3 = LazyModule("boto3")
+pd = LazyModule("pandas")
+country_iso_code = LazyModule("nesta.packages.geo_utils.country_iso_code")
+
+# Indicators named e.g. "relative_activity_lower" are error estimates (confidence
+# intervals, or standard errors of preview estimates), which are output as
+# columns of the "relative_activity" rows
+ERROR_COLUMNS = {
+    "_lower": "indicator_lower",
+    "_upper": "indicator_upper",
+    "_se": "indicator_se",
+}
+
+
+def split_error_name(indicator_name):
+    """Split e.g. "relative_activity_lower" into the name of the indicator and
+    the name of its error column, or return (indicator_name, None) if the
+    indicator isn't an error estimate"""
+    for suffix, column in ERROR_COLUMNS.items():
+        if indicator_name.endswith(suffix):
+            return indicator_name[: -len(suffix)], column
+    return indicator_name, None
+
 
 def make_indicator_description(indicator_name, entity_type):
     """
@@ -31,6 +52,17 @@ def make_indicator_description(indicator_name, entity_type):
     return unformatted_name.format(entity_type)
 
 
+def make_filename(ctry_code):
+    """
+    The standard filename of the indicators of this country code, which
+    could be ISO (prefixed with "iso_") or NUTS, i.e. one file per topic
+    for the countries, and for each level of NUTS region.
+    """
+    if ctry_code.startswith("iso_"):
+        return "by-country.csv"
+    return f"nuts-{len(ctry_code) - 1}.csv"
+
+
 def make_ctry_metadata(ctry_code):
     """
     Prepare metadata for this country code, including the standard
@@ -38,7 +70,7 @@ def make_ctry_metadata(ctry_code):
     "iso_") or NUTS.
     """
     nuts_lookup = get_nuts_info_lookup()  # NB: lru_cached
-    nuts_level = len(ctry_code) - 1
+    filename = make_filename(ctry_code)
     is_iso_code = ctry_code.startswith("iso_")  # i.e. is not NUTS code
     # Strip "iso_" if ISO, else use the bare NUTS code
     ctry_code = ctry_code[4:] if is_iso_code else ctry_code
@@ -49,16 +81,17 @@ def make_ctry_metadata(ctry_code):
         "nuts_level": 0 if is_iso_code else len(ctry_code) - 1,
         # Get the name for this code
         "nuts_name": (
-            country_iso_code_to_name(ctry_code, iso2=True)  # not iso3
+            country_iso_code.country_iso_code_to_name(ctry_code, iso2=True)  # not iso3
             if is_iso_code
             else nuts_lookup[ctry_code]["nuts_name"]
         ),
         # Define a standard file name depending on whether ISO or not
-        "filename": "by-country.csv" if is_iso_code else f"nuts-{nuts_level}.csv",
+        "filename": filename,
     }
     return ctry_metadata
 
 
+@timed("flatten")
 def prepare_file_data(indicators):
     """
     Flatten indicator data from the form [dataset][country][indicator][topic] and enrich with country-level metadata (i.e. code, level, name).
@@ -68,6 +101,8 @@ def prepare_file_data(indicators):
     """
     # Mapping of filepaths pointing to a list of curated data
     all_file_data = defaultdict(list)
+    # Each row by indicator, for adding its confidence interval (if any)
+    rows = {}
     # Flatten fields from the form [dataset][entity][country][indicator][topic][value]
     for (
         dataset_name,
@@ -77,6 +112,13 @@ def prepare_file_data(indicators):
         topic_name,
         indicator_value,
     ) in flatten(indicators):
+        indicator_name, error_column = split_error_name(indicator_name)
+        key = (dataset_name, entity_type, country_code, indicator_name, topic_name)
+        # Add error estimates to the row of their indicator, if it exists
+        if error_column is not None:
+            if key in rows:
+                rows[key][error_column] = indicator_value
+            continue
         # Ignore null rows
         if pd.isnull(indicator_value) or indicator_value == 0:
             continue
@@ -87,14 +129,13 @@ def prepare_file_data(indicators):
         filepath = f"{dataset_name}/{topic_name}/{filename}"
         # Add this row to the output
         file_data = all_file_data[filepath]  # create if does not exist
-        file_data.append(
-            {
-                "indicator_name": indicator_name,
-                "indicator_value": indicator_value,
-                "indicator_description": indicator_desc,
-                **ctry_metadata,
-            }
-        )
+        rows[key] = {
+            "indicator_name": indicator_name,
+            "indicator_value": indicator_value,
+            "indicator_description": indicator_desc,
+            **ctry_metadata,
+        }
+        file_data.append(rows[key])
     return all_file_data
 
 
@@ -103,6 +144,7 @@ def compress_value(value):
     return ("%.i" if int(value) == value else "%.3f") % value
 
 
+@timed("sort_and_filter")
 def sort_and_filter_data(file_data):
     """Take file data, i.e. output from `prepare_file_data`, and
     convert to DataFrame (for easy to_csv saving), and sort fields"""
@@ -111,26 +153,121 @@ def sort_and_filter_data(file_data):
         df = pd.DataFrame(data)
         df = df.sort_values(by=INDICATORS["variable_order"])
         df = df.reset_index(drop=True)
-        df = df.dropna(axis=0)
+        # Indicators without error estimates are kept, with blank errors
+        errors = [column for column in ERROR_COLUMNS.values() if column in df]
+        df = df.dropna(axis=0, subset=df.columns.difference(errors))
         df.indicator_value = df.indicator_value.apply(compress_value).astype(str)
+        for column in errors:
+            df[column] = df[column].apply(
+                lambda value: "" if pd.isnull(value) else compress_value(value)
+            )
         if len(df) == 0:
             continue
         sorted_file_data[path] = df
     return sorted_file_data
 
 
+class LocalSink:
+    """Save each set of indicators as a CSV under a local directory,
+    following the legacy layout of `{dataset}/{topic}/{filename}`"""
+
+    def __init__(self, directory="."):
+        self.directory = directory
+
+    def local_path(self, path):
+        return Path(self.directory) / path
+
+    def write(self, sorted_file_data):
+        for path, data in sorted_file_data.items():
+            local_path = self.local_path(path)
+            # Create the local save path, if not already done so
+            Path.mkdir(local_path.parent, parents=True, exist_ok=True)
+            data.to_csv(local_path, index=False)
+
+
+class S3Sink(LocalSink):
+    """Save each set of indicators as a CSV locally, and then upload
+    the CSV to S3 under the same key"""
+
+    def __init__(self, directory=".", bucket_name=None):
+        super().__init__(directory=directory)
+        self.bucket_name = bucket_name or INDICATORS["bucket_name"]
+
+    def write(self, sorted_file_data):
+        super().write(sorted_file_data)
+        bucket = boto3.resource("s3").Bucket(self.bucket_name)
+        with span("upload", items=len(sorted_file_data)):
+            for path in sorted_file_data:
+                bucket.upload_file(str(self.local_path(path)), path)
+
+
+class ParquetSink:
+    """Save all indicators from this run as a single compressed Parquet
+    dataset, partitioned by `partition_cols`. Note that `dataset_name` and
+    `topic_name` are recovered from the legacy file paths, and that
+    `indicator_value` is restored to a numeric type.
+    """
+
+    def __init__(self, directory=".", run_label=None, upload=None):
+        config = INDICATORS["parquet"]
+        run_label = run_label or pd.Timestamp.now().strftime("%Y%m%d-%H%M%S")
+        self.path = Path(directory) / f"indicators-{run_label}.parquet"
+        self.compression = config["compression"]
+        self.partition_cols = config["partition_cols"]
+        self.upload = config["upload"] if upload is None else upload
+
+    def write(self, sorted_file_data):
+        dfs = []
+        for path, data in sorted_file_data.items():
+            # Topic names may themselves contain "/", unlike the others
+            dataset_name, topic_path = path.split("/", 1)
+            topic_name, _ = topic_path.rsplit("/", 1)
+            dfs.append(data.assign(dataset_name=dataset_name, topic_name=topic_name))
+        if not dfs:
+            return
+        df = pd.concat(dfs, ignore_index=True)
+        df.indicator_value = pd.to_numeric(df.indicator_value)
+        for column in ERROR_COLUMNS.values():
+            if column in df:  # i.e. blank if there is no error estimate
+                df[column] = pd.to_numeric(df[column], errors="coerce")
+        df.to_parquet(
+            self.path,
+            index=False,
+            compression=self.compression,
+            partition_cols=self.partition_cols,
+        )
+        if not self.upload:
+            return
+        # Mirror the partitioned dataset on S3
+        bucket = boto3.resource("s3").Bucket(INDICATORS["bucket_name"])
+        for local_path in sorted(self.path.rglob("*.parquet")):
+            key = local_path.relative_to(self.path.parent).as_posix()
+            bucket.upload_file(str(local_path), key)
+
+
+SINKS = {"local": LocalSink, "s3": S3Sink, "parquet": ParquetSink}
+
+
+def make_sinks(sink_names):
+    """Instantiate output sinks by name, as in the `output_sinks` config"""
+    return [SINKS[name]() for name in sink_names]
+
+
+def write_to_sinks(sorted_file_data, sinks):
+    """Write the sorted file data to each of the output sinks"""
+    for sink in sinks:
+        sink_name = type(sink).__name__
+        logging.info(f"Writing indicators with {sink_name}")
+        with span(f"write.{sink_name}", items=len(sorted_file_data)):
+            sink.write(sorted_file_data)
+
+
 def save_and_upload(sorted_file_data):
-    """Save the data locally and to S3"""
-    s3 = boto3.resource("s3")
-    bucket_name = INDICATORS["bucket_name"]
+    """Save the data with the output sinks specified in the config,
+    which by default is locally and to S3"""
     logging.info("Saving and uploading indicators...")
-    for path, data in sorted_file_data.items():
-        # Create the local save path, if not already done so
-        Path.mkdir(Path(path).parent, parents=True, exist_ok=True)
-        # Save the data locally
-        data.to_csv(path, index=False)
-        # Save to S3
-        s3.Bucket(bucket_name).upload_file(path, path)
+    sinks = make_sinks(INDICATORS["output_sinks"])
+    write_to_sinks(sorted_file_data, sinks)
     logging.info(f"Saved and uploaded {len(sorted_file_data)} sets of indicators")
 
 
@@ -163,5 +300,10 @@ def sort_save_and_upload(indicators):
     save_and_upload(sorted_file_data)
 
 
-# Convert to parameter for nicer interface
-days_of_covid = _days_of_covid()
+def __getattr__(name):
+    """Derive `days_of_covid` from the config on first access, rather than on import"""
+    if name != "days_of_covid":
+        raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+    # Convert to parameter for nicer interface
+    value = globals()[name] = _days_of_covid()
+    return value
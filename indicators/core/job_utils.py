@@ -0,0 +1,179 @@
+"""
+job_utils
+=========
+
+Run independent jobs (e.g. fitting the topic model of each dataset) in
+separate processes, with bounded concurrency and a memory budget. Each job
+writes its own log and exit status:
+
+    {log_dir}/{name}.log          # everything logged by the job
+    {log_dir}/{name}.status.json  # status, exit code and wall time of the job
+
+Since each job has its own process, a job which fails (or is killed, e.g. for
+exceeding its memory limit) doesn't affect the others.
+
+The memory limit of each job is enforced on the anonymous resident memory of
+the job and its child processes (e.g. a pool labelling documents), which is
+polled from `/proc` (i.e. on Linux). Memory-mapped files (e.g. the label
+store) and reserved but untouched address space (e.g. BLAS arenas) don't
+count towards it, unlike a limit on the address space.
+"""
+
+from multiprocessing.connection import wait
+from pathlib import Path
+import json
+import logging
+import multiprocessing
+import os
+import signal
+import time
+
+LOG_FORMAT = "%(asctime)s %(levelname)s %(message)s"
+PROC = Path("/proc")
+
+
+def process_tree(pid):
+    """The process `pid` and all of its descendants, from `/proc`"""
+    children = {}
+    for stat in PROC.glob("[0-9]*/stat"):
+        try:
+            # The command name (in brackets) may contain spaces, so split after it
+            fields = stat.read_text().rsplit(")", 1)[1].split()
+        except (OSError, IndexError):
+            continue  # i.e. the process has since exited
+        children.setdefault(int(fields[1]), []).append(int(stat.parent.name))
+    tree, stack = [], [pid]
+    while stack:
+        pid = stack.pop()
+        tree.append(pid)
+        stack.extend(children.get(pid, []))
+    return tree
+
+
+def anonymous_rss_mb(pid):
+    """Anonymous resident memory (in MB) of the process `pid` and its descendants,
+    i.e. excluding memory-mapped files and untouched address space"""
+    total_kb = 0
+    for _pid in process_tree(pid):
+        try:
+            status = (PROC / str(_pid) / "status").read_text()
+        except OSError:
+            continue  # i.e. the process has since exited
+        for line in status.splitlines():
+            if line.startswith("RssAnon:"):
+                total_kb += int(line.split()[1])
+    return total_kb / 1024
+
+
+def kill_tree(pid):
+    """Kill the process `pid` and all of its descendants"""
+    for _pid in reversed(process_tree(pid)):
+        try:
+            os.kill(_pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+
+
+def status_path(log_dir, name):
+    return Path(log_dir) / f"{name}.status.json"
+
+
+def write_status(log_dir, name, **status):
+    with open(status_path(log_dir, name), "w") as f:
+        json.dump({"name": name, **status}, f, indent=2)
+
+
+def read_status(log_dir, name):
+    with open(status_path(log_dir, name)) as f:
+        return json.load(f)
+
+
+def _run_job(name, func, args, log_dir):
+    """Entry point of each job's process, which logs to the job's log file and
+    records its exit status"""
+    handler = logging.FileHandler(Path(log_dir) / f"{name}.log", mode="w")
+    handler.setFormatter(logging.Formatter(LOG_FORMAT))
+    logger = logging.getLogger()
+    logger.handlers = [handler]
+    logger.setLevel(logging.INFO)
+    start = time.perf_counter()
+    try:
+        func(*args)
+    except BaseException as exc:
+        logging.exception(f"Job '{name}' failed")
+        seconds = time.perf_counter() - start
+        write_status(
+            log_dir, name, status="failed", exitcode=1, seconds=seconds, error=repr(exc)
+        )
+        raise SystemExit(1)
+    seconds = time.perf_counter() - start
+    write_status(log_dir, name, status="succeeded", exitcode=0, seconds=seconds)
+    logging.info(f"Job '{name}' succeeded in {seconds:.1f}s")
+
+
+def run_jobs(jobs, max_workers=1, memory_budget_mb=None, log_dir=".", poll_seconds=1.0):
+    """Run each job in its own process, with at most `max_workers` at a time.
+
+    Args:
+        jobs (dict): Mapping of job name to `(func, args)`, for `func(*args)`.
+        max_workers (int): Maximum number of jobs to run concurrently.
+        memory_budget_mb (float, optional): Total memory budget, which is shared
+                                            equally between the concurrent jobs.
+                                            A job whose anonymous resident memory
+                                            (with its children) exceeds its share
+                                            is killed.
+        log_dir (path-like): Where each job's log and exit status are written.
+        poll_seconds (float): How often the memory of each job is checked.
+    Returns:
+        exitcodes (dict): Exit code of each job, which is non-zero on failure
+    """
+    log_dir = Path(log_dir)
+    log_dir.mkdir(parents=True, exist_ok=True)
+    max_workers = max(1, min(max_workers, len(jobs)))
+    memory_limit_mb = None
+    if memory_budget_mb is not None:
+        memory_limit_mb = memory_budget_mb / max_workers
+        if not PROC.exists():
+            logging.warning("Can't enforce the memory budget without /proc")
+            memory_limit_mb = None
+    pending, running, exitcodes = list(jobs.items()), {}, {}
+    while pending or running:
+        while pending and len(running) < max_workers:
+            name, (func, args) = pending.pop(0)
+            write_status(log_dir, name, status="running", exitcode=None)
+            process = multiprocessing.Process(
+                target=_run_job,
+                args=(name, func, args, log_dir),
+                name=name,
+            )
+            process.start()
+            running[name] = process
+            logging.info(f"Started job '{name}' (pid {process.pid})")
+        wait([process.sentinel for process in running.values()], poll_seconds)
+        for name, process in list(running.items()):
+            if process.is_alive() and memory_limit_mb is not None:
+                rss_mb = anonymous_rss_mb(process.pid)
+                if rss_mb > memory_limit_mb:
+                    kill_tree(process.pid)
+                    process.join()
+                    error = (
+                        f"Used {rss_mb:.0f}MB, over its {memory_limit_mb:.0f}MB limit"
+                    )
+                    logging.error(f"Killed job '{name}': {error}")
+                    write_status(
+                        log_dir,
+                        name,
+                        status="killed",
+                        exitcode=process.exitcode,
+                        error=error,
+                    )
+            if process.is_alive():
+                continue
+            process.join()
+            del running[name]
+            exitcodes[name] = process.exitcode
+            if read_status(log_dir, name)["status"] == "running":
+                # The process died without recording its status, e.g. killed
+                write_status(log_dir, name, status="killed", exitcode=process.exitcode)
+            logging.info(f"Job '{name}' exited with code {process.exitcode}")
+    return exitcodes
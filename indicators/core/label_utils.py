@@ -0,0 +1,164 @@
+"""
+label_utils
+===========
+
+An id-indexed store of topic labels, written alongside the CorEx output at
+fit time. Rows are stored in order of object id, with the sorted ids (and the
+creation date of each object) stored next to the labels:
+
+    {label_store}/ids.npy       # sorted object ids
+    {label_store}/created.npy   # creation date of each object
+    {label_store}/labels.npy    # topic probabilities, one row per object
+
+The labels are memory-mapped on load, so that labels for a subset of ids
+(e.g. a geography) or a date range can be read without loading the whole
+matrix, and without relying on objects being fetched in the same order as
+at fit time. Objects which are new since the fit can be labelled with the
+saved model, and added to the store with `append_label_store`.
+"""
+
+from pathlib import Path
+import logging
+
+from indicators.core.lazy_utils import LazyModule
+
+np = LazyModule("numpy")
+
+LABEL_STORE_DIR = "label-store"
+
+
+def sort_labels(ids, created, probs):
+    """The ids, creation dates and topic probabilities of objects, sorted by
+    object id, as stored in a label store
+
+    Returns:
+        labels (dict): Of "ids", "created" and "probs"
+    """
+    ids = np.asarray(ids)
+    if len(np.unique(ids)) != len(ids):
+        raise ValueError("Object ids must be unique to be stored by id")
+    order = np.argsort(ids, kind="stable")
+    return {
+        "ids": ids[order],
+        "created": np.asarray(created, "datetime64[ns]")[order],
+        "probs": np.asarray(probs, dtype=np.float32)[order],
+    }
+
+
+def write_label_store(directory, ids, created, probs):
+    """Write topic probabilities to a label store, sorted by object id
+
+    Args:
+        directory (path-like): The label store directory.
+        ids (array-like): Object id for each row of `probs`.
+        created (array-like): Creation date for each row of `probs`.
+        probs (np.array): Topic probabilities, of shape (n_objects, n_topics).
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    labels = sort_labels(ids, created, probs)
+    np.save(directory / "ids.npy", labels["ids"])
+    np.save(directory / "created.npy", labels["created"])
+    np.save(directory / "labels.npy", labels["probs"])
+    logging.info(f"Wrote labels for {len(labels['ids'])} objects to {directory}")
+
+
+def append_label_store(directory, ids, created, probs):
+    """Add the topic probabilities of new objects (e.g. labelled with a saved
+    topic model) to an existing label store, which is rewritten in order of id
+
+    Args:
+        directory (path-like): The label store directory.
+        ids (array-like): Object id for each row of `probs`, none of which
+                          may already be in the store.
+        created (array-like): Creation date for each row of `probs`.
+        probs (np.array): Topic probabilities, of shape (n_objects, n_topics).
+    """
+    directory = Path(directory)
+    stored_ids = np.load(directory / "ids.npy")
+    ids = np.asarray(ids)
+    if np.isin(ids, stored_ids).any():
+        raise ValueError("Objects are already in the label store")
+    write_label_store(
+        directory,
+        ids=np.concatenate([stored_ids, ids]),
+        created=np.concatenate(
+            [np.load(directory / "created.npy"), np.asarray(created, "datetime64[ns]")]
+        ),
+        probs=np.concatenate([np.load(directory / "labels.npy"), probs]),
+    )
+
+
+def label_prevalence(directory, binary_threshold=0.5, chunk_size=100_000):
+    """Fraction of the objects in the label store which are labelled with each
+    topic, reading the label matrix in chunks of rows rather than all at once
+
+    Returns:
+        prevalence (np.array): Of shape (n_topics,)
+    """
+    labels = np.load(Path(directory) / "labels.npy", mmap_mode="r")
+    counts = np.zeros(labels.shape[1], dtype=np.int64)
+    for start in range(0, len(labels), chunk_size):
+        counts += (labels[start : start + chunk_size] > binary_threshold).sum(axis=0)
+    return counts / max(len(labels), 1)
+
+
+def label_store_exists(directory):
+    return (Path(directory) / "labels.npy").exists()
+
+
+def select_positions(stored_ids, created=None, ids=None, from_date=None, to_date=None):
+    """Positions of the sorted `stored_ids` which are in `ids` and/or whose
+    `created` date is in the (exclusive) date range. Ids which aren't stored
+    are ignored.
+
+    Returns:
+        positions (np.array): Sorted positions
+    """
+    selected = np.ones(len(stored_ids), dtype=bool)
+    if ids is not None:
+        ids = np.asarray(ids)
+        selected[:] = False
+        if len(stored_ids) and len(ids):
+            idx = np.searchsorted(stored_ids, ids).clip(max=len(stored_ids) - 1)
+            selected[idx[stored_ids[idx] == ids]] = True
+    if from_date is not None:
+        selected &= created > np.datetime64(from_date)
+    if to_date is not None:
+        selected &= created < np.datetime64(to_date)
+    return np.flatnonzero(selected)
+
+
+def select_rows(directory, ids=None, from_date=None, to_date=None):
+    """Positions of the rows in the label store for the given ids and/or the
+    (exclusive) date range (see `select_positions`)
+
+    Returns:
+        positions (np.array): Sorted row positions
+    """
+    directory = Path(directory)
+    stored_ids = np.load(directory / "ids.npy", mmap_mode="r")
+    created = None
+    if from_date is not None or to_date is not None:
+        created = np.load(directory / "created.npy")
+    return select_positions(stored_ids, created, ids, from_date, to_date)
+
+
+def load_labels(directory, ids=None, from_date=None, to_date=None):
+    """Load topic probabilities from the label store, optionally for only a
+    subset of ids and/or a (exclusive) date range. Only the selected rows of
+    the label matrix are read from disk.
+
+    Args:
+        directory (path-like): The label store directory.
+        ids (array-like, optional): Only load labels for these object ids.
+        from_date (str, optional): Only load labels for objects created after this.
+        to_date (str, optional): Only load labels for objects created before this.
+    Returns:
+        ids, probs: The (sorted) object ids, and their topic probabilities
+    """
+    directory = Path(directory)
+    positions = select_rows(directory, ids, from_date, to_date)
+    stored_ids = np.load(directory / "ids.npy", mmap_mode="r")
+    labels = np.load(directory / "labels.npy", mmap_mode="r")
+    return np.asarray(stored_ids[positions]), np.asarray(labels[positions])
@@ -0,0 +1,88 @@
+"""
+lazy_utils
+==========
+
+Deferred imports of heavy dependencies, so that importing `indicators`
+(and running small commands) is fast.
+"""
+
+import importlib
+
+
+class LazyModule:
+    """Stand-in for a module, which is only imported on first attribute access.
+    Assign at module level (e.g. `pd = LazyModule("pandas")`), such that the
+    name can still be patched in tests as usual."""
+
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+
+    def __getattr__(self, attr):
+        module = self.__dict__["_module"]
+        if module is None:
+            module = self.__dict__["_module"] = importlib.import_module(self._name)
+        return getattr(module, attr)
+
+    def __repr__(self):
+        state = "unloaded" if self._module is None else "loaded"
+        return f"<LazyModule '{self._name}' ({state})>"
+
+
+class LazyConfig:
+    """Stand-in for config (e.g. a YAML config constant, or a section of one),
+    which is only loaded on first use. Assign at module level, e.g.
+    `SHARDING = LazyConfig(lambda: INDICATORS["indicator_sharding"])`, such that
+    it can be used (and patched in tests, e.g. with `mock.patch.dict`) as the
+    loaded value, without reading the config on import."""
+
+    def __init__(self, load):
+        self.__dict__["_load"] = load
+        self.__dict__["_loaded"] = False
+
+    def _resolve(self):
+        if not self._loaded:
+            self.__dict__["_value"] = self._load()
+            self.__dict__["_loaded"] = True
+        return self._value
+
+    def __getattr__(self, attr):
+        return getattr(self._resolve(), attr)
+
+    def __getitem__(self, key):
+        return self._resolve()[key]
+
+    def __setitem__(self, key, value):
+        self._resolve()[key] = value
+
+    def __delitem__(self, key):
+        del self._resolve()[key]
+
+    def __iter__(self):
+        return iter(self._resolve())
+
+    def __len__(self):
+        return len(self._resolve())
+
+    def __contains__(self, item):
+        return item in self._resolve()
+
+    def __eq__(self, other):
+        if isinstance(other, LazyConfig):
+            other = other._resolve()
+        return self._resolve() == other
+
+    __hash__ = None  # i.e. as for the (mutable) loaded value
+
+    def __repr__(self):
+        return repr(self._resolve())
+
+
+class _Configured:
+    def __repr__(self):
+        return "CONFIGURED"
+
+
+# Default of an argument which is read from the config when the function is
+# called, for arguments where None has a meaning of its own
+CONFIGURED = _Configured()
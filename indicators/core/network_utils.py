@@ -0,0 +1,114 @@
+"""
+network_utils
+=============
+
+Networks of co-occurring topics. The co-occurrence matrix of the objects in
+a geography, with (weighted) membership `g` of the geography, is
+
+    Lᵀ·diag(g)·L
+
+for the binary label matrix `L`. Rather than forming this product for each
+geography in turn, each object's topic pairs (the outer product of its row
+of `L`, flattened) are formed once, such that the co-occurrence matrices of
+a batch of geographies are a single sparse product of the membership matrix
+(one row of `g` per geography) and the topic pairs.
+"""
+
+from indicators.core.lazy_utils import LazyModule
+
+np = LazyModule("numpy")
+nx = LazyModule("networkx")
+community = LazyModule("networkx.algorithms.community")
+sparse = LazyModule("scipy.sparse")
+
+
+def membership_matrix(rows, n_objects, weights=None):
+    """Sparse matrix of the (weighted) membership of objects in each group
+
+    Args:
+        rows (list of array-like): Positions of the objects in each group
+        n_objects (int): Total number of objects
+        weights (np.array, optional): Weight of each object. Defaults to 1.
+    Returns:
+        membership (csr_matrix): Of shape (n_groups, n_objects)
+    """
+    indptr = np.cumsum([0] + [len(_rows) for _rows in rows])
+    indices = np.concatenate([np.asarray(_rows, dtype=np.int64) for _rows in rows])
+    data = np.ones(len(indices)) if weights is None else weights[indices]
+    return sparse.csr_matrix((data, indices, indptr), shape=(len(rows), n_objects))
+
+
+def topic_pairs(labels):
+    """The co-occurring topic pairs of each object, i.e. the flattened outer
+    product of each row of the label matrix with itself
+
+    Args:
+        labels (sparse matrix): Binary label matrix, of shape (n_objects, n_topics)
+    Returns:
+        pairs (csr_matrix): Of shape (n_objects, n_topics ** 2)
+    """
+    labels = sparse.csr_matrix(labels)
+    labels.sum_duplicates()
+    n_objects, n_topics = labels.shape
+    counts = np.diff(labels.indptr)  # i.e. number of topics of each object
+    n_pairs = counts**2
+    # The object of each pair, and the position of the pair within the object
+    rows = np.repeat(np.arange(n_objects), n_pairs)
+    within = np.arange(n_pairs.sum()) - np.repeat(np.cumsum(n_pairs) - n_pairs, n_pairs)
+    left = labels.indptr[rows] + within // counts[rows]
+    right = labels.indptr[rows] + within % counts[rows]
+    columns = labels.indices[left].astype(np.int64) * n_topics + labels.indices[right]
+    indptr = np.concatenate([[0], np.cumsum(n_pairs)])
+    data = labels.data[left] * labels.data[right]
+    return sparse.csr_matrix((data, columns, indptr), shape=(n_objects, n_topics**2))
+
+
+def cooccurrence_matrices(membership, pairs, batch_size=None):
+    """The topic co-occurrence matrix of each group, `Lᵀ·diag(g)·L` for each
+    row `g` of the membership matrix, as sparse products over batches of
+    (up to) `batch_size` groups
+
+    Args:
+        membership (csr_matrix): From `membership_matrix`
+        pairs (csr_matrix): From `topic_pairs`
+        batch_size (int, optional): Defaults to all groups at once.
+    Yields:
+        cooccurrence (np.array): Of shape (n_topics, n_topics), for each group
+    """
+    n_groups = membership.shape[0]
+    n_topics = int(round(np.sqrt(pairs.shape[1])))
+    batch_size = batch_size or max(1, n_groups)
+    for start in range(0, n_groups, batch_size):
+        batch = (membership[start : start + batch_size] @ pairs).toarray()
+        yield from batch.reshape(-1, n_topics, n_topics)
+
+
+def topic_network(cooccurrence, topics):
+    """Network of the topics which occur at all (i.e. on the diagonal of the
+    co-occurrence matrix), with edges weighted by their co-occurrence"""
+    graph = nx.Graph()
+    graph.add_nodes_from(
+        topic for topic, n in zip(topics, np.diag(cooccurrence)) if n > 0
+    )
+    i, j = np.nonzero(np.triu(cooccurrence, k=1))
+    graph.add_weighted_edges_from(
+        zip((topics[k] for k in i), (topics[k] for k in j), cooccurrence[i, j])
+    )
+    return graph
+
+
+def network_modularity(graph):
+    """Weighted modularity of the graph's (greedy) community structure, or NaN
+    if the graph has no edges"""
+    if graph.number_of_edges() == 0:
+        return np.nan
+    communities = community.greedy_modularity_communities(graph, weight="weight")
+    return community.modularity(graph, communities, weight="weight")
+
+
+def degree_centrality(graph, node):
+    """Fraction of the other nodes to which the node is connected, which is
+    zero if the node isn't in the graph"""
+    if node not in graph or len(graph) < 2:
+        return 0.0
+    return graph.degree(node) / (len(graph) - 1)
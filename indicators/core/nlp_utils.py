@@ -9,21 +9,45 @@ Utilities for:
 * Extracting CorEx topics from flat output
 """
 
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from functools import lru_cache
+import logging
+import tempfile
 
-from corextopic import vis_topic as vt
-from corextopic import corextopic as ct
-import pandas as pd
-import numpy as np
-
-from nesta.packages.nlp_utils.ngrammer import Ngrammer
-from sklearn.feature_extraction.text import CountVectorizer
+from indicators.core.cache_utils import memory_cache
 from indicators.core.config import MYSQLDB_PATH, INDICATORS
 from indicators.core.core_utils import object_getter
-
-
-CONFIG = INDICATORS["topic_parsing"]  # topic parsing config
+from indicators.core.label_utils import (
+    LABEL_STORE_DIR,
+    append_label_store,
+    label_prevalence,
+    label_store_exists,
+    load_labels,
+    write_label_store,
+)
+from indicators.core.lazy_utils import CONFIGURED, LazyConfig, LazyModule
+from indicators.core.profiling_utils import timed
+
+# Heavy dependencies, which are only imported on first use
+vt = LazyModule("corextopic.vis_topic")
+corex_utils = LazyModule("indicators.core.corex_utils")
+dedup_utils = LazyModule("indicators.core.dedup_utils")
+pd = LazyModule("pandas")
+np = LazyModule("numpy")
+
+# Sections of the config, which are only read on first use
+CONFIG = LazyConfig(lambda: INDICATORS["topic_parsing"])  # topic parsing config
+SAMPLING = LazyConfig(lambda: INDICATORS["topic_sampling"])  # topic model sampling
+CONVERGENCE = LazyConfig(lambda: INDICATORS["topic_convergence"])  # early stopping
+DEDUP = LazyConfig(lambda: INDICATORS["topic_dedup"])  # near-duplicate documents
+_WORKER = {}  # State of each labelling worker process
+
+
+def Ngrammer(*args, **kwargs):
+    """Deferred import of nesta's Ngrammer, returning an instance"""
+    from nesta.packages.nlp_utils.ngrammer import Ngrammer as _Ngrammer
+
+    return _Ngrammer(*args, **kwargs)
 
 
 def join_text(*args):
@@ -68,6 +92,14 @@ def join_doc(doc, extra_stops=[]):
     return joined_doc
 
 
+def preprocess_docs(docs, extra_stops=[]):
+    """Impute n-grams from wiktionary, and then join and conservatively lemmatise
+    each document, ready for vectorising"""
+    ngrammer = Ngrammer(config_filepath=MYSQLDB_PATH, database="production")
+    docs = [ngrammer.process_document(doc) for doc in docs]
+    return map(lambda doc: join_doc(doc, extra_stops), docs)
+
+
 def vectorise_docs(docs, min_df=10, max_df=0.95, extra_stops=[]):
     """Impute n-grams from wiktionary and then process using a standard
     count vectoriser.
@@ -82,12 +114,10 @@ def vectorise_docs(docs, min_df=10, max_df=0.95, extra_stops=[]):
       doc_vectors: Vectorised documents and a list of feature names.
 
     """
-    # Process the text
-    ngrammer = Ngrammer(config_filepath=MYSQLDB_PATH, database="production")
-    docs = [ngrammer.process_document(doc) for doc in docs]
-    # Join and conservatively lemmatise
-    docs = map(lambda doc: join_doc(doc, extra_stops), docs)
+    docs = preprocess_docs(docs, extra_stops)
     # Vectorise the docs
+    from sklearn.feature_extraction.text import CountVectorizer  # NB: slow to import
+
     vec = CountVectorizer(min_df=min_df, max_df=max_df)
     doc_vectors = vec.fit_transform(docs)
     return doc_vectors, vec.get_feature_names()
@@ -107,6 +137,11 @@ def fit_topics(
     anchors,
     anchor_strength=10,
     max_iter=25,
+    sample_size=None,
+    strata=None,
+    convergence_tol=CONFIGURED,
+    warm_start=None,
+    duplicate_of=None,
 ):
     """Apply Corex topic modelling to a set of document vectors,
     and save the model and output to disk.
@@ -120,24 +155,251 @@ def fit_topics(
       anchors(list of list): Corex anchor terms
       anchor_strength(int, optional): Corex anchor strength multiplier. Defaults to 10.
       max_iter(int, optional): Number of model iterations. Defaults to 25.
+      sample_size(int, optional): Fit on a sample of this many documents, and then
+                                  label all documents. Defaults to fitting on all.
+      strata(array-like, optional): Stratum of each document, for sampling.
+      convergence_tol(float, optional): Stop early once the absolute change in
+                                        total correlation, relative to the previous
+                                        total correlation, falls below this.
+                                        Defaults to `topic_convergence` in the
+                                        config, and None never stops early.
+      warm_start(dict, optional): Parameters of a previous model from which to
+                                  initialise the fit (see `load_previous_parameters`)
+      duplicate_of(np.array, optional): If the doc_vectors are of only one document
+                                        per cluster of near-duplicates, the row of
+                                        doc_vectors representing each of the titles
+                                        (see `deduplicate`). Each document is then
+                                        labelled as its representative.
 
     Returns:
       topic_model: trained Corex topic model
     """
-    topic_model = ct.Corex(max_iter=max_iter, n_hidden=n_topics)
-    topic_model.fit(
-        X=doc_vectors,
-        words=feature_names,
-        docs=titles,
+    topic_model = train_topic_model(
+        doc_vectors=doc_vectors,
+        feature_names=feature_names,
+        titles=titles,
+        n_topics=n_topics,
         anchors=anchors,
         anchor_strength=anchor_strength,
+        max_iter=max_iter,
+        sample_size=sample_size,
+        strata=strata,
+        convergence_tol=convergence_tol,
+        warm_start=warm_start,
+        duplicate_of=duplicate_of,
     )
     # Use Corex tools for writing the data to the local directory
     label = make_model_label(dataset_label, n_topics, max_iter)
-    vt.vis_rep(topic_model, column_label=feature_names, prefix=label)
+    write_topic_model(topic_model, feature_names, label)
     return topic_model
 
 
+def train_topic_model(
+    doc_vectors,
+    feature_names,
+    titles,
+    n_topics,
+    anchors,
+    anchor_strength=10,
+    max_iter=25,
+    sample_size=None,
+    strata=None,
+    convergence_tol=CONFIGURED,
+    warm_start=None,
+    duplicate_of=None,
+):
+    """Train a Corex topic model, without writing any output. See `fit_topics`
+    for a description of the arguments."""
+    if convergence_tol is CONFIGURED:
+        convergence_tol = CONVERGENCE["tol"]
+    if duplicate_of is not None:
+        # Titles (and strata) of the representative of each near-duplicate cluster
+        all_titles = titles
+        _, first = np.unique(duplicate_of, return_index=True)
+        titles = [all_titles[i] for i in first]
+        strata = None if strata is None else np.asarray(strata)[first]
+    topic_model = corex_utils.MonitoredCorex(
+        tol=convergence_tol, warm_start=warm_start, max_iter=max_iter, n_hidden=n_topics
+    )
+    n_docs = doc_vectors.shape[0]
+    is_sampled = sample_size is not None and sample_size < n_docs
+    sample = np.arange(n_docs)
+    if is_sampled:
+        strata = np.zeros(n_docs) if strata is None else strata
+        sample = stratified_sample(strata, sample_size, seed=SAMPLING["seed"])
+        logging.info(f"Fitting topic model on {len(sample)} of {n_docs} documents")
+    topic_model.fit(
+        X=doc_vectors[sample],
+        words=feature_names,
+        docs=[titles[i] for i in sample],
+        anchors=anchors,
+        anchor_strength=anchor_strength,
+    )
+    logging.info(
+        f"Trained topic model in {len(topic_model.tc_history)} of {max_iter} "
+        f"iterations, with total correlation {topic_model.tc:.4f}"
+    )
+    if is_sampled:
+        label_documents(topic_model, doc_vectors, titles)
+    if duplicate_of is not None:
+        propagate_labels(topic_model, duplicate_of, all_titles)
+    return topic_model
+
+
+def deduplicate(texts, threshold=CONFIGURED, **kwargs):
+    """Cluster near-duplicate texts (see `dedup_utils.find_near_duplicates`),
+    such that only one representative of each cluster need be fitted.
+
+    Args:
+        texts (list of str): The texts of the documents.
+        threshold (float): Minimum Jaccard similarity of near-duplicates,
+                           or None to skip deduplication. Defaults to the config.
+        kwargs: Further arguments for `find_near_duplicates`, from the config
+                by default.
+    Returns:
+        representatives, duplicate_of: The positions of the texts to fit, and the
+                                        index into `representatives` of each
+                                        text's representative (None if skipped)
+    """
+    if threshold is CONFIGURED:
+        threshold = DEDUP["threshold"]
+    if threshold is None:
+        return np.arange(len(texts)), None
+    kwargs = {**{k: v for k, v in DEDUP.items() if k != "threshold"}, **kwargs}
+    return dedup_utils.find_near_duplicates(texts, threshold=threshold, **kwargs)
+
+
+def propagate_labels(topic_model, duplicate_of, titles):
+    """Label every document as its representative, such that the CorEx output
+    covers all documents, including near-duplicates which weren't fitted.
+
+    Args:
+        topic_model: A Corex topic model, fitted (or labelled) on representatives
+        duplicate_of (np.array): Index of each document's representative
+        titles (list): Name of every document
+    """
+    topic_model.p_y_given_x = np.asarray(topic_model.p_y_given_x)[duplicate_of]
+    topic_model.log_z = np.asarray(topic_model.log_z)[duplicate_of]
+    topic_model.n_samples = len(duplicate_of)
+    topic_model.set_docs(titles)
+
+
+def stratified_sample(strata, sample_size, seed=0):
+    """Random sample of positions, allocated to each stratum in proportion to
+    its size (with at least one from each stratum)
+
+    Args:
+        strata (array-like): Stratum of each item, e.g. the year of each document
+        sample_size (int): Number of items to sample (approximately, due to rounding)
+        seed (int): Random seed
+    Returns:
+        sample (np.array): Sorted positions of the sampled items
+    """
+    strata = np.asarray(strata)
+    if sample_size >= len(strata):
+        return np.arange(len(strata))
+    rng = np.random.default_rng(seed)
+    _, inverse, counts = np.unique(strata, return_inverse=True, return_counts=True)
+    allocation = np.round(counts * sample_size / len(strata)).astype(int)
+    allocation = allocation.clip(min=1, max=counts)
+    sample = [
+        rng.choice(np.flatnonzero(inverse == istratum), size=n, replace=False)
+        for istratum, n in enumerate(allocation)
+    ]
+    return np.sort(np.concatenate(sample))
+
+
+def make_strata(objects, stratify_by=CONFIGURED):
+    """Stratum of each object for sampling, e.g. the year of `created` (as in
+    the config, by default)"""
+    if stratify_by is CONFIGURED:
+        stratify_by = SAMPLING["stratify_by"]
+    if stratify_by is None:
+        return None
+    created = pd.to_datetime([obj["created"] for obj in objects])
+    return getattr(created, stratify_by).values
+
+
+def _init_worker(topic_model):
+    _WORKER["topic_model"] = topic_model
+
+
+def _label_chunk(doc_vectors, start, directory):
+    """Label a chunk of documents, writing into the memory-mapped output"""
+    p_y_given_x, log_z = _WORKER["topic_model"].transform(doc_vectors, details=True)
+    stop = start + doc_vectors.shape[0]
+    for name, values in (("p_y_given_x", p_y_given_x), ("log_z", log_z)):
+        output = np.load(Path(directory) / f"{name}.npy", mmap_mode="r+")
+        output[start:stop] = values
+        output.flush()
+
+
+def label_documents(topic_model, doc_vectors, titles, directory=None):
+    """Label all documents with a topic model that was fitted on a sample, by
+    transforming chunks of the (CSR) document vectors in a process pool. The
+    workers write their labels to memory-mapped arrays in a temporary directory,
+    which are then loaded to replace those of the sample in `topic_model`, such
+    that the CorEx output covers all documents. The temporary directory is
+    removed once the labels have been loaded.
+
+    Args:
+        topic_model: A trained Corex topic model
+        doc_vectors (sparse matrix): Vectors of all documents
+        titles (list): Name of each document in doc_vectors
+        directory (path-like, optional): Where to create the temporary directory,
+                                         by default the system's temporary dir.
+    """
+    n_docs, n_topics = doc_vectors.shape[0], topic_model.n_hidden
+    with tempfile.TemporaryDirectory(prefix="corex-labels-", dir=directory) as tmp:
+        tmp = Path(tmp)
+        for name in ("p_y_given_x", "log_z"):
+            np.lib.format.open_memmap(
+                tmp / f"{name}.npy", mode="w+", shape=(n_docs, n_topics)
+            )
+        chunk_size, max_workers = SAMPLING["chunk_size"], SAMPLING["max_workers"]
+        starts = range(0, n_docs, chunk_size)
+        logging.info(f"Labelling {n_docs} documents in {len(starts)} chunks")
+        chunks = ((doc_vectors[start : start + chunk_size], start) for start in starts)
+        if max_workers == 1 or len(starts) == 1:
+            _init_worker(topic_model)
+            for chunk, start in chunks:
+                _label_chunk(chunk, start, tmp)
+        else:
+            with ProcessPoolExecutor(
+                max_workers, initializer=_init_worker, initargs=(topic_model,)
+            ) as executor:
+                futures = [
+                    executor.submit(_label_chunk, chunk, start, tmp)
+                    for chunk, start in chunks
+                ]
+                for future in futures:
+                    future.result()  # Raise any exceptions
+        _WORKER.clear()
+        # Read into memory (not memory-mapped), since the files are removed
+        topic_model.p_y_given_x = np.load(tmp / "p_y_given_x.npy")
+        topic_model.log_z = np.load(tmp / "log_z.npy")
+    topic_model.n_samples = n_docs
+    topic_model.set_docs(titles)
+
+
+def write_topic_model(topic_model, feature_names, label, directory="."):
+    """Use Corex tools for writing the model output to `{directory}/{label}`,
+    along with the convergence trace and parameters of the model"""
+    prefix = str(Path(directory) / label)
+    vt.vis_rep(topic_model, column_label=feature_names, prefix=prefix)
+    write_convergence_trace(topic_model, Path(prefix) / "convergence.csv")
+    corex_utils.save_parameters(topic_model, Path(prefix) / "parameters.npz")
+
+
+def write_convergence_trace(topic_model, path):
+    """Write the total correlation and wall time of each training iteration"""
+    trace = getattr(topic_model, "convergence_trace", None)
+    if trace is None:  # i.e. not a MonitoredCorex, so there is no timing
+        trace = [(i, tc, None) for i, tc in enumerate(topic_model.tc_history)]
+    columns = ["iteration", "total_correlation", "seconds"]
+    pd.DataFrame(trace, columns=columns).to_csv(path, index=False)
+
+
 def parse_topic(raw_topic):
     """Convert a verbose Corex topic into a concise human-readable form.
 
@@ -153,7 +415,7 @@ def parse_topic(raw_topic):
     return topic_content
 
 
-@lru_cache()
+@memory_cache()
 def parse_corex_topics(topic_module):
     """Parse concise human-readable topics from the output
     of a Corex topic model.
@@ -190,18 +452,103 @@ def fit_topic_model(topic_module):
     titles = [obj["title"] for obj in objs]
     # Don't need the metadata for topic modelling
     topic_module.model_config.pop("metadata")
-    # Prepare the data and fit the model
-    doc_vectors, feature_names = vectorise_docs(texts)
+    # Prepare the data (of one document per near-duplicate cluster) and fit the model
+    representatives, duplicate_of = deduplicate(texts)
+    doc_vectors, feature_names = vectorise_docs([texts[i] for i in representatives])
+    warm_start = None
+    if INDICATORS["topic_warm_start"]:
+        warm_start = load_previous_parameters(topic_module)
     topic_model = fit_topics(
         titles=titles,
         doc_vectors=doc_vectors,
         feature_names=feature_names,
+        strata=make_strata(objs),
+        warm_start=warm_start,
+        duplicate_of=duplicate_of,
         **topic_module.model_config,
     )
+    write_object_labels(topic_module, objs, topic_model)
     return objs, topic_model
 
 
-@lru_cache()
+def get_model_path(topic_module):
+    """Path to the CorEx output of the topic module's model"""
+    label = make_model_label(**topic_module.model_config)
+    return Path(topic_module.__file__).parent / label
+
+
+def get_label_store_path(topic_module):
+    """Path to the id-indexed label store, alongside the CorEx output"""
+    return get_model_path(topic_module) / LABEL_STORE_DIR
+
+
+def load_previous_parameters(topic_module):
+    """Parameters of the previously saved model with the same label, if any,
+    which are only returned if they are compatible with the model config"""
+    path = get_model_path(topic_module) / "parameters.npz"
+    if not path.exists():
+        logging.info(f"No previous model at {path}, so not warm-starting")
+        return None
+    parameters = corex_utils.load_parameters(path)
+    if parameters["n_hidden"] != topic_module.model_config["n_topics"]:
+        logging.warning(f"Not warm-starting from {path}, since n_topics differs")
+        return None
+    logging.info(f"Warm-starting from the previous model at {path}")
+    return parameters
+
+
+def has_label_store(topic_module):
+    """Whether the topic module's labels can be read by id, i.e. from its label
+    store, or from the module itself (e.g. a pipeline artifact)"""
+    if hasattr(topic_module, "get_topic_labels"):
+        return True
+    return label_store_exists(get_label_store_path(topic_module))
+
+
+def write_object_labels(topic_module, objects, topic_model):
+    """Write the topic probabilities of each object to the id-indexed label store
+
+    Args:
+        topic_module (module): A topic module, e.g. arxiv_topics
+        objects (list of dict): The objects, in the order that they were fitted
+        topic_model: The trained CorEx model
+    """
+    write_label_store(
+        get_label_store_path(topic_module),
+        ids=[obj["id"] for obj in objects],
+        created=[obj["created"] for obj in objects],
+        probs=topic_model.p_y_given_x,
+    )
+    get_topic_prevalence.cache_clear()
+
+
+def label_new_objects(topic_module, objects):
+    """Label objects which are new since the topic module's model was fitted
+    (and so aren't in its label store) with the saved model, rather than by
+    refitting, and then add their topic probabilities to the label store.
+    Words which weren't in the vocabulary of the model are ignored.
+
+    Args:
+        topic_module (module): A topic module, e.g. arxiv_topics
+        objects (list of dict): The new objects, with their text
+    """
+    path = get_model_path(topic_module) / "parameters.npz"
+    topic_model = corex_utils.make_model(corex_utils.load_parameters(path))
+    from sklearn.feature_extraction.text import CountVectorizer  # NB: slow to import
+
+    vec = CountVectorizer(vocabulary=topic_model.words)
+    doc_vectors = vec.transform(preprocess_docs([obj["text"] for obj in objects]))
+    p_y_given_x, _ = topic_model.transform(doc_vectors, details=True)
+    append_label_store(
+        get_label_store_path(topic_module),
+        ids=[obj["id"] for obj in objects],
+        created=[obj["created"] for obj in objects],
+        probs=p_y_given_x,
+    )
+    get_topic_prevalence.cache_clear()
+
+
+@memory_cache()
 def parse_corex_paths(topic_module):
     """Get a lookup to all of CorEx's .txt output paths"""
     label = make_model_label(**topic_module.model_config)
@@ -213,7 +560,8 @@ def parse_corex_paths(topic_module):
     }
 
 
-@lru_cache()
+@memory_cache()
+@timed("load_labels")
 def get_corex_labels(topic_module, binary_threshold=0.5):
     """Retrieve CoreX topic labels from output of a CorEx run and binarise if desired
 
@@ -234,17 +582,62 @@ def get_corex_labels(topic_module, binary_threshold=0.5):
     return (weighted_labels > binary_threshold).astype(int)
 
 
+def get_topic_labels(
+    topic_module, ids=None, from_date=None, to_date=None, binary_threshold=0.5
+):
+    """Retrieve CorEx topic labels by object id from the label store, optionally
+    for only a subset of ids and/or an (exclusive) date range. If the topic
+    module serves its own labels (e.g. from a pipeline artifact), with its own
+    `get_topic_labels`, then they are retrieved from the module instead.
+
+    Args:
+        topic_module (module): A topic module, e.g. arxiv_topics
+        ids (array-like, optional): Only retrieve labels for these object ids.
+        from_date (str, optional): Only retrieve objects created after this date.
+        to_date (str, optional): Only retrieve objects created before this date.
+        binary_threshold (int): As for `get_corex_labels`.
+    Returns:
+        labels (pd.DataFrame): Topic labels, indexed by object id
+    """
+    if hasattr(topic_module, "get_topic_labels"):
+        labels = topic_module.get_topic_labels(
+            ids=ids, from_date=from_date, to_date=to_date
+        )
+    else:
+        ids, probs = load_labels(
+            get_label_store_path(topic_module),
+            ids,
+            from_date=from_date,
+            to_date=to_date,
+        )
+        topics = parse_corex_topics(topic_module)
+        labels = pd.DataFrame(probs, columns=topics, index=pd.Index(ids, name="id"))
+    if binary_threshold is None:
+        return labels
+    return (labels > binary_threshold).astype(int)
+
+
+@memory_cache()
+def get_topic_prevalence(topic_module):
+    """Fraction of all documents which are labelled with each CorEx topic, read
+    in chunks from the label store if there is one, rather than by loading all
+    of the labels, or otherwise from the CorEx output"""
+    topics = parse_corex_topics(topic_module)
+    path = get_label_store_path(topic_module)
+    if label_store_exists(path):
+        return pd.Series(label_prevalence(path), index=topics)
+    return pd.Series(get_corex_labels(topic_module).mean(axis=0).values, index=topics)
+
+
 def get_non_stop_topics(topic_module):
     """
     Retrieve CoreX topics and define topics as being "stop" if they occur in
     more than `stop_topic_threshold` fraction of all documents. Then return the
     set of all topic labels which are not stops.
     """
-    topics = parse_corex_topics(topic_module)
-    labels = get_corex_labels(topic_module)
-    is_not_stop = labels.mean(axis=0) < CONFIG["stop_topic_threshold"]
-    non_stop_topics = pd.Series(topics, index=topics)[is_not_stop].values.tolist()
-    return set(non_stop_topics)
+    prevalence = get_topic_prevalence(topic_module)
+    is_not_stop = prevalence < CONFIG["stop_topic_threshold"]
+    return set(prevalence.index[is_not_stop])
 
 
 def get_antitopics(topic_module):
@@ -291,3 +684,20 @@ def parse_clean_topics(topic_module, binary_threshold=0.5):
     non_stop_topics = get_non_stop_topics(topic_module)
     labels = get_corex_labels(topic_module, binary_threshold=binary_threshold)
     return labels[(non_stop_topics - antitopics) - fluffy_topics]
+
+
+def get_clean_topics(topic_module):
+    """
+    Names of the "nice" topics (see `parse_clean_topics`), in the order of the
+    CorEx topics, without loading the labels themselves. If the topic module serves its own clean topics (e.g. from a
+    pipeline artifact), with its own `get_clean_topics`, then they are
+    retrieved from the module instead.
+    """
+    if hasattr(topic_module, "get_clean_topics"):
+        return topic_module.get_clean_topics()
+    clean_topics = (
+        get_non_stop_topics(topic_module) - get_antitopics(topic_module)
+    ) - get_fluffy_topics(topic_module)
+    return [
+        topic for topic in parse_corex_topics(topic_module) if topic in clean_topics
+    ]
@@ -3,33 +3,47 @@ nuts_utils
 ==========
 
 Tools for dealing with NUTS regions.
+
+NUTS names and levels are read from a compact table, shipped with the package,
+so that the NUTS shapes are only loaded when geocoding. To rebuild the table
+(e.g. for a new edition of NUTS) run:
+
+    python -m indicators.core.nuts_utils
 """
 
-from functools import lru_cache
+from indicators.core.cache_utils import memory_cache
 from indicators.core.config import EU_COUNTRIES
 from indicators.core.config import NUTS_EDGE_CASES
-from itertools import groupby
+from indicators.core.config import NUTS_INFO_PATH
 from operator import itemgetter
-from nuts_finder import NutsFinder as _NutsFinder
+from indicators.core.lazy_utils import LazyModule
+from indicators.core.profiling_utils import span, timed
+import csv
 import logging
 
+np = LazyModule("numpy")
+
+NUTS_INFO_FIELDS = ("nuts_code", "nuts_name", "nuts_level")
+
 
-@lru_cache()
+@memory_cache()
 def NutsFinder():
     """Retrieve a NutsFinder instance and cache it.
 
     Returns:
         A NutsFinder instance
     """
+    from nuts_finder import NutsFinder as _NutsFinder  # NB: slow to import
+
     return _NutsFinder()
 
 
-@lru_cache()
-def get_nuts_info_lookup():
-    """Generate a lookup table of nuts ID to nuts info (name, level, code)"""
-    logging.info("Generating global NUTS lookup")
+def make_nuts_info_lookup_from_shapes():
+    """Generate a lookup table of nuts ID to nuts info (name, level, code)
+    from the NUTS shapes, which is slow since it loads all of the geometry"""
+    logging.info("Generating global NUTS lookup from shapes")
     nf = NutsFinder()
-    lookup = {
+    return {
         item["properties"]["NUTS_ID"]: {
             "nuts_name": item["properties"]["NAME_LATN"],
             "nuts_level": item["properties"]["LEVL_CODE"],
@@ -37,6 +51,52 @@ def get_nuts_info_lookup():
         }
         for item in nf.shapes["features"]
     }
+
+
+def write_nuts_info_table(lookup, path=NUTS_INFO_PATH):
+    """Write the nuts info lookup to a compact CSV table"""
+    with open(path, "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=NUTS_INFO_FIELDS)
+        writer.writeheader()
+        for code in sorted(lookup):
+            writer.writerow({field: lookup[code][field] for field in NUTS_INFO_FIELDS})
+
+
+def read_nuts_info_table(path=NUTS_INFO_PATH):
+    """Read the nuts info lookup from the compact CSV table"""
+    with open(path, newline="") as f:
+        return {
+            row["nuts_code"]: {
+                "nuts_name": row["nuts_name"],
+                "nuts_level": int(row["nuts_level"]),
+                "nuts_code": row["nuts_code"],
+            }
+            for row in csv.DictReader(f)
+        }
+
+
+def build_nuts_info_table(path=NUTS_INFO_PATH):
+    """Extract the nuts info lookup from the NUTS shapes, merged with the
+    edge-cases, into the compact table read by `get_nuts_info_lookup`"""
+    lookup = make_nuts_info_lookup_from_shapes()
+    lookup.update(**NUTS_EDGE_CASES)
+    write_nuts_info_table(lookup, path)
+    logging.info(f"Wrote {len(lookup)} NUTS regions to {path}")
+    return lookup
+
+
+@memory_cache()
+def get_nuts_info_lookup():
+    """Generate a lookup table of nuts ID to nuts info (name, level, code),
+    from the compact table if it has been built, or otherwise from the shapes"""
+    if NUTS_INFO_PATH.exists():
+        lookup = read_nuts_info_table(NUTS_INFO_PATH)
+    else:
+        logging.warning(
+            f"{NUTS_INFO_PATH} not found, falling back to the (slow) NUTS shapes."
+            " Build it with `python -m indicators.core.nuts_utils` and commit it"
+        )
+        lookup = make_nuts_info_lookup_from_shapes()
     # Add edge-cases
     lookup.update(**NUTS_EDGE_CASES)
     return lookup
@@ -70,9 +130,10 @@ def make_reverse_lookup(data, key=itemgetter(1), prefix=""):
     where a `code` exists somewhere in `code_object` (extracted
     with `key`) such that the output is of the form:
 
-       {code: {id1, id2, id3}}
+       {code: array([id1, id2, id3])}
 
-    You might think of this as being {nuts_code: {article ids}}
+    where the ids are sorted and unique. You might think of this
+    as being {nuts_code: [article ids]}
 
     Args:
       data: Iterable of the form (`id`, `code_object`)
@@ -81,48 +142,66 @@ def make_reverse_lookup(data, key=itemgetter(1), prefix=""):
               NUTS from ISO codes) (Default value = "")
 
     Returns:
-       Grouped object of the form {code: {id1, id2, id3}}
+       Grouped object of the form {code: array([id1, id2, id3])}
     """
     # Look nuts code --> article id
     logging.info("Performing reverse lookup")
-    data_wout_null_codes = filter(key, data)  # without null codes
+    data_wout_null_codes = [item for item in data if key(item)]  # without null codes
+    if not data_wout_null_codes:
+        return {}
+    ids = np.array([id for id, _ in data_wout_null_codes])
+    codes = np.array([f"{prefix}{key(item)}" for item in data_wout_null_codes])
+    # Group the ids by code, by sorting on (code, id), rather than via Python sets
+    order = np.lexsort((ids, codes))
+    ids, codes = ids[order], codes[order]
+    unique_codes, starts = np.unique(codes, return_index=True)
+    groups = np.split(ids, starts[1:])
     return {
-        f"{prefix}{code}": set(id for id, _ in group)
-        for code, group in groupby(sorted(data_wout_null_codes, key=key), key=key)
+        code: group[np.r_[True, group[1:] != group[:-1]]]  # i.e. deduplicate
+        for code, group in zip(unique_codes.tolist(), groups)
     }
 
 
-@lru_cache()
+@memory_cache()
+@timed("geo_lookup")
 def get_geo_lookup(module):
     """Generate a geographic lookup for a given topic_module (e.g. arxiv_topics)
     which has a get_lat_lon and get_iso2_to_id method. Output of the form:
 
-        {geography_code: [object_id]}
+        {geography_code: array([object_id])}
 
     where the object_id could be e.g. an article ID in the case of arXiv,
     or a project ID in the case of NiH or Cordis. NUTS codes are given as is,
     and ISO2 codes are prefixed with "iso_" to distinguish them from NUTS
-    regions (avoiding any unforeseen ISO-NUTS code clashes).
+    regions (avoiding any unforeseen ISO-NUTS code clashes). The object ids
+    are sorted, for conversion to positions with `core_utils.make_id_index`.
     """
     # Forward lookup
-    try:
-        # Attempt to access lat lon, if get_lat_lon exists
+    if hasattr(module, "get_lat_lon"):
+        # Only load the NUTS shapes if points need to be geocoded
         nf = NutsFinder()
-        id_to_nuts_lookup = {
-            id: nf.find(lat=lat, lon=lon) for id, lat, lon in module.get_lat_lon()
-        }
-    except AttributeError:
-        # Otherwise try get_nuts_to_id
-        id_nuts = module.get_nuts_to_id()
-    else:
+        lat_lon = module.get_lat_lon()
+        with span("geo_lookup.find_nuts", items=len(lat_lon)):
+            id_to_nuts_lookup = {
+                id: nf.find(lat=lat, lon=lon) for id, lat, lon in lat_lon
+            }
         id_nuts = [  # splatten out the nuts IDs, ready for grouping
             (id, info["NUTS_ID"])
             for id, nuts_info in id_to_nuts_lookup.items()
             for info in nuts_info
         ]
+    else:
+        # Otherwise the module provides NUTS codes directly
+        id_nuts = module.get_nuts_to_id()
     id_iso2 = module.get_iso2_to_id()
     # Reverse lookups
-    nuts_to_id_lookup = make_reverse_lookup(id_nuts)
-    iso2_to_id_lookup = make_reverse_lookup(id_iso2, prefix="iso_")
+    with span("geo_lookup.reverse_lookup"):
+        nuts_to_id_lookup = make_reverse_lookup(id_nuts)
+        iso2_to_id_lookup = make_reverse_lookup(id_iso2, prefix="iso_")
     # Combine lookups and return
     return {**nuts_to_id_lookup, **iso2_to_id_lookup}
+
+
+if __name__ == "__main__":
+    logging.getLogger().setLevel(logging.INFO)
+    build_nuts_info_table()
@@ -0,0 +1,136 @@
+"""
+pipeline_utils
+==============
+
+A small checkpointing DAG runner. Each stage writes a content-addressed
+artifact, the address of which is derived from the stage name, its parameters
+and the content of its input artifacts. On rerun, any stage whose address
+already exists in the artifact store is skipped, and its input artifacts are
+not even loaded, such that the pipeline effectively resumes from the first
+missing artifact.
+"""
+
+from collections import namedtuple
+from hashlib import sha256
+from pathlib import Path
+from uuid import uuid4
+import json
+import logging
+import os
+import pickle
+
+Stage = namedtuple("Stage", ["name", "func", "inputs", "params"], defaults=((), {}))
+Stage.__doc__ = """A stage of the pipeline, which is run as
+`func(*input_artifacts, **params)` where the `inputs` are upstream stage names."""
+
+
+def digest(data):
+    """SHA256 hex digest of some bytes"""
+    return sha256(data).hexdigest()
+
+
+def artifact_address(stage, input_digests):
+    """Content address of a stage's artifact, given its inputs' content digests"""
+    spec = {
+        "name": stage.name,
+        "params": stage.params,
+        "inputs": [input_digests[name] for name in stage.inputs],
+    }
+    return digest(json.dumps(spec, sort_keys=True, default=str).encode())[:16]
+
+
+def atomic_write(path, data):
+    """Write bytes to a temporary file, and then move into place. The temporary
+    file is unique to each write, so concurrent writers (e.g. other processes)
+    of the same path don't clobber each other's partial writes."""
+    tmp_path = path.with_name(f"{path.name}.{uuid4().hex}.tmp")
+    tmp_path.write_bytes(data)
+    os.replace(tmp_path, path)
+
+
+class ArtifactStore:
+    """Pickled artifacts on disk, each stored alongside its content digest"""
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def path(self, name, address):
+        return self.directory / f"{name}-{address}.pkl"
+
+    def exists(self, name, address):
+        return self.path(name, address).with_suffix(".sha256").exists()
+
+    def save(self, name, address, artifact):
+        """Save the artifact atomically, and return its content digest"""
+        data = pickle.dumps(artifact, protocol=pickle.HIGHEST_PROTOCOL)
+        content_digest = digest(data)
+        path = self.path(name, address)
+        atomic_write(path, data)
+        # The digest is written last, marking the artifact as complete
+        atomic_write(path.with_suffix(".sha256"), content_digest.encode())
+        return content_digest
+
+    def load(self, name, address):
+        with open(self.path(name, address), "rb") as f:
+            return pickle.load(f)
+
+    def load_digest(self, name, address):
+        return self.path(name, address).with_suffix(".sha256").read_text()
+
+
+def sort_stages(stages):
+    """Topologically sort stages, such that each follows all of its inputs"""
+    by_name = {stage.name: stage for stage in stages}
+    ordered, visiting = [], set()
+
+    def visit(stage):
+        if stage in ordered:
+            return
+        if stage.name in visiting:
+            raise ValueError(f"Stage '{stage.name}' depends on itself")
+        visiting.add(stage.name)
+        for name in stage.inputs:
+            visit(by_name[name])
+        ordered.append(stage)
+
+    for stage in stages:
+        visit(stage)
+    return ordered
+
+
+def run_pipeline(stages, store, force=(), until=None):
+    """Run the stages in dependency order, skipping any stage whose artifact
+    already exists.
+
+    Args:
+        stages (list of Stage): The stages of the pipeline.
+        store (ArtifactStore): Where artifacts are read from and written to.
+        force (iterable): Names of stages to rerun regardless, e.g. to
+                          refetch data, in which case downstream stages are
+                          only rerun if the fetched data have changed.
+        until (iterable, optional): Names of the final stages to run, such that
+                                    only these and their upstream stages are run.
+    Returns:
+        addresses (dict): The artifact address of each stage which was run or skipped
+    """
+    stages = sort_stages(stages)
+    if until is not None:
+        required = set(until)
+        for stage in reversed(stages):
+            if stage.name in required:
+                required.update(stage.inputs)
+        stages = [stage for stage in stages if stage.name in required]
+    addresses, digests = {}, {}
+    for stage in stages:
+        address = artifact_address(stage, digests)
+        addresses[stage.name] = address
+        if stage.name not in force and store.exists(stage.name, address):
+            logging.info(f"Skipping '{stage.name}', artifact {address} exists")
+            digests[stage.name] = store.load_digest(stage.name, address)
+            continue
+        logging.info(f"Running '{stage.name}'")
+        inputs = [store.load(name, addresses[name]) for name in stage.inputs]
+        artifact = stage.func(*inputs, **stage.params)
+        digests[stage.name] = store.save(stage.name, address, artifact)
+    return addresses
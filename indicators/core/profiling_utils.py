@@ -0,0 +1,140 @@
+"""
+profiling_utils
+===============
+
+Lightweight stage-level instrumentation of the pipeline. Wrap a stage in a `span`
+(or decorate it with `timed`) to record wall time, CPU time, peak RSS and item
+counts, and then `write_report` to emit a JSON run report.
+
+Instrumentation is disabled unless `enable` is called, or the environmental
+variable `INDICATORS_PROFILE` is set (to the path of the output JSON report),
+in which case a span costs no more than a couple of attribute lookups.
+"""
+
+from collections import defaultdict
+from functools import wraps
+import json
+import logging
+import os
+import resource
+import time
+
+REPORT_PATH = os.environ.get("INDICATORS_PROFILE")
+_STATE = {"enabled": REPORT_PATH is not None}
+_STATS = defaultdict(
+    lambda: {"calls": 0, "wall_time": 0, "cpu_time": 0, "items": 0, "peak_rss_mb": 0}
+)
+
+
+def enable(enabled=True):
+    """Switch instrumentation on (or off)"""
+    _STATE["enabled"] = enabled
+
+
+def is_enabled():
+    return _STATE["enabled"]
+
+
+def reset():
+    """Forget all recorded spans"""
+    _STATS.clear()
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process so far, in MB"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+
+class span:
+    """Context manager for recording stats about a stage of the pipeline,
+    aggregated over all calls with the same `name`. Item counts (e.g. number
+    of rows processed) can be added within the span with `add_items`."""
+
+    __slots__ = ("name", "items", "_wall", "_cpu")
+
+    def __init__(self, name, items=0):
+        self.name = name
+        self.items = items
+
+    def add_items(self, n):
+        self.items += n
+
+    def __enter__(self):
+        if _STATE["enabled"]:
+            self._wall = time.perf_counter()
+            self._cpu = time.process_time()
+        return self
+
+    def __exit__(self, *exc_info):
+        if not _STATE["enabled"]:
+            return
+        stats = _STATS[self.name]
+        stats["calls"] += 1
+        stats["wall_time"] += time.perf_counter() - self._wall
+        stats["cpu_time"] += time.process_time() - self._cpu
+        stats["items"] += self.items
+        stats["peak_rss_mb"] = max(stats["peak_rss_mb"], peak_rss_mb())
+
+
+def timed(name, items=len):
+    """Decorator for recording each call to the function in a `span`.
+
+    Args:
+        name (str): Name of the span.
+        items (function): Function of the return value which gives the item
+                          count for the span. If None, no items are counted.
+    """
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _STATE["enabled"]:
+                return func(*args, **kwargs)
+            with span(name) as _span:
+                result = func(*args, **kwargs)
+                if items is not None:
+                    _span.add_items(items(result))
+            return result
+
+        return wrapper
+
+    return decorator
+
+
+def cache_stats(**cached_funcs):
+    """Summarise the `cache_info` of `lru_cache`d (or `memory_cache`d) functions,
+    by name"""
+    stats = {}
+    for name, func in cached_funcs.items():
+        info = func.cache_info()
+        calls = info.hits + info.misses
+        stats[name] = {
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": info.hits / calls if calls else None,
+            "size": info.currsize,
+        }
+        if hasattr(info, "nbytes"):  # i.e. from `cache_utils.memory_cache`
+            stats[name]["evictions"] = info.evictions
+            stats[name]["mb"] = info.nbytes / 1024**2
+    return stats
+
+
+def make_report(**cached_funcs):
+    """Collate all spans, and the cache stats of `cached_funcs`, into one report"""
+    return {
+        "spans": {name: dict(stats) for name, stats in _STATS.items()},
+        "caches": cache_stats(**cached_funcs),
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def write_report(path=None, **cached_funcs):
+    """Write the run report (see `make_report`) to JSON, by default to the path
+    specified by `INDICATORS_PROFILE`. Does nothing if instrumentation is disabled."""
+    path = path or REPORT_PATH
+    if not _STATE["enabled"] or path is None:
+        return
+    logging.info(f"Writing run report to {path}")
+    with open(path, "w") as f:
+        json.dump(make_report(**cached_funcs), f, indent=2)
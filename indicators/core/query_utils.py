@@ -0,0 +1,246 @@
+"""
+query_utils
+===========
+
+An in-memory, indexed store of computed indicators, for answering queries
+like "relative_activity for topic X in region Y" without rerunning
+`thematic_indicators.py` or trawling through the CSVs:
+
+    store = IndicatorStore.from_parquet("indicators-20210701-120000.parquet")
+    store.query(nuts_code="UKI", indicator_name="relative_activity")
+
+Each of the `KEY_COLUMNS` can be filtered by a value or a list of values. The
+store is columnar, with an inverted index of each key column, and the row
+positions of recent queries are cached.
+
+The store can also be served over HTTP, returning JSON records:
+
+    python -m indicators.core.query_utils --parquet indicators-20210701-120000.parquet
+    curl "localhost:8000/indicators?nuts_code=UKI&indicator_name=relative_activity"
+"""
+
+from argparse import ArgumentParser
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+import json
+import logging
+
+from indicators.core.core_utils import flatten
+from indicators.core.lazy_utils import LazyModule
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+KEY_COLUMNS = (
+    "dataset_name",
+    "nuts_code",
+    "nuts_level",
+    "indicator_name",
+    "topic_name",
+)
+VALUE_COLUMN = "indicator_value"
+INDICATOR_FILENAMES = ("nuts-*.csv", "by-country.csv")
+
+
+def geo_metadata(geo_code):
+    """NUTS code and level of a geography code from `get_geo_lookup`, as in
+    `indicator_utils.make_ctry_metadata` (but without looking up the name)"""
+    if geo_code.startswith("iso_"):
+        return geo_code[4:], 0
+    return geo_code, len(geo_code) - 1
+
+
+class IndicatorStore:
+    """Columnar store of indicators, indexed by each of the `KEY_COLUMNS`
+
+    Args:
+        frame (DataFrame): One row per indicator value, with (at least)
+                           the `KEY_COLUMNS` and `VALUE_COLUMN`.
+        cache_size (int): Number of recent queries to cache.
+    """
+
+    def __init__(self, frame, cache_size=1024):
+        frame = frame.reset_index(drop=True)
+        self.columns = {column: frame[column].to_numpy() for column in frame.columns}
+        self.columns[VALUE_COLUMN] = pd.to_numeric(frame[VALUE_COLUMN]).to_numpy()
+        self.codes, self.index = {}, {}
+        for column in KEY_COLUMNS:
+            self.codes[column], self.index[column] = self.make_index(frame[column])
+        self._select = lru_cache(maxsize=cache_size)(self._find)
+
+    def __len__(self):
+        return len(self.columns[VALUE_COLUMN])
+
+    @staticmethod
+    def make_index(values):
+        """Dictionary-encode the values of a column, and make an inverted index
+        from each value to its (sorted) row positions
+
+        Returns:
+            codes, index: The code of each row, and a lookup of each value to its
+                          code and row positions
+        """
+        codes, uniques = pd.factorize(values)
+        order = np.argsort(codes, kind="stable")
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+        index = {
+            value: (code, order[bounds[code] : bounds[code + 1]])
+            for code, value in enumerate(uniques.tolist())
+        }
+        return codes, index
+
+    def _find(self, filters):
+        """Row positions matching the (normalised) filters, starting from the
+        values with the fewest rows, and then checking the codes of the others"""
+        candidates = []
+        for column, values in filters:
+            matches = [self.index[column][v] for v in values if v in self.index[column]]
+            codes = np.array([code for code, _ in matches], dtype=int)
+            n_rows = sum(len(positions) for _, positions in matches)
+            candidates.append((n_rows, column, codes, matches))
+        if not candidates:
+            return np.arange(len(self))
+        candidates.sort(key=lambda candidate: candidate[0])
+        _, _, _, matches = candidates[0]
+        positions = np.sort(np.concatenate([p for _, p in matches] or [[]]))
+        positions = positions.astype(int)
+        for _, column, codes, _ in candidates[1:]:
+            positions = positions[np.isin(self.codes[column][positions], codes)]
+        positions.flags.writeable = False  # i.e. safe to cache
+        return positions
+
+    def select(self, **filters):
+        """Row positions of the indicators matching the filters (see `query`)"""
+        unknown = set(filters) - set(KEY_COLUMNS)
+        if unknown:
+            raise ValueError(f"Can't filter by {sorted(unknown)}, only {KEY_COLUMNS}")
+        normalised = tuple(
+            (column, tuple(sorted(set(v if isinstance(v, (list, tuple)) else [v]))))
+            for column, v in sorted(filters.items())
+            if v is not None
+        )
+        return self._select(normalised)
+
+    def query(self, **filters):
+        """Indicators matching all of the filters, where each filter is a value or
+        a list of values of one of the `KEY_COLUMNS`, e.g.
+
+            store.query(nuts_code=["UKI", "UKC"], indicator_name="relative_activity")
+
+        Returns:
+            indicators (DataFrame): The matching rows, in their original order
+        """
+        positions = self.select(**filters)
+        return pd.DataFrame(
+            {column: values[positions] for column, values in self.columns.items()}
+        )
+
+    def records(self, **filters):
+        """As `query`, but as a list of dicts, e.g. for JSON serialisation"""
+        positions = self.select(**filters)
+        columns = {k: v[positions].tolist() for k, v in self.columns.items()}
+        return [dict(zip(columns, row)) for row in zip(*columns.values())]
+
+    def cache_info(self):
+        return self._select.cache_info()
+
+    @classmethod
+    def from_parquet(cls, path, **kwargs):
+        """Load a dataset written by `indicator_utils.ParquetSink`"""
+        frame = pd.read_parquet(path)
+        for column in frame.columns:  # i.e. partition columns are categorical
+            if isinstance(frame[column].dtype, pd.CategoricalDtype):
+                frame[column] = frame[column].astype(object)
+        frame["nuts_level"] = frame["nuts_level"].astype(int)
+        return cls(frame, **kwargs)
+
+    @classmethod
+    def from_local(cls, directory=".", **kwargs):
+        """Load the CSVs written by `indicator_utils.LocalSink`, i.e. of the
+        form `{directory}/{dataset}/{topic}/{filename}`"""
+        frames = []
+        for pattern in INDICATOR_FILENAMES:
+            for path in sorted(Path(directory).glob(f"*/*/{pattern}")):
+                frame = pd.read_csv(path, keep_default_na=False)
+                dataset_name, topic_name = path.parent.parent.name, path.parent.name
+                frames.append(
+                    frame.assign(dataset_name=dataset_name, topic_name=topic_name)
+                )
+        if not frames:
+            raise FileNotFoundError(f"No indicators found under {directory}")
+        return cls(pd.concat(frames, ignore_index=True), **kwargs)
+
+    @classmethod
+    def from_indicators(cls, indicators, **kwargs):
+        """Load indicators directly from `make_indicators`, i.e. of the form
+        [dataset][entity][geo][indicator][topic], without null or zero values
+        (as in `indicator_utils.prepare_file_data`)"""
+        rows = []
+        for dataset_name, _, geo_code, indicator_name, topic_name, value in flatten(
+            indicators
+        ):
+            if pd.isnull(value) or value == 0:
+                continue
+            nuts_code, nuts_level = geo_metadata(geo_code)
+            rows.append(
+                (dataset_name, nuts_code, nuts_level, indicator_name, topic_name, value)
+            )
+        return cls(pd.DataFrame(rows, columns=[*KEY_COLUMNS, VALUE_COLUMN]), **kwargs)
+
+
+def make_handler(store):
+    """An HTTP request handler which answers `GET /indicators?{filters}` with
+    the matching indicators as JSON records (see `IndicatorStore.query`).
+    Repeat a filter to match any of its values, e.g. `?nuts_code=UKI&nuts_code=UKC`"""
+
+    class IndicatorHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/indicators":
+                return self.respond(404, {"error": f"Unknown path {url.path}"})
+            filters = parse_qs(url.query)
+            if "nuts_level" in filters:
+                filters["nuts_level"] = [int(level) for level in filters["nuts_level"]]
+            try:
+                records = store.records(**filters)
+            except ValueError as error:
+                return self.respond(400, {"error": str(error)})
+            self.respond(200, records)
+
+        def respond(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            logging.info(format % args)
+
+    return IndicatorHandler
+
+
+def make_server(store, host="localhost", port=8000):
+    """An HTTP server for the store, to be run with `serve_forever`"""
+    return ThreadingHTTPServer((host, port), make_handler(store))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Serve indicators over HTTP")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--parquet", help="Path to a Parquet dataset of indicators")
+    source.add_argument("--local", help="Directory of local indicator CSVs")
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    if args.parquet:
+        store = IndicatorStore.from_parquet(args.parquet)
+    else:
+        store = IndicatorStore.from_local(args.local)
+    logging.info(f"Serving {len(store)} indicators on {args.host}:{args.port}")
+    make_server(store, args.host, args.port).serve_forever()
@@ -0,0 +1,262 @@
+"""
+shard_utils
+===========
+
+A simple work queue of shards, backed by a (shared) directory, such that
+shards can be processed by any number of worker processes, on any number of
+hosts which can see the directory:
+
+    {queue}/manifest.pkl        # published alongside the shards, for merging
+    {queue}/pending/{shard}.pkl   # shard specs, waiting to be claimed
+    {queue}/claimed/{shard}.pkl   # shard specs, being processed by a worker
+    {queue}/done/{shard}.pkl      # the result of each processed shard
+    {queue}/failed/{shard}.txt    # the traceback of each failed shard
+    {queue}/failed/{shard}.pkl    # and its spec, for requeueing
+
+A worker claims a shard by (atomically) moving it from `pending` to `claimed`,
+so that each shard is only claimed by one worker. Shards which have been
+claimed for too long (e.g. because their worker died) can be requeued, as can
+shards which failed. The manifest records a fingerprint of whatever the shards
+were made from, so that a queue which is out of date can be cleared and
+published afresh.
+"""
+
+from pathlib import Path
+import heapq
+import logging
+import os
+import pickle
+import time
+import traceback
+
+from indicators.core.pipeline_utils import atomic_write
+
+
+def partition(sizes, n_shards):
+    """Deterministically partition keys into shards of similar total size, by
+    assigning each key (largest first) to the currently smallest shard
+
+    Args:
+        sizes (dict): Size (e.g. number of objects) of each key (e.g. geo code)
+        n_shards (int): Maximum number of shards
+    Returns:
+        shards (list of list): The (sorted) keys of each non-empty shard
+    """
+    heap = [(0, ishard) for ishard in range(max(1, n_shards))]
+    shards = [[] for _ in heap]
+    for key in sorted(sizes, key=lambda key: (-sizes[key], key)):
+        total, ishard = heapq.heappop(heap)
+        shards[ishard].append(key)
+        heapq.heappush(heap, (total + sizes[key], ishard))
+    return [sorted(shard) for shard in shards if shard]
+
+
+def dump(path, obj):
+    atomic_write(path, pickle.dumps(obj, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def load(path):
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+class WorkQueue:
+    """A queue of shards in a shared directory (see the module docstring)"""
+
+    STATES = ("pending", "claimed", "done", "failed")
+
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        for state in self.STATES:
+            (self.directory / state).mkdir(parents=True, exist_ok=True)
+
+    @staticmethod
+    def suffix(state):
+        return ".txt" if state == "failed" else ".pkl"
+
+    def path(self, state, shard_id):
+        return self.directory / state / f"{shard_id}{self.suffix(state)}"
+
+    def shard_ids(self, state):
+        """Ids of the shards in this state, ignoring any partially written files"""
+        paths = (self.directory / state).glob(f"*{self.suffix(state)}")
+        return sorted(path.stem for path in paths)
+
+    @property
+    def manifest_path(self):
+        return self.directory / "manifest.pkl"
+
+    def failed_spec_path(self, shard_id):
+        return self.directory / "failed" / f"{shard_id}.pkl"
+
+    def is_published(self):
+        return self.manifest_path.exists()
+
+    def publish(self, shards, manifest=None, fingerprint=None):
+        """Add shards to the queue, along with a manifest for merging their results
+
+        Args:
+            shards (dict): Spec of each shard, by shard id
+            manifest (optional): Anything required for merging the results
+            fingerprint (str, optional): Identifies the inputs of the shards,
+                                         see `is_out_of_date`
+        """
+        for shard_id, spec in shards.items():
+            dump(self.path("pending", shard_id), spec)
+        # The manifest is written last, marking the queue as published
+        dump(
+            self.manifest_path,
+            {
+                "shard_ids": sorted(shards),
+                "manifest": manifest,
+                "fingerprint": fingerprint,
+            },
+        )
+        logging.info(f"Published {len(shards)} shards to {self.directory}")
+
+    def load_manifest(self):
+        return load(self.manifest_path)["manifest"]
+
+    def is_out_of_date(self, fingerprint):
+        """Whether the queue was published with a different fingerprint"""
+        return load(self.manifest_path).get("fingerprint") != fingerprint
+
+    def clear(self):
+        """Remove the manifest (i.e. unpublish the queue) and then every shard"""
+        self.manifest_path.unlink(missing_ok=True)
+        for state in self.STATES:
+            for path in (self.directory / state).iterdir():
+                path.unlink(missing_ok=True)
+        logging.info(f"Cleared {self.directory}")
+
+    def claim(self):
+        """Claim the next pending shard, if there is one
+
+        Returns:
+            shard_id, spec: Or None if there are no pending shards
+        """
+        for shard_id in self.shard_ids("pending"):
+            claimed_path = self.path("claimed", shard_id)
+            try:
+                os.rename(self.path("pending", shard_id), claimed_path)
+            except FileNotFoundError:  # i.e. claimed by another worker
+                continue
+            os.utime(claimed_path)  # i.e. the time of claiming
+            return shard_id, load(claimed_path)
+        return None
+
+    def release(self, shard_id):
+        """Remove the shard from the queue, including if it has since been
+        requeued as stale (in which case it needn't be processed again)"""
+        for state in ("claimed", "pending"):
+            self.path(state, shard_id).unlink(missing_ok=True)
+
+    def complete(self, shard_id, result):
+        dump(self.path("done", shard_id), result)
+        self.release(shard_id)
+
+    def fail(self, shard_id, error):
+        # Keep the spec, from wherever it is (i.e. if requeued as stale)
+        for state in ("claimed", "pending"):
+            try:
+                os.rename(self.path(state, shard_id), self.failed_spec_path(shard_id))
+                break
+            except FileNotFoundError:
+                continue
+        self.path("failed", shard_id).write_text(error)
+        self.release(shard_id)
+
+    def requeue_stale(self, timeout):
+        """Return shards which were claimed more than `timeout` seconds ago to
+        the queue, e.g. because their worker died"""
+        for shard_id in self.shard_ids("claimed"):
+            claimed_path = self.path("claimed", shard_id)
+            try:
+                if time.time() - claimed_path.stat().st_mtime > timeout:
+                    os.rename(claimed_path, self.path("pending", shard_id))
+                    logging.warning(f"Requeued stale shard {shard_id}")
+            except FileNotFoundError:  # i.e. completed in the meantime
+                continue
+
+    def requeue_failed(self):
+        """Return failed shards to the queue, e.g. once the cause of their
+        failure has been fixed
+
+        Returns:
+            shard_ids (list): The shards which were requeued
+        """
+        requeued = []
+        for shard_id in self.shard_ids("failed"):
+            # Removing the traceback first, in case the shard then fails again
+            self.path("failed", shard_id).unlink(missing_ok=True)
+            try:
+                os.rename(
+                    self.failed_spec_path(shard_id), self.path("pending", shard_id)
+                )
+            except FileNotFoundError:  # i.e. requeued by another worker
+                continue
+            requeued.append(shard_id)
+        if requeued:
+            logging.info(f"Requeued failed shards: {', '.join(requeued)}")
+        return requeued
+
+    def is_finished(self):
+        """Whether every published shard is either done or failed"""
+        if not self.is_published():
+            return False
+        shard_ids = load(self.manifest_path)["shard_ids"]
+        finished = set(self.shard_ids("done")) | set(self.shard_ids("failed"))
+        return finished.issuperset(shard_ids)
+
+    def results(self):
+        """The result of every shard, in order of shard id
+
+        Raises:
+            RuntimeError: If any shard failed or is unfinished
+        """
+        failed = self.shard_ids("failed")
+        if failed:
+            raise RuntimeError(f"Shards failed: {', '.join(failed)}")
+        shard_ids = load(self.manifest_path)["shard_ids"]
+        missing = sorted(set(shard_ids) - set(self.shard_ids("done")))
+        if missing:
+            raise RuntimeError(f"Shards unfinished: {', '.join(missing)}")
+        return {shard_id: load(self.path("done", shard_id)) for shard_id in shard_ids}
+
+
+def run_worker(queue, handler, wait=False, poll_interval=5, stale_timeout=None):
+    """Process shards from the queue until there are none left to claim.
+    Exceptions are recorded against the failed shard, rather than raised.
+
+    Args:
+        queue (WorkQueue): The queue.
+        handler (function): Function of a shard spec, returning the shard's result.
+        wait (bool): Rather than stopping once there are no pending shards, wait
+                     (e.g. for the queue to be published, or for other workers'
+                     shards to finish, or become stale) until the queue is finished.
+        poll_interval (float): Seconds between checks of the queue, when waiting.
+        stale_timeout (float, optional): Seconds after which claimed shards are
+                                         requeued, when waiting.
+    Returns:
+        n_processed (int): Number of shards processed by this worker
+    """
+    n_processed = 0
+    while True:
+        claimed = queue.claim()
+        if claimed is None:
+            if not wait or queue.is_finished():
+                return n_processed
+            if stale_timeout is not None:
+                queue.requeue_stale(stale_timeout)
+            time.sleep(poll_interval)
+            continue
+        shard_id, spec = claimed
+        logging.info(f"Processing shard {shard_id}")
+        try:
+            result = handler(spec)
+        except Exception:
+            logging.exception(f"Shard {shard_id} failed")
+            queue.fail(shard_id, traceback.format_exc())
+        else:
+            queue.complete(shard_id, result)
+        n_processed += 1
@@ -0,0 +1,68 @@
+"""
+similarity_utils
+================
+
+All-pairs cosine similarity of the rows of a matrix (e.g. of the topic
+activity of each region), keeping only the `k` most similar rows of each row.
+The similarities are computed as a dense matrix product of one block of rows
+at a time with all rows, such that memory grows with `block_size` times the
+number of rows, rather than with the square of the number of rows.
+"""
+
+from indicators.core.lazy_utils import LazyModule
+
+np = LazyModule("numpy")
+
+
+def normalise_rows(matrix):
+    """Scale each row to unit (L2) length, leaving rows of zeros as they are"""
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+def top_k_similar(matrix, k, groups=None, block_size=1024):
+    """The `k` most cosine-similar other rows of each row of the matrix, in
+    order of decreasing similarity (and then of position). Rows of zeros have
+    no similarity to any row.
+
+    Args:
+        matrix (array-like): Of shape (n_rows, n_features)
+        k (int): Number of most similar rows to keep for each row
+        groups (array-like, optional): Group of each row, if each row should
+                                       only be compared with rows of its group
+        block_size (int): Number of rows per block of the matrix product
+    Returns:
+        neighbours (np.array): Positions of the `k` most similar rows of each
+                               row, of shape (n_rows, k), padded with -1 if
+                               there are fewer than `k` other (nonzero) rows
+        similarities (np.array): Their similarities, padded with NaN
+    """
+    vectors = normalise_rows(matrix)
+    n_rows = len(vectors)
+    is_zero = ~vectors.any(axis=1)
+    groups = None if groups is None else np.asarray(groups)
+    neighbours = np.full((n_rows, k), -1, dtype=np.int64)
+    similarities = np.full((n_rows, k), np.nan)
+    if n_rows == 0 or k == 0:
+        return neighbours, similarities
+    n_candidates = min(k, n_rows)
+    for start in range(0, n_rows, block_size):
+        stop = min(start + block_size, n_rows)
+        block = vectors[start:stop] @ vectors.T
+        # Exclude each row itself, rows of zeros, and rows of other groups
+        block[np.arange(stop - start), np.arange(start, stop)] = -np.inf
+        block[:, is_zero] = -np.inf
+        block[is_zero[start:stop]] = -np.inf
+        if groups is not None:
+            block[groups[start:stop, None] != groups[None, :]] = -np.inf
+        candidates = np.argpartition(-block, n_candidates - 1, axis=1)
+        candidates = np.sort(candidates[:, :n_candidates], axis=1)
+        scores = np.take_along_axis(block, candidates, axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        scores = np.take_along_axis(scores, order, axis=1)
+        found = np.isfinite(scores)
+        neighbours[start:stop, :n_candidates] = np.where(found, candidates, -1)
+        similarities[start:stop, :n_candidates] = np.where(found, scores, np.nan)
+    return neighbours, similarities
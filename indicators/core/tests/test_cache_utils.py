@@ -0,0 +1,195 @@
+from functools import lru_cache
+from unittest import mock
+import os
+import sys
+import pytest
+
+from types import ModuleType
+import numpy as np
+
+from indicators.core.cache_utils import (
+    SUFFIX,
+    CacheRegistry,
+    cache_directory,
+    disk_cache,
+    invalidate,
+    memory_cache,
+    sizeof,
+)
+
+PATH = "indicators.core.cache_utils.{}"
+
+
+@pytest.fixture
+def cache_dir(tmp_path):
+    with mock.patch.dict(os.environ, {"INDICATORS_CACHE_DIR": str(tmp_path)}):
+        yield tmp_path
+
+
+def make_cached(version=None, ttl=None):
+    """A cached function, which records each of its (uncached) calls"""
+    calls = []
+
+    @disk_cache("test", version=version, ttl=ttl)
+    def query(from_date, fields=None):
+        calls.append((from_date, fields))
+        return {"from_date": from_date, "fields": fields}
+
+    return query, calls
+
+
+def test_cache_directory(tmp_path):
+    with mock.patch.dict(os.environ, {}, clear=True):
+        assert cache_directory() is None
+        with mock.patch.dict(PATH.format("DISK_CACHE"), {"enabled": True}):
+            assert cache_directory() is not None
+    with mock.patch.dict(os.environ, {"INDICATORS_CACHE_DIR": str(tmp_path)}):
+        assert cache_directory() == tmp_path
+
+
+def test_disk_cache_disabled(tmp_path):
+    version = mock.Mock(return_value=1)
+    query, calls = make_cached(version=version)
+    with mock.patch.dict(os.environ, {}, clear=True):
+        query("2015-01-01")
+        query("2015-01-01")
+    assert len(calls) == 2
+    assert version.call_count == 0  # i.e. the data isn't even probed
+
+
+def test_disk_cache(cache_dir):
+    query, calls = make_cached()
+    result = query("2015-01-01", fields=("id",))
+    assert query("2015-01-01", fields=("id",)) == result
+    assert len(calls) == 1
+    assert len(list(cache_dir.glob(f"test/query-*{SUFFIX}"))) == 1
+    # Other arguments are cached separately
+    query("2015-01-01")
+    query("2015-01-01")
+    assert len(calls) == 2
+    # Across "processes", i.e. for a newly decorated function
+    other_query, other_calls = make_cached()
+    assert other_query("2015-01-01", fields=("id",)) == result
+    assert other_calls == []
+
+
+def test_disk_cache_version(cache_dir):
+    version = mock.Mock(return_value=(10, "2021-01-01"))
+    query, calls = make_cached(version=version)
+    query("2015-01-01")
+    query("2015-01-01")
+    assert len(calls) == 1
+    version.return_value = (11, "2021-01-02")  # i.e. new data
+    query("2015-01-01")
+    assert len(calls) == 2
+
+
+def test_disk_cache_ttl(cache_dir):
+    query, calls = make_cached(ttl=60)
+    query("2015-01-01")
+    query("2015-01-01")
+    assert len(calls) == 1
+    (path,) = cache_dir.glob(f"test/query-*{SUFFIX}")
+    os.utime(path, (path.stat().st_atime, path.stat().st_mtime - 120))
+    query("2015-01-01")
+    assert len(calls) == 2
+
+
+def test_disk_cache_unreadable(cache_dir):
+    query, calls = make_cached()
+    query("2015-01-01")
+    (path,) = cache_dir.glob(f"test/query-*{SUFFIX}")
+    path.write_bytes(b"not zlib")
+    assert query("2015-01-01") == {"from_date": "2015-01-01", "fields": None}
+    assert len(calls) == 2
+
+
+def test_invalidate(cache_dir):
+    query, calls = make_cached()
+    cached = lru_cache()(query)  # i.e. as in the topic modules
+    cached("2015-01-01")
+    cached("2016-01-01")
+    assert cached.cache_invalidate() == 2
+    cached.cache_clear()
+    cached("2015-01-01")
+    assert len(calls) == 3
+    assert invalidate("other") == 0
+    assert invalidate() == 1
+
+
+def test_sizeof():
+    array = np.zeros(1000)
+    assert sizeof(array) >= 8000
+    assert sizeof([array, array]) < 2 * 8000  # i.e. only counted once
+    objects = [{"id": i, "text": f"text {i}" * 10} for i in range(10_000)]
+    seen = set()  # i.e. the keys are shared, so are only counted once
+    exact = sys.getsizeof(objects) + sum(sizeof(obj, seen) for obj in objects)
+    assert sizeof(objects) == pytest.approx(exact, rel=0.1)
+
+
+def make_registered(registry, module=None):
+    """A memory-cached function, which records each of its (uncached) calls,
+    and returns an array of `size` MB"""
+    calls = []
+
+    @memory_cache(registry=registry)
+    def load(name, size=1):
+        calls.append(name)
+        return np.zeros(size * 1024**2, dtype=np.uint8)
+
+    if module is not None:
+        load.cache.module = module.__name__
+    return load, calls
+
+
+def test_memory_cache():
+    registry = CacheRegistry()
+    load, calls = make_registered(registry)
+    assert load("a") is load("a")
+    assert load("b") is not load("a")
+    assert calls == ["a", "b"]
+    info = load.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (2, 2, 2)
+    assert info.nbytes >= 2 * 1024**2
+    assert load.__name__ == "load"
+    load.cache_clear()
+    assert load.cache_info().currsize == 0
+    assert registry.nbytes == 0
+
+
+def test_memory_cache_budget():
+    registry = CacheRegistry(budget_mb=2.5)
+    load, calls = make_registered(registry)
+    other_load, other_calls = make_registered(registry)
+    load("a")
+    other_load("b")
+    load("a")  # i.e. "b" is now the least recently used
+    load("c")
+    assert registry.nbytes <= 2.5 * 1024**2
+    assert load.cache_info().currsize == 2
+    assert other_load.cache_info().currsize == 0
+    assert other_load.cache_info().evictions == 1
+    # The most recent result is kept, even if it exceeds the budget
+    load("d", size=4)
+    assert load.cache_info().currsize == 1
+    load("d", size=4)
+    assert calls == ["a", "c", "d"]
+    # Lowering the budget releases results
+    registry.set_budget(0)
+    assert len(registry.entries) == 1
+
+
+def test_memory_cache_clear_module():
+    registry = CacheRegistry()
+    module, other_module = ModuleType("topics"), ModuleType("other_topics")
+    load, _ = make_registered(registry, module=module)
+    other_load, _ = make_registered(registry, module=other_module)
+    load("a")
+    other_load("b")
+    other_load(module)  # i.e. a result of the module, from another module
+    assert registry.clear(module) == 2
+    assert other_load.cache_info().currsize == 1
+    stats = registry.stats()
+    assert sum(cache["size"] for cache in stats["caches"].values()) == 1
+    assert stats["mb"] == pytest.approx(1, rel=0.01)
+    assert registry.clear() == 1
@@ -1,5 +1,15 @@
+import threading
+import numpy as np
+from functools import lru_cache
 from unittest import mock
-from indicators.core.core_utils import object_getter
+from sqlalchemy import text
+from indicators.core.core_utils import (
+    object_getter,
+    prefetch,
+    make_id_index,
+    to_positions,
+)
+from indicators.core.db import make_pooled_engine
 
 
 def test_object_getter():
@@ -12,13 +22,57 @@ def test_object_getter():
 @mock.patch("indicators.core.core_utils.get_geo_lookup")
 def test_object_getter_split(mocked_lookup):
     mocked_module = mock.MagicMock()
-    mocked_module.get_objects.return_value = [
-        {"id": "1"},
-        {"id": "two"},
-        {"id": "THREE"},
-    ]
-    mocked_lookup.return_value = {"FR": {"1", "THREE"}, "DE": {"two", "1"}}
-    assert list(object_getter(mocked_module, geo_split=True)) == [
-        ([True, False, True], "FR"),
-        ([True, True, False], "DE"),
+    mocked_module.get_objects.return_value = {"id": np.array(["1", "two", "THREE"])}
+    mocked_lookup.return_value = {
+        "FR": np.array(["1", "THREE"]),
+        "DE": np.array(["1", "two"]),
+    }
+    positions = list(object_getter(mocked_module, geo_split=True))
+    assert [(p.tolist(), code) for p, code in positions] == [
+        ([0, 2], "FR"),
+        ([0, 1], "DE"),
     ]
+    assert all(p.dtype == np.int32 for p, _ in positions)
+
+
+def test_to_positions():
+    id_index = make_id_index(np.array([30, 10, 20, 40]))
+    assert to_positions(id_index, [10, 40, 50]).tolist() == [1, 3]  # 50 not found
+    assert to_positions(id_index, [40, 30]).tolist() == [0, 3]  # i.e. sorted
+    assert to_positions(id_index, []).tolist() == []
+    assert to_positions(make_id_index([]), [10]).tolist() == []
+
+
+def test_prefetch():
+    # Each query waits for all of the others, so this only passes if concurrent
+    barrier = threading.Barrier(3, timeout=5)
+    mocked_module = mock.MagicMock()
+    mocked_module.get_objects.side_effect = lambda from_date, fields: barrier.wait()
+    mocked_module.prefetch_queries = (barrier.wait, barrier.wait)
+    prefetch(mocked_module, max_workers=3)
+    assert mocked_module.get_objects.call_count == 1
+    assert barrier.n_waiting == 0 and not barrier.broken
+
+
+def test_prefetch_sqlite(tmp_path):
+    engine = make_pooled_engine(f"sqlite:///{tmp_path}/test.db", pool_size=2)
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE objects (id INTEGER, iso2 TEXT)"))
+        conn.execute(text("INSERT INTO objects VALUES (1, 'FR'), (2, 'DE')"))
+
+    def query(sql):
+        @lru_cache()
+        def _query(**kwargs):
+            with engine.connect() as conn:
+                return conn.execute(text(sql)).fetchall()
+
+        return _query
+
+    mocked_module = mock.MagicMock()
+    mocked_module.get_objects = query("SELECT id FROM objects")
+    get_iso2_to_id = query("SELECT id, iso2 FROM objects")
+    mocked_module.prefetch_queries = (get_iso2_to_id,)
+    prefetch(mocked_module, max_workers=2)
+    assert get_iso2_to_id.cache_info().currsize == 1
+    assert get_iso2_to_id() == [(1, "FR"), (2, "DE")]
+    assert get_iso2_to_id.cache_info().hits == 1
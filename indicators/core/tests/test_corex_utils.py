@@ -0,0 +1,122 @@
+import pickle
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+from indicators.core.corex_utils import (
+    MonitoredCorex,
+    align_vocabulary,
+    load_parameters,
+    make_model,
+    save_parameters,
+)
+
+
+@pytest.fixture
+def doc_vectors():
+    rng = np.random.default_rng(0)
+    return csr_matrix((rng.random((200, 30)) < 0.2).astype(int))
+
+
+def test_MonitoredCorex(doc_vectors):
+    topic_model = MonitoredCorex(max_iter=8, n_hidden=3, seed=1)
+    topic_model.fit(doc_vectors)
+    assert len(topic_model.tc_history) == 8  # i.e. no early stopping
+    trace = topic_model.convergence_trace
+    assert [iteration for iteration, _, _ in trace] == list(range(8))
+    assert all(seconds >= 0 for _, _, seconds in trace)
+    assert trace[-1][1] == topic_model.tc_history[-1]
+
+
+def test_MonitoredCorex_early_stopping(doc_vectors):
+    topic_model = MonitoredCorex(tol=1e6, max_iter=20, n_hidden=3, seed=1)
+    topic_model.fit(doc_vectors)
+    assert len(topic_model.tc_history) == 3  # the minimum number of iterations
+    assert len(topic_model.convergence_trace) == 3
+
+
+def test_MonitoredCorex_convergence():
+    topic_model = MonitoredCorex(tol=0.01, max_iter=20, n_hidden=3)
+    topic_model.tc_history = [1.0, 2.0, 3.0]
+    assert not topic_model.convergence()
+    # A dip in total correlation is a change, rather than a plateau
+    topic_model.tc_history.append(2.5)
+    assert not topic_model.convergence()
+    topic_model.tc_history.append(2.501)
+    assert topic_model.convergence()
+
+
+def test_MonitoredCorex_pickle(doc_vectors):
+    topic_model = MonitoredCorex(tol=0.01, max_iter=5, n_hidden=3, seed=1)
+    topic_model.fit(doc_vectors)
+    unpickled = pickle.loads(pickle.dumps(topic_model))
+    assert unpickled.tol == 0.01
+    assert unpickled.convergence_trace == topic_model.convergence_trace
+
+
+@pytest.fixture
+def planted_topics():
+    """Documents generated from a few planted topics, and their vocabulary"""
+    rng = np.random.default_rng(0)
+    has_topic = rng.random((1000, 4)) < 0.2
+    topic_words = rng.random((4, 60)) < 0.15
+    prob = 0.02 + 0.6 * (has_topic @ topic_words > 0)
+    doc_vectors = csr_matrix((rng.random(prob.shape) < prob).astype(int))
+    return doc_vectors, [f"w{i}" for i in range(60)]
+
+
+def test_save_load_parameters(planted_topics, tmp_path):
+    doc_vectors, words = planted_topics
+    topic_model = MonitoredCorex(max_iter=5, n_hidden=4, seed=1)
+    topic_model.fit(doc_vectors, words=words)
+    save_parameters(topic_model, tmp_path / "parameters.npz")
+    parameters = load_parameters(tmp_path / "parameters.npz")
+    assert parameters["words"].tolist() == words
+    assert parameters["n_hidden"] == 4
+    assert parameters["t"].shape == (60,)
+    # A model made from the parameters labels documents identically
+    expected = topic_model.transform(doc_vectors, details=True)[0]
+    labels = make_model(parameters).transform(doc_vectors, details=True)[0]
+    assert np.allclose(labels, expected)
+
+
+def test_align_vocabulary():
+    parameters = {"words": np.array(["a", "b", "c"])}
+    assert align_vocabulary(parameters, ["c", "new", "a"]).tolist() == [2, -1, 0]
+
+
+def test_MonitoredCorex_warm_start(planted_topics, tmp_path):
+    doc_vectors, words = planted_topics
+    previous = MonitoredCorex(tol=1e-3, max_iter=30, n_hidden=4, seed=1)
+    previous.fit(doc_vectors, words=words)
+    save_parameters(previous, tmp_path / "parameters.npz")
+    parameters = load_parameters(tmp_path / "parameters.npz")
+
+    # Refit on a shuffled 95% of the documents, with a shuffled vocabulary
+    rng = np.random.default_rng(1)
+    rows, cols = rng.permutation(1000)[:950], rng.permutation(60)
+    new_vectors, new_words = doc_vectors[rows][:, cols], [words[i] for i in cols]
+    topic_model = MonitoredCorex(
+        tol=1e-3, max_iter=30, n_hidden=4, seed=2, warm_start=parameters
+    )
+    topic_model.fit(new_vectors, words=new_words)
+    # Starts close to the previous optimum...
+    assert topic_model.tc_history[0] > 0.8 * previous.tc
+    # ...and the topics keep their identities, i.e. label the same documents
+    previous_labels = previous.transform(doc_vectors[rows], details=True)[0]
+    for itopic in range(4):
+        corr = np.corrcoef(
+            previous_labels[:, itopic], topic_model.p_y_given_x[:, itopic]
+        )
+        assert corr[0, 1] > 0.9
+
+
+def test_MonitoredCorex_warm_start_incompatible(planted_topics, tmp_path):
+    doc_vectors, words = planted_topics
+    previous = MonitoredCorex(max_iter=3, n_hidden=4, seed=1)
+    previous.fit(doc_vectors, words=words)
+    save_parameters(previous, tmp_path / "parameters.npz")
+    parameters = load_parameters(tmp_path / "parameters.npz")
+    with pytest.raises(ValueError):
+        MonitoredCorex(n_hidden=3, warm_start=parameters).fit(doc_vectors, words=words)
+    with pytest.raises(ValueError):
+        MonitoredCorex(n_hidden=4, warm_start=parameters).fit(doc_vectors)
@@ -0,0 +1,41 @@
+from unittest import mock
+import os
+from sqlalchemy import create_engine, text
+from indicators.core.db import make_pooled_engine, get_mysql_engine
+
+PATH = "indicators.core.db.{}"
+
+
+def test_make_pooled_engine(tmp_path):
+    engine = make_pooled_engine(f"sqlite:///{tmp_path}/test.db", pool_size=3)
+    assert engine.pool.size() == 3
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT 1")).scalar() == 1
+
+
+@mock.patch(PATH.format("_get_mysql_engine"))
+def test_get_mysql_engine(mocked_engine, tmp_path):
+    mocked_engine.return_value = create_engine(f"sqlite:///{tmp_path}/test.db")
+    get_mysql_engine.cache_clear()
+    engine = get_mysql_engine()
+    assert engine is get_mysql_engine()  # i.e. one engine for the whole process
+    assert mocked_engine.call_count == 1
+    assert str(engine.url) == f"sqlite:///{tmp_path}/test.db"
+    assert engine.pool.size() == 5  # as in db.yaml
+    get_mysql_engine.cache_clear()
+
+
+@mock.patch(PATH.format("_get_mysql_engine"))
+def test_get_mysql_engine_url(mocked_engine, tmp_path):
+    url = f"sqlite:///{tmp_path}/fixture.db"
+    get_mysql_engine.cache_clear()
+    with mock.patch.dict(PATH.format("DB_CONFIG"), {"url": url}):
+        engine = get_mysql_engine()
+    assert str(engine.url) == url
+    assert mocked_engine.call_count == 0  # i.e. no production credentials
+    get_mysql_engine.cache_clear()
+    # The environmental variable takes precedence over the config
+    env_url = f"sqlite:///{tmp_path}/env.db"
+    with mock.patch.dict(os.environ, {"INDICATORS_DB_URL": env_url}):
+        assert str(get_mysql_engine().url) == env_url
+    get_mysql_engine.cache_clear()
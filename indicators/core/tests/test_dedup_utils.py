@@ -0,0 +1,56 @@
+import numpy as np
+
+from indicators.core.dedup_utils import (
+    find_near_duplicates,
+    lsh_bands,
+    minhash_signatures,
+    shingle,
+)
+
+
+def make_texts(n_texts, n_words=100, seed=0):
+    rng = np.random.default_rng(seed)
+    vocab = [f"word{i}" for i in range(2000)]
+    return [" ".join(rng.choice(vocab, n_words)) for _ in range(n_texts)]
+
+
+def test_shingle():
+    assert len(shingle("a b c d")) == 2
+    assert len(shingle("a b c a b c")) == 3  # i.e. distinct shingles
+    assert len(shingle("a b")) == 1  # fewer words than the shingle size
+    assert len(shingle("")) == 0
+    assert np.array_equal(shingle("A b C d"), shingle("a b c d"))
+
+
+def test_minhash_signatures():
+    texts = make_texts(2) + [""]
+    signatures = minhash_signatures(texts, num_perm=64, chunk_size=2)
+    assert signatures.shape == (3, 64)
+    assert np.array_equal(signatures, minhash_signatures(texts, num_perm=64))
+    # Signature agreement estimates the Jaccard similarity, which is ~0 here
+    assert (signatures[0] == signatures[1]).mean() < 0.1
+
+
+def test_lsh_bands():
+    bands, rows = lsh_bands(0.9, 128)
+    assert bands * rows <= 128
+    # The probability of being a candidate rises steeply around the threshold
+    assert 1 - (1 - 0.95**rows) ** bands > 0.9
+    assert 1 - (1 - 0.5**rows) ** bands < 0.01
+
+
+def test_find_near_duplicates():
+    texts = make_texts(50)
+    words = texts[3].split()
+    words[10] = "resubmitted"
+    texts.insert(0, " ".join(words))  # a near-duplicate of (now) text 4
+    texts.append(texts[10])  # an exact duplicate of text 10
+    representatives, duplicate_of = find_near_duplicates(texts, threshold=0.9)
+    assert len(representatives) == 50
+    assert representatives.tolist() == sorted(representatives)
+    assert duplicate_of[0] == duplicate_of[4] == 0  # i.e. represented by text 0
+    assert duplicate_of[51] == duplicate_of[10]
+    # Every other text represents itself
+    expected = np.arange(52)
+    expected[4], expected[51] = 0, 10
+    assert np.array_equal(representatives[duplicate_of], expected)
@@ -5,9 +5,14 @@ from indicators.core.indicator_utils import (
     make_indicator_description,
     make_ctry_metadata,
     prepare_file_data,
+    split_error_name,
     sort_and_filter_data,
     _days_of_covid,
     save_and_upload,
+    LocalSink,
+    ParquetSink,
+    make_sinks,
+    S3Sink,
     safe_divide,
     sort_save_and_upload,
     pd,
@@ -123,6 +128,69 @@ def test_prepare_file_data(mocked_metadata, mocked_description):
     }
 
 
+def test_split_error_name():
+    assert split_error_name("relative_activity") == ("relative_activity", None)
+    assert split_error_name("relative_activity_lower") == (
+        "relative_activity",
+        "indicator_lower",
+    )
+    assert split_error_name("relative_activity_upper") == (
+        "relative_activity",
+        "indicator_upper",
+    )
+
+
+@mock.patch(PATH.format("make_indicator_description"), return_value="DESCRIPTION")
+@mock.patch(PATH.format("make_ctry_metadata"))
+def test_prepare_file_data_intervals(mocked_metadata, mocked_description):
+    mocked_metadata.side_effect = lambda x: {"nuts_code": x, "filename": "nuts-1.csv"}
+    indicators = {
+        "nih": {
+            "projects": {
+                "UK": {
+                    "total_activity": {"a topic": 12},
+                    "relative_activity": {"a topic": 1.5, "another topic": 0},
+                    "relative_activity_lower": {"a topic": 1.1, "another topic": 0},
+                    "relative_activity_upper": {"a topic": 1.9, "another topic": 0},
+                },
+            },
+        },
+    }
+    file_data = prepare_file_data(indicators)
+    assert list(file_data) == ["nih/a topic/nuts-1.csv"]
+    total, relative = file_data["nih/a topic/nuts-1.csv"]
+    assert "indicator_lower" not in total
+    assert relative["indicator_name"] == "relative_activity"
+    assert relative["indicator_value"] == 1.5
+    assert relative["indicator_lower"] == 1.1
+    assert relative["indicator_upper"] == 1.9
+
+
+def test_sort_and_filter_data_intervals():
+    file_data = {
+        "path": [
+            {
+                "indicator_name": "total_activity",
+                "nuts_level": 1,
+                "nuts_code": "FR",
+                "indicator_value": 10,
+            },
+            {
+                "indicator_name": "relative_activity",
+                "nuts_level": 1,
+                "nuts_code": "FR",
+                "indicator_value": 1.5,
+                "indicator_lower": 1.1,
+                "indicator_upper": 2,
+            },
+        ],
+    }
+    df = sort_and_filter_data(file_data)["path"]
+    assert len(df) == 2  # i.e. indicators without intervals are kept
+    assert df.indicator_lower.tolist() == ["1.100", ""]
+    assert df.indicator_upper.tolist() == ["2", ""]
+
+
 def test_sort_and_filter_data():
     file_data = {
         "path1": [
@@ -166,6 +234,67 @@ def test_save_and_upload(mocked_path, mocked_boto):
     assert bucket.upload_file.call_count == 2
 
 
+def _sorted_file_data():
+    return {
+        "nih/a topic/nuts-1.csv": pd.DataFrame(
+            [{"indicator_name": "first", "nuts_level": 1, "indicator_value": "10"}]
+        ),
+        "arxiv/another topic/by-country.csv": pd.DataFrame(
+            [{"indicator_name": "second", "nuts_level": 0, "indicator_value": "0.12"}]
+        ),
+    }
+
+
+def test_local_sink(tmp_path):
+    LocalSink(directory=tmp_path).write(_sorted_file_data())
+    df = pd.read_csv(tmp_path / "nih" / "a topic" / "nuts-1.csv")
+    assert df.to_dict(orient="records") == [
+        {"indicator_name": "first", "nuts_level": 1, "indicator_value": 10}
+    ]
+    assert (tmp_path / "arxiv" / "another topic" / "by-country.csv").exists()
+
+
+@mock.patch(PATH.format("boto3"))
+def test_s3_sink(mocked_boto, tmp_path):
+    bucket = mocked_boto.resource().Bucket()
+    S3Sink(directory=tmp_path, bucket_name="a bucket").write(_sorted_file_data())
+    assert mocked_boto.resource().Bucket.call_args == mock.call("a bucket")
+    assert bucket.upload_file.call_args_list == [
+        mock.call(str(tmp_path / "nih/a topic/nuts-1.csv"), "nih/a topic/nuts-1.csv"),
+        mock.call(
+            str(tmp_path / "arxiv/another topic/by-country.csv"),
+            "arxiv/another topic/by-country.csv",
+        ),
+    ]
+
+
+def test_parquet_sink(tmp_path):
+    sink = ParquetSink(directory=tmp_path, run_label="test", upload=False)
+    sink.write(_sorted_file_data())
+    assert sink.path == tmp_path / "indicators-test.parquet"
+    assert (sink.path / "dataset_name=nih" / "nuts_level=1").is_dir()
+    df = pd.read_parquet(sink.path).sort_values("indicator_value")
+    assert df.indicator_value.tolist() == [0.12, 10]
+    assert df.topic_name.tolist() == ["another topic", "a topic"]
+
+
+def test_parquet_sink_slash_in_topic(tmp_path):
+    sorted_file_data = _sorted_file_data()
+    sorted_file_data["nih/sars/covid topic/nuts-1.csv"] = sorted_file_data.pop(
+        "nih/a topic/nuts-1.csv"
+    )
+    sink = ParquetSink(directory=tmp_path, run_label="test", upload=False)
+    sink.write(sorted_file_data)
+    df = pd.read_parquet(sink.path)
+    assert set(df.topic_name) == {"sars/covid topic", "another topic"}
+    assert set(df.dataset_name) == {"nih", "arxiv"}
+
+
+def test_make_sinks():
+    sinks = make_sinks(["local", "s3", "parquet"])
+    assert [type(sink) for sink in sinks] == [LocalSink, S3Sink, ParquetSink]
+
+
 @mock.patch(PATH.format("INDICATORS"))
 def test_days_of_covid(mocked_INDICATORS):
     mocked_INDICATORS.__getitem__.return_value = {
@@ -0,0 +1,80 @@
+import mmap
+import os
+import signal
+import time
+
+import pytest
+
+from indicators.core.job_utils import PROC, read_status, run_jobs
+
+
+def succeed(path):
+    with open(path, "w") as f:
+        f.write("done")
+
+
+def fail():
+    raise ValueError("bad data")
+
+
+def die():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+
+def allocate(n_mb):
+    memory = bytearray(b"x") * (n_mb * 1024**2)  # i.e. touched, so resident
+    time.sleep(10)  # long enough to be polled
+    return memory
+
+
+def test_run_jobs(tmp_path):
+    output = tmp_path / "output.txt"
+    jobs = {
+        "good": (succeed, (output,)),
+        "bad": (fail, ()),
+        "dead": (die, ()),
+    }
+    exitcodes = run_jobs(jobs, max_workers=2, log_dir=tmp_path / "logs")
+    assert exitcodes["good"] == 0
+    assert exitcodes["bad"] == 1
+    assert exitcodes["dead"] == -signal.SIGKILL
+    # The failures don't affect the successful job
+    assert output.read_text() == "done"
+    assert read_status(tmp_path / "logs", "good")["status"] == "succeeded"
+    assert read_status(tmp_path / "logs", "bad")["status"] == "failed"
+    assert read_status(tmp_path / "logs", "dead")["status"] == "killed"
+    assert "bad data" in (tmp_path / "logs" / "bad.log").read_text()
+
+
+def map_file(path, n_mb):
+    with open(path, "wb") as f:
+        f.truncate(n_mb * 1024**2)
+    with open(path, "rb") as f:
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        assert sum(mapped[:: mmap.PAGESIZE]) == 0  # i.e. read, so resident
+        time.sleep(1)
+
+
+@pytest.mark.skipif(not PROC.exists(), reason="Memory is polled from /proc")
+def test_run_jobs_memory_budget(tmp_path):
+    jobs = {
+        "small": (succeed, (tmp_path / "small.txt",)),
+        "large": (allocate, (400,)),
+        "mapped": (map_file, (tmp_path / "mapped.bin", 400)),
+    }
+    exitcodes = run_jobs(
+        jobs, max_workers=3, memory_budget_mb=600, log_dir=tmp_path, poll_seconds=0.1
+    )
+    # Only anonymous memory counts towards the limit, not memory-mapped files
+    assert exitcodes == {"small": 0, "large": -signal.SIGKILL, "mapped": 0}
+    status = read_status(tmp_path, "large")
+    assert status["status"] == "killed"
+    assert "over its 200MB limit" in status["error"]
+
+
+@pytest.mark.parametrize("max_workers", [1, 3])
+def test_run_jobs_max_workers(tmp_path, max_workers):
+    jobs = {str(i): (succeed, (tmp_path / f"{i}.txt",)) for i in range(5)}
+    exitcodes = run_jobs(jobs, max_workers=max_workers, log_dir=tmp_path)
+    assert exitcodes == {str(i): 0 for i in range(5)}
+    assert len(list(tmp_path.glob("*.txt"))) == 5
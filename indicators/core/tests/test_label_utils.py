@@ -0,0 +1,59 @@
+import numpy as np
+import pytest
+from indicators.core.label_utils import (
+    append_label_store,
+    write_label_store,
+    label_prevalence,
+    label_store_exists,
+    select_rows,
+    load_labels,
+)
+
+
+@pytest.fixture
+def store(tmp_path):
+    ids = np.array([30, 10, 40, 20])
+    created = ["2019-01-01", "2020-06-01", "2018-01-01", "2020-04-01"]
+    probs = np.array([[0.3, 0.7], [0.1, 0.9], [0.4, 0.6], [0.2, 0.8]])
+    write_label_store(tmp_path, ids, created, probs)
+    return tmp_path
+
+
+def test_write_label_store(store):
+    assert label_store_exists(store)
+    assert np.load(store / "ids.npy").tolist() == [10, 20, 30, 40]
+    assert np.allclose(np.load(store / "labels.npy")[:, 0], [0.1, 0.2, 0.3, 0.4])
+
+
+def test_write_label_store_duplicate_ids(tmp_path):
+    with pytest.raises(ValueError):
+        write_label_store(tmp_path, [1, 1], ["2020-01-01"] * 2, np.ones((2, 2)))
+
+
+def test_select_rows(store):
+    assert select_rows(store).tolist() == [0, 1, 2, 3]
+    assert select_rows(store, ids=[40, 10, 50]).tolist() == [0, 3]  # 50 not stored
+    assert select_rows(store, from_date="2020-01-01").tolist() == [0, 1]
+    assert select_rows(store, ids=[10, 30], to_date="2020-01-01").tolist() == [2]
+
+
+def test_load_labels(store):
+    ids, probs = load_labels(store, ids=[20, 40])
+    assert ids.tolist() == [20, 40]
+    assert np.allclose(probs, [[0.2, 0.8], [0.4, 0.6]])
+    ids, probs = load_labels(store, from_date="2020-05-01")
+    assert ids.tolist() == [10]
+
+
+def test_label_prevalence(store):
+    assert np.allclose(label_prevalence(store), [0, 1])
+    assert np.allclose(label_prevalence(store, 0.25, chunk_size=3), [0.5, 1])
+
+
+def test_append_label_store(store):
+    append_label_store(store, [25, 5], ["2021-01-01"] * 2, [[0.25, 0.75], [0, 1]])
+    ids, probs = load_labels(store, from_date="2020-05-01")
+    assert ids.tolist() == [5, 10, 25]
+    assert np.allclose(probs[:, 0], [0, 0.1, 0.25])
+    with pytest.raises(ValueError):
+        append_label_store(store, [30], ["2021-01-01"], [[0.5, 0.5]])
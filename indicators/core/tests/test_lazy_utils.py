@@ -0,0 +1,61 @@
+import sys
+import subprocess
+from unittest import mock
+from indicators.core.lazy_utils import LazyConfig, LazyModule
+from indicators.core import config
+
+
+def test_LazyModule():
+    module = LazyModule("json")
+    assert "unloaded" in repr(module)
+    assert module.dumps([1]) == "[1]"
+    assert "loaded" in repr(module) and "unloaded" not in repr(module)
+
+
+def test_LazyConfig():
+    loads = []
+    section = LazyConfig(lambda: loads.append(1) or {"a": 1, "b": [2]})
+    assert loads == []
+    assert section["a"] == 1 and "b" in section and len(section) == 2
+    assert {**section} == section == {"a": 1, "b": [2]}
+    assert loads == [1]  # i.e. only loaded once
+    with mock.patch.dict(section, {"a": 3}):
+        assert section.get("a") == 3
+    assert section["a"] == 1
+
+
+def test_lazy_config():
+    assert "INDICATORS" in dir(config)
+    assert config.INDICATORS is config.INDICATORS  # i.e. cached after first access
+    assert config.INDICATORS == config.load_yaml("indicators")
+
+
+def test_no_heavy_imports():
+    """Importing the core modules shouldn't import their heavy dependencies"""
+    code = (
+        "import sys\n"
+        "from indicators.core import indicator_utils, nlp_utils, nuts_utils\n"
+        "print(','.join(m for m in ('pandas', 'boto3', 'sklearn', 'corextopic')"
+        " if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == ""
+
+
+def test_no_config_parsing():
+    """Importing the modules shouldn't parse any of the YAML config"""
+    code = (
+        "from indicators.core import config\n"
+        "calls = []\n"
+        "load_yaml = config.load_yaml\n"
+        "config.load_yaml = lambda name: calls.append(name) or load_yaml(name)\n"
+        "from indicators.core import cache_utils, indicator_utils, nlp_utils\n"
+        "from indicators.two import incremental, preview, region_similarity\n"
+        "print(','.join(calls))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == ""
@@ -0,0 +1,68 @@
+import numpy as np
+import pytest
+from scipy.sparse import csr_matrix
+
+from indicators.core.network_utils import (
+    cooccurrence_matrices,
+    degree_centrality,
+    membership_matrix,
+    network_modularity,
+    topic_network,
+    topic_pairs,
+)
+
+
+@pytest.fixture
+def labels():
+    rng = np.random.default_rng(0)
+    return (rng.random((200, 6)) < 0.3).astype(float)
+
+
+def test_membership_matrix():
+    membership = membership_matrix([[0, 2], [], [1]], 3, np.array([1.0, 2.0, 3.0]))
+    assert membership.toarray().tolist() == [[1, 0, 3], [0, 0, 0], [0, 2, 0]]
+    assert membership_matrix([[1]], 2).toarray().tolist() == [[0, 1]]
+
+
+def test_topic_pairs(labels):
+    pairs = topic_pairs(csr_matrix(labels))
+    assert pairs.shape == (200, 36)
+    expected = np.einsum("ot,os->ots", labels, labels).reshape(200, 36)
+    assert np.array_equal(pairs.toarray(), expected)
+
+
+@pytest.mark.parametrize("batch_size", [None, 1, 2])
+def test_cooccurrence_matrices(labels, batch_size):
+    rng = np.random.default_rng(1)
+    rows = [rng.choice(200, 50, replace=False), np.arange(200), []]
+    weights = rng.lognormal(size=200)
+    membership = membership_matrix(rows, 200, weights)
+    matrices = list(
+        cooccurrence_matrices(membership, topic_pairs(labels), batch_size=batch_size)
+    )
+    assert len(matrices) == 3
+    for g, cooccurrence in zip(membership.toarray(), matrices):
+        assert np.allclose(cooccurrence, labels.T @ np.diag(g) @ labels)
+
+
+def test_topic_network():
+    cooccurrence = np.array([[3, 2, 0, 0], [2, 2, 0, 0], [0, 0, 1, 0], [0, 0, 0, 0]])
+    graph = topic_network(cooccurrence, ["a", "b", "c", "d"])
+    assert set(graph.nodes) == {"a", "b", "c"}  # i.e. "d" doesn't occur
+    assert list(graph.edges(data="weight")) == [("a", "b", 2)]
+
+
+def test_network_modularity():
+    # Two cliques, which are loosely connected
+    cooccurrence = np.kron(np.eye(2), np.ones((3, 3))) + 0.01
+    graph = topic_network(cooccurrence, list("abcdef"))
+    assert network_modularity(graph) == pytest.approx(0.5, abs=0.02)
+    assert np.isnan(network_modularity(topic_network(np.eye(2), ["a", "b"])))
+
+
+def test_degree_centrality():
+    cooccurrence = np.array([[1, 1, 1], [1, 1, 0], [1, 0, 1]])
+    graph = topic_network(cooccurrence, ["a", "b", "c"])
+    assert degree_centrality(graph, "a") == 1
+    assert degree_centrality(graph, "b") == 0.5
+    assert degree_centrality(graph, "z") == 0
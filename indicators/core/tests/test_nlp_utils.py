@@ -1,5 +1,25 @@
+import shutil
+import numpy as np
+import pandas as pd
+import pytest
+from types import ModuleType
 from unittest import mock
+from scipy.sparse import csr_matrix
 from indicators.core.nlp_utils import (
+    deduplicate,
+    load_previous_parameters,
+    write_topic_model,
+    label_documents,
+    make_strata,
+    stratified_sample,
+    train_topic_model,
+    get_clean_topics,
+    get_topic_labels,
+    get_topic_prevalence,
+    has_label_store,
+    label_new_objects,
+    make_model_label,
+    write_object_labels,
     join_text,
     join_and_filter_sent,
     join_doc,
@@ -138,3 +158,184 @@ def test_parse_clean_topics():
     assert rows == 10
     assert cols > 20 and cols < 100
     assert COVID_TOPIC in clean_topics.columns
+
+
+def test_get_clean_topics():
+    from indicators.core.tests import dummy_topic_module
+
+    clean_topics = get_clean_topics(dummy_topic_module)
+    assert set(clean_topics) == set(parse_clean_topics(dummy_topic_module).columns)
+    topics = parse_corex_topics(dummy_topic_module)
+    assert clean_topics == [topic for topic in topics if topic in clean_topics]
+
+
+def test_get_topic_labels(tmp_path):
+    from indicators.core.tests import dummy_topic_module
+
+    module = ModuleType("dummy_topic_module")
+    module.__file__ = str(tmp_path / "dummy_topic_module.py")
+    module.model_config = dummy_topic_module.model_config
+    path = tmp_path / make_model_label(**module.model_config)
+    path.mkdir()
+    shutil.copy(parse_corex_paths(dummy_topic_module)["topics"], path)
+    assert not has_label_store(module)
+
+    topic_model = mock.Mock(p_y_given_x=np.full((3, 150), 0.1))
+    topic_model.p_y_given_x[1, 0] = 0.9
+    objects = [
+        {"id": "c", "created": "2020-01-01"},
+        {"id": "a", "created": "2019-01-01"},
+        {"id": "b", "created": "2018-01-01"},
+    ]
+    write_object_labels(module, objects, topic_model)
+    assert has_label_store(module)
+    labels = get_topic_labels(module, ids=["a", "c"])
+    assert labels.index.tolist() == ["a", "c"]
+    assert labels.shape == (2, 150)
+    assert labels.iloc[:, 0].tolist() == [1, 0]
+    labels = get_topic_labels(module, from_date="2018-06-01", binary_threshold=None)
+    assert labels.index.tolist() == ["a", "c"]
+    assert labels.iloc[0, 0] == pytest.approx(0.9)
+    # Prevalence is read from the label store
+    prevalence = get_topic_prevalence(module)
+    assert prevalence.index.tolist() == parse_corex_topics(module)
+    assert prevalence.iloc[:2].tolist() == pytest.approx([1 / 3, 0])
+
+
+def test_stratified_sample():
+    strata = np.array([2019] * 800 + [2020] * 150 + [2021] * 50)
+    sample = stratified_sample(strata, 100, seed=1)
+    assert len(sample) == 100
+    assert (np.diff(sample) > 0).all()  # i.e. sorted and unique
+    assert np.bincount(strata[sample] - 2019).tolist() == [80, 15, 5]
+    assert stratified_sample(strata[:10], 100).tolist() == list(range(10))
+    # Small strata are always represented
+    assert set(strata[stratified_sample(strata, 10)]) == {2019, 2020, 2021}
+
+
+def test_make_strata():
+    objects = [{"created": "2019-05-01"}, {"created": "2020-01-01"}]
+    assert make_strata(objects, stratify_by="year").tolist() == [2019, 2020]
+    assert make_strata(objects, stratify_by=None) is None
+
+
+@pytest.fixture
+def doc_vectors():
+    rng = np.random.default_rng(0)
+    return csr_matrix((rng.random((300, 40)) < 0.15).astype(int))
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_label_documents(doc_vectors, max_workers, tmp_path):
+    words = [f"w{i}" for i in range(40)]
+    titles = [f"doc {i}" for i in range(300)]
+    topic_model = train_topic_model(
+        doc_vectors[:100], words, titles[:100], n_topics=4, anchors=None, max_iter=5
+    )
+    expected, _ = topic_model.transform(doc_vectors, details=True)
+    config = {"chunk_size": 70, "max_workers": max_workers, "seed": 0}
+    with mock.patch.dict("indicators.core.nlp_utils.SAMPLING", config):
+        label_documents(topic_model, doc_vectors, titles, tmp_path)
+    assert topic_model.p_y_given_x.shape == (300, 4)
+    assert np.allclose(topic_model.p_y_given_x, expected)
+    assert topic_model.labels.shape == (300, 4)
+    assert topic_model.n_samples == 300 and len(topic_model.docs) == 300
+    assert not any(tmp_path.iterdir())  # i.e. the memory-mapped labels are removed
+
+
+@mock.patch("indicators.core.nlp_utils.label_documents")
+def test_train_topic_model_sampled(mocked_label, doc_vectors):
+    words = [f"w{i}" for i in range(40)]
+    titles = [f"doc {i}" for i in range(300)]
+    strata = [2019] * 200 + [2020] * 100
+    topic_model = train_topic_model(
+        doc_vectors, words, titles, 4, None, max_iter=5, sample_size=60, strata=strata
+    )
+    assert topic_model.n_samples == 60  # i.e. fit on the sample
+    assert mocked_label.call_count == 1  # and then label the full corpus
+    mocked_label.reset_mock()
+    train_topic_model(doc_vectors, words, titles, 4, None, max_iter=5)
+    assert mocked_label.call_count == 0
+
+
+def test_deduplicate():
+    texts = ["a grant about cells", "a grant about cells", "another about mice"]
+    representatives, duplicate_of = deduplicate(texts, threshold=0.9)
+    assert representatives.tolist() == [0, 2]
+    assert duplicate_of.tolist() == [0, 0, 1]
+    representatives, duplicate_of = deduplicate(texts, threshold=None)
+    assert representatives.tolist() == [0, 1, 2]
+    assert duplicate_of is None
+
+
+def test_train_topic_model_deduplicated(doc_vectors):
+    words = [f"w{i}" for i in range(40)]
+    titles = [f"doc {i}" for i in range(400)]
+    duplicate_of = np.concatenate([np.arange(300), np.arange(100)])
+    topic_model = train_topic_model(
+        doc_vectors, words, titles, 4, None, max_iter=5, duplicate_of=duplicate_of
+    )
+    # Duplicates are labelled as their representative
+    assert topic_model.p_y_given_x.shape == (400, 4)
+    assert np.array_equal(topic_model.p_y_given_x[300:], topic_model.p_y_given_x[:100])
+    assert topic_model.n_samples == 400 and topic_model.docs == titles
+
+
+def test_write_topic_model(doc_vectors, tmp_path):
+    words = [f"w{i}" for i in range(40)]
+    titles = [f"doc {i}" for i in range(300)]
+    topic_model = train_topic_model(
+        doc_vectors, words, titles, 4, None, max_iter=5, convergence_tol=None
+    )
+    write_topic_model(topic_model, words, "topic-model-test", tmp_path)
+    trace = pd.read_csv(tmp_path / "topic-model-test" / "convergence.csv")
+    assert trace.columns.tolist() == ["iteration", "total_correlation", "seconds"]
+    assert trace.iteration.tolist() == [0, 1, 2, 3, 4]
+    assert (tmp_path / "topic-model-test" / "cont_labels.txt").exists()
+    assert (tmp_path / "topic-model-test" / "parameters.npz").exists()
+
+
+def test_load_previous_parameters(doc_vectors, tmp_path):
+    module = ModuleType("some_topics")
+    module.__file__ = str(tmp_path / "some_topics.py")
+    module.model_config = {"dataset_label": "some", "n_topics": 4, "max_iter": 5}
+    assert load_previous_parameters(module) is None
+
+    words = [f"w{i}" for i in range(40)]
+    titles = [f"doc {i}" for i in range(300)]
+    topic_model = train_topic_model(doc_vectors, words, titles, 4, None, max_iter=5)
+    write_topic_model(
+        topic_model, words, make_model_label(**module.model_config), tmp_path
+    )
+    parameters = load_previous_parameters(module)
+    assert parameters["words"].tolist() == words
+    module.model_config["n_topics"] = 5  # i.e. incompatible with the previous model
+    assert load_previous_parameters(module) is None
+
+
+@mock.patch(PATH.format("Ngrammer"))
+def test_label_new_objects(mocked_Ngrammer, doc_vectors, tmp_path):
+    mocked_Ngrammer.return_value.process_document.side_effect = lambda doc: [
+        doc.split()
+    ]
+    module = ModuleType("some_topics")
+    module.__file__ = str(tmp_path / "some_topics.py")
+    module.model_config = {"dataset_label": "some", "n_topics": 4, "max_iter": 5}
+    words = [f"w{i}" for i in range(40)]
+    titles = [f"doc {i}" for i in range(300)]
+    topic_model = train_topic_model(doc_vectors, words, titles, 4, None, max_iter=5)
+    write_topic_model(
+        topic_model, words, make_model_label(**module.model_config), tmp_path
+    )
+    objects = [
+        {"id": i, "created": "2021-01-01", "text": " ".join(np.array(words)[row])}
+        for i, row in enumerate(doc_vectors.toarray().astype(bool))
+    ]
+    write_object_labels(module, objects[:200], mock.Mock(p_y_given_x=np.ones((200, 4))))
+    # Unknown words are ignored
+    new_objects = [{**obj, "text": f"{obj['text']} unknown"} for obj in objects[200:]]
+    label_new_objects(module, new_objects)
+    labels = get_topic_labels(module, binary_threshold=None)
+    expected, _ = topic_model.transform(doc_vectors[200:], details=True)
+    assert labels.index.tolist() == list(range(300))
+    assert np.allclose(labels.values[200:], expected, atol=1e-6)
@@ -1,7 +1,11 @@
 from unittest import mock
+from types import ModuleType
+from indicators.core import nuts_utils
 from indicators.core.nuts_utils import (
     NutsFinder,
     get_nuts_info_lookup,
+    build_nuts_info_table,
+    read_nuts_info_table,
     iso_to_nuts,
     make_reverse_lookup,
     get_geo_lookup,
@@ -24,6 +28,46 @@ def test_get_nuts_info_lookup():
     assert len(lookup) > 2000
 
 
+@mock.patch("indicators.core.nuts_utils.NutsFinder")
+def test_build_nuts_info_table(mocked_nf, tmp_path):
+    properties = {"NUTS_ID": "UKD7", "NAME_LATN": "Merseyside", "LEVL_CODE": 2}
+    mocked_nf.return_value.shapes = {"features": [{"properties": properties}]}
+    path = tmp_path / "nuts_info.csv"
+    lookup = build_nuts_info_table(path)
+    assert read_nuts_info_table(path) == lookup
+    assert lookup["UKD7"] == {
+        "nuts_name": "Merseyside",
+        "nuts_level": 2,
+        "nuts_code": "UKD7",
+    }
+    assert lookup["BA"]["nuts_name"] == "Bosnia and Herzegovina"  # i.e. edge-case
+
+
+@mock.patch("indicators.core.nuts_utils.NutsFinder")
+def test_get_nuts_info_lookup_from_table(mocked_nf, tmp_path):
+    path = tmp_path / "nuts_info.csv"
+    path.write_text("nuts_code,nuts_name,nuts_level\nUKD7,Merseyside,2\n")
+    get_nuts_info_lookup.cache_clear()
+    with mock.patch.object(nuts_utils, "NUTS_INFO_PATH", path):
+        lookup = get_nuts_info_lookup()
+    get_nuts_info_lookup.cache_clear()
+    assert lookup["UKD7"]["nuts_level"] == 2
+    assert lookup["BA"]["nuts_name"] == "Bosnia and Herzegovina"
+    assert mocked_nf.call_count == 0  # i.e. the shapes weren't loaded
+
+
+@mock.patch("indicators.core.nuts_utils.NutsFinder")
+def test_get_nuts_info_lookup_fallback(mocked_nf, tmp_path, caplog):
+    properties = {"NUTS_ID": "UKD7", "NAME_LATN": "Merseyside", "LEVL_CODE": 2}
+    mocked_nf.return_value.shapes = {"features": [{"properties": properties}]}
+    get_nuts_info_lookup.cache_clear()
+    with mock.patch.object(nuts_utils, "NUTS_INFO_PATH", tmp_path / "missing.csv"):
+        lookup = get_nuts_info_lookup()
+    get_nuts_info_lookup.cache_clear()
+    assert lookup["UKD7"]["nuts_level"] == 2
+    assert "missing.csv not found" in caplog.text
+
+
 def test_iso_to_nuts():
     assert iso_to_nuts("GB") == "UK"
     assert iso_to_nuts("GR") == "EL"
@@ -33,23 +77,31 @@ def test_iso_to_nuts():
         assert iso_to_nuts(iso) == iso
 
 
+def as_lists(lookup):
+    return {code: ids.tolist() for code, ids in lookup.items()}
+
+
 def test_make_reverse_lookup():
     a = ("a", "AA")
     b = ("b", "BB")
     data = [(1, a), (2, b), (3, a), (4, a)]
-    assert make_reverse_lookup(data) == {str(a): {1, 3, 4}, str(b): {2}}
+    assert as_lists(make_reverse_lookup(data)) == {str(a): [1, 3, 4], str(b): [2]}
 
     def getter(item):
         return item[1][1]
 
-    assert make_reverse_lookup(data, key=getter) == {
-        "AA": {1, 3, 4},
-        "BB": {2},
+    assert as_lists(make_reverse_lookup(data, key=getter)) == {
+        "AA": [1, 3, 4],
+        "BB": [2],
     }
-    assert make_reverse_lookup(data, key=getter, prefix="something_") == {
-        "something_AA": {1, 3, 4},
-        "something_BB": {2},
+    assert as_lists(make_reverse_lookup(data, key=getter, prefix="something_")) == {
+        "something_AA": [1, 3, 4],
+        "something_BB": [2],
     }
+    # Ids are sorted and deduplicated, and null codes are dropped
+    data = [(3, "AA"), (1, "AA"), (3, "AA"), (2, None)]
+    assert as_lists(make_reverse_lookup(data)) == {"AA": [1, 3]}
+    assert make_reverse_lookup([]) == {}
 
 
 def test_get_geo_lookup():
@@ -60,13 +112,26 @@ def test_get_geo_lookup():
         ("Potterow", 55.9462, -3.1872),
     ]
     assert get_geo_lookup(mocked_module) is get_geo_lookup(mocked_module)
-    assert get_geo_lookup(mocked_module) == {
-        "UK": {"58VE", "Potterow"},
-        "UKI": {"58VE"},
-        "UKI6": {"58VE"},
-        "UKI62": {"58VE"},
-        "UKM": {"Potterow"},
-        "UKM7": {"Potterow"},
-        "UKM75": {"Potterow"},
-        "iso_GB": {"Something else"},
+    assert as_lists(get_geo_lookup(mocked_module)) == {
+        "UK": ["58VE", "Potterow"],
+        "UKI": ["58VE"],
+        "UKI6": ["58VE"],
+        "UKI62": ["58VE"],
+        "UKM": ["Potterow"],
+        "UKM7": ["Potterow"],
+        "UKM75": ["Potterow"],
+        "iso_GB": ["Something else"],
+    }
+
+
+@mock.patch("indicators.core.nuts_utils.NutsFinder")
+def test_get_geo_lookup_without_lat_lon(mocked_nf):
+    module = ModuleType("nuts_to_id_module")
+    module.get_nuts_to_id = lambda: [("a", "UKD7"), ("a", "UKD"), ("b", "UKD7")]
+    module.get_iso2_to_id = lambda: [("a", "GB"), ("b", "GB")]
+    assert as_lists(get_geo_lookup(module)) == {
+        "UKD": ["a"],
+        "UKD7": ["a", "b"],
+        "iso_GB": ["a", "b"],
     }
+    assert mocked_nf.call_count == 0  # i.e. the shapes weren't loaded
@@ -0,0 +1,101 @@
+import pytest
+from unittest import mock
+from indicators.core.pipeline_utils import (
+    Stage,
+    ArtifactStore,
+    artifact_address,
+    sort_stages,
+    run_pipeline,
+)
+
+
+@pytest.fixture
+def funcs():
+    return {
+        "fetch": mock.Mock(return_value=[1, 2, 3]),
+        "double": mock.Mock(
+            side_effect=lambda data, factor: [factor * x for x in data]
+        ),
+        "total": mock.Mock(side_effect=lambda data, doubled: sum(data) + sum(doubled)),
+    }
+
+
+def make_stages(funcs, factor=2):
+    return [
+        Stage("total", funcs["total"], inputs=["fetch", "double"]),
+        Stage("double", funcs["double"], inputs=["fetch"], params={"factor": factor}),
+        Stage("fetch", funcs["fetch"]),
+    ]
+
+
+def call_counts(funcs):
+    return {name: func.call_count for name, func in funcs.items()}
+
+
+def test_artifact_address():
+    stage = Stage("a stage", None, inputs=["b"], params={"x": 1})
+    address = artifact_address(stage, {"b": "digest"})
+    assert address == artifact_address(stage, {"b": "digest"})
+    assert address != artifact_address(stage, {"b": "another digest"})
+    assert address != artifact_address(stage._replace(params={"x": 2}), {"b": "digest"})
+
+
+def test_artifact_store(tmp_path):
+    store = ArtifactStore(tmp_path)
+    assert not store.exists("name", "address")
+    digest = store.save("name", "address", {"some": "data"})
+    assert store.exists("name", "address")
+    assert store.load("name", "address") == {"some": "data"}
+    assert store.load_digest("name", "address") == digest
+
+
+def test_sort_stages(funcs):
+    names = [stage.name for stage in sort_stages(make_stages(funcs))]
+    assert names == ["fetch", "double", "total"]
+    with pytest.raises(ValueError):
+        sort_stages([Stage("a", None, inputs=["b"]), Stage("b", None, inputs=["a"])])
+
+
+def test_run_pipeline(funcs, tmp_path):
+    store = ArtifactStore(tmp_path)
+    addresses = run_pipeline(make_stages(funcs), store)
+    assert store.load("total", addresses["total"]) == 18
+    assert call_counts(funcs) == {"fetch": 1, "double": 1, "total": 1}
+
+    # Everything is skipped on rerun
+    run_pipeline(make_stages(funcs), store)
+    assert call_counts(funcs) == {"fetch": 1, "double": 1, "total": 1}
+
+    # Refetching the same data doesn't trigger downstream stages
+    run_pipeline(make_stages(funcs), store, force=["fetch"])
+    assert call_counts(funcs) == {"fetch": 2, "double": 1, "total": 1}
+
+    # ...but new data does
+    funcs["fetch"].return_value = [1, 2]
+    addresses = run_pipeline(make_stages(funcs), store, force=["fetch"])
+    assert call_counts(funcs) == {"fetch": 3, "double": 2, "total": 2}
+    assert store.load("total", addresses["total"]) == 9
+
+    # As do changes to the parameters
+    addresses = run_pipeline(make_stages(funcs, factor=3), store)
+    assert call_counts(funcs) == {"fetch": 3, "double": 3, "total": 3}
+    assert store.load("total", addresses["total"]) == 12
+
+
+def test_run_pipeline_resume(funcs, tmp_path):
+    store = ArtifactStore(tmp_path)
+    funcs["total"].side_effect = RuntimeError("crash")
+    with pytest.raises(RuntimeError):
+        run_pipeline(make_stages(funcs), store)
+    funcs["total"].side_effect = lambda data, doubled: "fixed"
+    addresses = run_pipeline(make_stages(funcs), store)
+    assert call_counts(funcs) == {"fetch": 1, "double": 1, "total": 2}
+    assert store.load("total", addresses["total"]) == "fixed"
+
+
+def test_run_pipeline_until(funcs, tmp_path):
+    addresses = run_pipeline(
+        make_stages(funcs), ArtifactStore(tmp_path), until=["double"]
+    )
+    assert set(addresses) == {"fetch", "double"}
+    assert call_counts(funcs) == {"fetch": 1, "double": 1, "total": 0}
@@ -0,0 +1,97 @@
+import json
+import pytest
+from functools import lru_cache
+from indicators.core.cache_utils import CacheRegistry, memory_cache
+from indicators.core.profiling_utils import (
+    enable,
+    reset,
+    span,
+    timed,
+    cache_stats,
+    make_report,
+    write_report,
+)
+
+
+@pytest.fixture
+def enabled():
+    reset()
+    enable()
+    yield
+    enable(False)
+    reset()
+
+
+def test_span_disabled():
+    reset()
+    enable(False)
+    with span("a span", items=3):
+        pass
+    assert make_report()["spans"] == {}
+
+
+def test_span(enabled):
+    for _ in range(2):
+        with span("a span", items=3) as _span:
+            _span.add_items(2)
+            sum(range(10000))
+    stats = make_report()["spans"]["a span"]
+    assert stats["calls"] == 2
+    assert stats["items"] == 10
+    assert stats["wall_time"] > 0
+    assert stats["peak_rss_mb"] > 0
+
+
+def test_timed(enabled):
+    @timed("a function")
+    def func(n):
+        return list(range(n))
+
+    @timed("another function", items=None)
+    def other_func(n):
+        return list(range(n))
+
+    assert func(4) == [0, 1, 2, 3]
+    assert other_func(4) == [0, 1, 2, 3]
+    spans = make_report()["spans"]
+    assert spans["a function"]["items"] == 4
+    assert spans["another function"]["items"] == 0
+
+
+def test_cache_stats():
+    @lru_cache()
+    def func(n):
+        return n
+
+    func(1), func(1), func(1), func(2)
+    assert cache_stats(func=func) == {
+        "func": {"hits": 2, "misses": 2, "hit_rate": 0.5, "size": 2}
+    }
+
+
+def test_cache_stats_memory_cache():
+    @memory_cache(registry=CacheRegistry())
+    def func(n):
+        return "x" * n
+
+    func(1024**2), func(1024**2)
+    stats = cache_stats(func=func)["func"]
+    assert stats["hit_rate"] == 0.5
+    assert stats["evictions"] == 0
+    assert stats["mb"] == pytest.approx(1, rel=0.01)
+
+
+def test_write_report(enabled, tmp_path):
+    with span("a span"):
+        pass
+    write_report(tmp_path / "report.json")
+    with open(tmp_path / "report.json") as f:
+        report = json.load(f)
+    assert set(report) == {"spans", "caches", "peak_rss_mb"}
+    assert report["spans"]["a span"]["calls"] == 1
+
+
+def test_write_report_disabled(tmp_path):
+    enable(False)
+    write_report(tmp_path / "report.json")
+    assert not (tmp_path / "report.json").exists()
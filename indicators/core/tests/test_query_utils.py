@@ -0,0 +1,137 @@
+from threading import Thread
+from urllib.error import HTTPError
+from urllib.request import urlopen
+import json
+
+import pandas as pd
+import pytest
+
+from indicators.core.query_utils import IndicatorStore, geo_metadata, make_server
+
+
+@pytest.fixture
+def frame():
+    return pd.DataFrame(
+        [
+            ("nih", "UKI", 2, "relative_activity", "covid", 1.5),
+            ("nih", "UKI", 2, "total_activity", "covid", 10.0),
+            ("nih", "UKC", 2, "relative_activity", "covid", 0.5),
+            ("nih", "GB", 0, "relative_activity", "covid", 1.1),
+            ("arxiv", "UKI", 2, "relative_activity", "covid", 2.0),
+            ("arxiv", "UKI", 2, "relative_activity", "genes", 0.9),
+        ],
+        columns=[
+            "dataset_name",
+            "nuts_code",
+            "nuts_level",
+            "indicator_name",
+            "topic_name",
+            "indicator_value",
+        ],
+    )
+
+
+@pytest.fixture
+def store(frame):
+    return IndicatorStore(frame)
+
+
+def test_geo_metadata():
+    assert geo_metadata("iso_GB") == ("GB", 0)
+    assert geo_metadata("UKI") == ("UKI", 2)
+
+
+def test_query(store, frame):
+    result = store.query(
+        dataset_name="nih", nuts_code="UKI", indicator_name="relative_activity"
+    )
+    assert result.indicator_value.tolist() == [1.5]
+    result = store.query(nuts_code=["UKI", "UKC"], indicator_name="relative_activity")
+    assert result.indicator_value.tolist() == [1.5, 0.5, 2.0, 0.9]  # original order
+    assert store.query(nuts_level=0).nuts_code.tolist() == ["GB"]
+    assert store.query(topic_name="genes", dataset_name="nih").empty
+    assert store.query(nuts_code="XX").empty
+    pd.testing.assert_frame_equal(store.query(), frame)
+
+
+def test_query_cache(store):
+    store.query(nuts_code="UKI", topic_name="covid")
+    store.query(topic_name="covid", nuts_code=["UKI"])  # i.e. the same query
+    assert store.cache_info().hits == 1
+
+
+def test_query_bad_column(store):
+    with pytest.raises(ValueError):
+        store.query(indicator_value=1)
+
+
+def test_records(store):
+    assert store.records(dataset_name="arxiv", topic_name="genes") == [
+        {
+            "dataset_name": "arxiv",
+            "nuts_code": "UKI",
+            "nuts_level": 2,
+            "indicator_name": "relative_activity",
+            "topic_name": "genes",
+            "indicator_value": 0.9,
+        }
+    ]
+
+
+def test_from_indicators():
+    indicators = {
+        "nih": {
+            "projects": {
+                "UKI": {"relative_activity": {"covid": 1.5, "genes": 0}},
+                "iso_GB": {"relative_activity": {"covid": 1.1}},
+            }
+        }
+    }
+    store = IndicatorStore.from_indicators(indicators)
+    assert len(store) == 2  # i.e. without zeros
+    assert store.query(nuts_level=0).nuts_code.tolist() == ["GB"]
+
+
+def test_from_local(store, tmp_path):
+    for (dataset, topic), frame in store.query().groupby(
+        ["dataset_name", "topic_name"]
+    ):
+        path = tmp_path / dataset / topic / "nuts-1.csv"
+        path.parent.mkdir(parents=True)
+        frame.drop(columns=["dataset_name", "topic_name"]).to_csv(path, index=False)
+    local_store = IndicatorStore.from_local(tmp_path)
+    assert len(local_store) == len(store)
+    assert local_store.query(nuts_code="UKC").indicator_value.tolist() == [0.5]
+
+
+def test_from_parquet(frame, tmp_path):
+    path = tmp_path / "indicators.parquet"
+    frame.to_parquet(path, partition_cols=["dataset_name", "nuts_level"])
+    store = IndicatorStore.from_parquet(path)
+    assert store.query(dataset_name="nih", nuts_level=2).indicator_value.tolist() == [
+        1.5,
+        10.0,
+        0.5,
+    ]
+
+
+def test_server(store):
+    server = make_server(store, port=0)
+    Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://localhost:{server.server_address[1]}"
+    try:
+        query = "indicators?nuts_code=UKI&nuts_code=UKC&nuts_level=2&topic_name=covid"
+        with urlopen(f"{url}/{query}") as response:
+            records = json.load(response)
+        assert [record["indicator_value"] for record in records] == [
+            1.5,
+            10.0,
+            0.5,
+            2.0,
+        ]
+        with pytest.raises(HTTPError) as error:
+            urlopen(f"{url}/indicators?colour=red")
+        assert error.value.code == 400
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,124 @@
+import multiprocessing
+import os
+import time
+
+import pytest
+
+from indicators.core.shard_utils import WorkQueue, partition, run_worker
+
+
+def square(spec):
+    if spec == "bad":
+        raise ValueError("bad shard")
+    return spec**2
+
+
+def slow_square(spec):
+    time.sleep(0.01)
+    return os.getpid(), square(spec)
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return WorkQueue(tmp_path / "queue")
+
+
+def test_partition():
+    sizes = {"a": 10, "b": 7, "c": 5, "d": 3, "e": 2, "f": 0}
+    shards = partition(sizes, 3)
+    assert sorted(key for shard in shards for key in shard) == sorted(sizes)
+    totals = sorted(sum(sizes[key] for key in shard) for shard in shards)
+    assert totals == [8, 9, 10]
+    assert partition(dict(reversed(sizes.items())), 3) == shards  # deterministic
+    assert partition({"a": 1}, 3) == [["a"]]  # i.e. no empty shards
+    assert partition(sizes, 0) == [sorted(sizes)]
+
+
+def test_work_queue(queue):
+    assert not queue.is_published()
+    queue.publish({"s0": 1, "s1": 2}, manifest="some manifest")
+    assert queue.load_manifest() == "some manifest"
+    assert queue.claim() == ("s0", 1)
+    assert queue.claim() == ("s1", 2)
+    assert queue.claim() is None
+    assert not queue.is_finished()
+    queue.complete("s0", 10)
+    queue.complete("s1", 20)
+    assert queue.is_finished()
+    assert queue.results() == {"s0": 10, "s1": 20}
+
+
+def test_work_queue_failed(queue):
+    queue.publish({"s0": 1, "s1": "bad", "s2": 3})
+    assert run_worker(queue, square) == 3
+    assert queue.is_finished()
+    assert "bad shard" in queue.path("failed", "s1").read_text()
+    with pytest.raises(RuntimeError, match="s1"):
+        queue.results()
+
+
+def test_requeue_failed(queue):
+    queue.publish({"s0": 1, "s1": "bad"})
+    run_worker(queue, square)
+    assert queue.requeue_failed() == ["s1"]
+    assert queue.shard_ids("failed") == [] and not queue.is_finished()
+    assert queue.claim() == ("s1", "bad")
+    queue.complete("s1", 4)
+    assert queue.results() == {"s0": 1, "s1": 4}
+    assert queue.requeue_failed() == []
+
+
+def test_clear(queue):
+    queue.publish({"s0": 1, "s1": "bad"}, fingerprint="abc")
+    assert not queue.is_out_of_date("abc")
+    assert queue.is_out_of_date("def")
+    run_worker(queue, square)
+    queue.clear()
+    assert not queue.is_published()
+    assert all(queue.shard_ids(state) == [] for state in queue.STATES)
+    queue.publish({"s2": 2}, fingerprint="def")
+    assert run_worker(queue, square) == 1
+    assert queue.results() == {"s2": 4}
+
+
+def test_work_queue_unfinished(queue):
+    queue.publish({"s0": 1, "s1": 2})
+    queue.claim()
+    with pytest.raises(RuntimeError, match="s0, s1"):
+        queue.results()
+
+
+def test_requeue_stale(queue):
+    queue.publish({"s0": 1})
+    queue.claim()
+    queue.requeue_stale(timeout=60)
+    assert queue.claim() is None  # i.e. not yet stale
+    queue.requeue_stale(timeout=-1)
+    assert queue.claim() == ("s0", 1)
+    # The original worker finishes after all, after the shard was requeued
+    queue.requeue_stale(timeout=-1)
+    queue.complete("s0", 1)
+    assert queue.claim() is None
+    assert queue.results() == {"s0": 1}
+
+
+def test_run_worker_processes(queue):
+    """Several workers, started before the queue is published, process every
+    shard exactly once"""
+    workers = [
+        multiprocessing.Process(
+            target=run_worker,
+            args=(WorkQueue(queue.directory), slow_square),
+            kwargs={"wait": True, "poll_interval": 0.01},
+        )
+        for _ in range(4)
+    ]
+    for worker in workers:
+        worker.start()
+    queue.publish({f"s{i:02d}": i for i in range(40)})
+    for worker in workers:
+        worker.join(timeout=30)
+        assert worker.exitcode == 0
+    results = queue.results()
+    assert [square for _, square in results.values()] == [i**2 for i in range(40)]
+    assert len({pid for pid, _ in results.values()}) > 1
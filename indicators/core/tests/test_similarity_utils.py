@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from indicators.core.similarity_utils import normalise_rows, top_k_similar
+
+
+@pytest.fixture
+def matrix():
+    rng = np.random.default_rng(0)
+    matrix = rng.poisson(2.0, (50, 8)).astype(float)
+    matrix[[3, 17]] = 0  # i.e. regions without any activity
+    return matrix
+
+
+def brute_force_similarities(matrix):
+    vectors = normalise_rows(matrix)
+    similarities = vectors @ vectors.T
+    np.fill_diagonal(similarities, -np.inf)
+    similarities[:, ~matrix.any(axis=1)] = -np.inf
+    return similarities
+
+
+def test_normalise_rows():
+    vectors = normalise_rows([[3, 4], [0, 0]])
+    assert vectors.tolist() == [[0.6, 0.8], [0, 0]]
+
+
+@pytest.mark.parametrize("block_size", [1, 7, 1024])
+def test_top_k_similar(matrix, block_size):
+    neighbours, similarities = top_k_similar(matrix, 5, block_size=block_size)
+    assert neighbours.shape == similarities.shape == (50, 5)
+    expected = brute_force_similarities(matrix)
+    for row in range(50):
+        if row in (3, 17):  # i.e. rows of zeros have no neighbours
+            assert (neighbours[row] == -1).all()
+            assert np.isnan(similarities[row]).all()
+            continue
+        assert row not in neighbours[row] and not {3, 17} & set(neighbours[row])
+        assert np.allclose(similarities[row], expected[row, neighbours[row]])
+        assert np.allclose(similarities[row], np.sort(expected[row])[::-1][:5])
+        assert (np.diff(similarities[row]) <= 0).all()
+
+
+def test_top_k_similar_groups(matrix):
+    groups = np.arange(50) % 3
+    neighbours, _ = top_k_similar(matrix, 5, groups=groups, block_size=8)
+    for row in range(50):
+        found = neighbours[row][neighbours[row] >= 0]
+        assert (groups[found] == groups[row]).all()
+
+
+def test_top_k_similar_padded():
+    matrix = np.array([[1, 0], [1, 1], [0, 1]])
+    neighbours, similarities = top_k_similar(matrix, 4)
+    assert neighbours[0].tolist() == [1, 2, -1, -1]
+    assert np.allclose(
+        similarities[0], [np.sqrt(0.5), 0, np.nan, np.nan], equal_nan=True
+    )
+    neighbours, _ = top_k_similar(np.zeros((0, 2)), 3)
+    assert neighbours.shape == (0, 3)
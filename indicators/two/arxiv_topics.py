@@ -5,20 +5,37 @@ arxiv_topics
 Topic modelling of the arXiv data.
 """
 
-from functools import lru_cache
 import logging
 
 from indicators.core.config import EU_COUNTRIES, ARXIV_CONFIG
-from indicators.core.db import get_mysql_engine
+from indicators.core.core_utils import count_objects, to_columns
+from indicators.core.cache_utils import disk_cache, memory_cache
+from indicators.core.db import data_version, get_mysql_engine
+from indicators.core.profiling_utils import timed
 from nesta.core.orms.arxiv_orm import Article as Art
 from nesta.core.orms.arxiv_orm import ArticleInstitute as Link
 from nesta.core.orms.grid_orm import Institute as Inst
 from nesta.core.orms.orm_utils import db_session
 
 model_config = ARXIV_CONFIG  # Specify the model config here
+# Fields which can be selected in `get_objects`, and their columns
+FIELDS = {
+    "id": Art.id,
+    "text": Art.abstract,
+    "title": Art.title,
+    "created": Art.created,
+}
 
 
-@lru_cache()
+@memory_cache()
+def get_data_version():
+    """Version of the arXiv data, for keying the cached query results"""
+    return data_version(Art.created, Link.article_id, Inst.id)
+
+
+@memory_cache()
+@disk_cache("arxiv", version=get_data_version)
+@timed("fetch.arxiv.get_lat_lon")
 def get_lat_lon():
     """Get all institutes in arXiv which are in Europe
 
@@ -36,14 +53,16 @@ def get_lat_lon():
         for field in (Inst.id, Art.id, Inst.latitude, Inst.longitude):
             q = q.filter(field.isnot(None))
         # Skip institutes outside of Europe
-        q = q.filter(Inst.country_code.in_(EU_COUNTRIES))
+        q = q.filter(Inst.country_code.in_(list(EU_COUNTRIES)))
         # Group by, in order to deduplicate institutes
         q = q.group_by(Inst.id)
         # Make the request
         return list(q.all())
 
 
-@lru_cache()
+@memory_cache()
+@disk_cache("arxiv", version=get_data_version)
+@timed("fetch.arxiv.get_iso2_to_id")
 def get_iso2_to_id():
     """
     Fetch and curate a lookup table of ISO2 code to
@@ -59,24 +78,36 @@ def get_iso2_to_id():
         return list(q.all())
 
 
-@lru_cache()
-def get_objects(from_date):
+@memory_cache()
+@disk_cache("arxiv", version=get_data_version)
+@timed("fetch.arxiv.get_objects", items=count_objects)
+def get_objects(from_date, fields=None):
     """Get all arXiv articles from a given start date.
 
     Args:
         from_date (str, optional): Min article creation date.
+        fields (tuple, optional): Only select these `FIELDS`, e.g. ("id", "created")
 
     Returns:
-        articles (list): List of arXiv article data.
+        articles (list): List of arXiv article data, or if `fields` are
+                         specified then a dict of {field: array}.
     """
     logging.info(f"Retrieving articles from at least '{from_date}'")
     engine = get_mysql_engine()
     with db_session(engine) as session:
-        query = session.query(Art.id, Art.abstract, Art.title, Art.created)
+        query = session.query(*(FIELDS[field] for field in fields or FIELDS))
         query = query.filter(Art.created >= from_date)
         query = query.filter(Art.abstract.isnot(None))
+        # Order consistently, since the topic labels are aligned by row
+        query = query.order_by(Art.id)
+        if fields is not None:
+            return to_columns(query.all(), fields)
         articles = [
             dict(id=id, text=abstract, title=title, created=created)
             for id, abstract, title, created in query.all()
         ]
     return articles
+
+
+# Independent DB queries, which can be prefetched concurrently
+prefetch_queries = (get_lat_lon, get_iso2_to_id)
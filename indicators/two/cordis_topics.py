@@ -5,18 +5,28 @@ cordis_topics
 Topic modelling of the Cordis data.
 """
 
-from functools import lru_cache
 import logging
 
 from indicators.core.config import CORDIS_CONFIG
+from indicators.core.core_utils import count_objects, to_columns
 from indicators.core.nuts_utils import iso_to_nuts
-from indicators.core.db import get_mysql_engine
+from indicators.core.cache_utils import disk_cache, memory_cache
+from indicators.core.db import data_version, get_mysql_engine
+from indicators.core.profiling_utils import timed
 from nesta.core.orms.cordis_orm import Project
 from nesta.core.orms.cordis_orm import Organisation as Org
 from nesta.core.orms.cordis_orm import ProjectOrganisation as Link
 from nesta.core.orms.orm_utils import db_session
 
 model_config = CORDIS_CONFIG  # Specify the model config here
+# Fields which can be selected in `get_objects`, and their columns
+FIELDS = {
+    "id": Project.rcn,
+    "text": Project.objective,
+    "title": Project.title,
+    "created": Project.start_date_code,
+    "funding": Project.total_cost,
+}
 
 
 def get_nuts_to_id():
@@ -27,7 +37,15 @@ def get_nuts_to_id():
     return [(rcn, iso_to_nuts(iso)) for rcn, iso in get_iso2_to_id()]
 
 
-@lru_cache()
+@memory_cache()
+def get_data_version():
+    """Version of the CORDIS data, for keying the cached query results"""
+    return data_version(Project.rcn, Link.project_rcn, Org.id)
+
+
+@memory_cache()
+@disk_cache("cordis", version=get_data_version)
+@timed("fetch.cordis.get_iso2_to_id")
 def get_iso2_to_id():
     """
     Fetch and curate a lookup table of ISO2 code to
@@ -42,28 +60,34 @@ def get_iso2_to_id():
         return list(query.all())
 
 
-@lru_cache()
-def get_objects(from_date):
+@memory_cache()
+@disk_cache("cordis", version=get_data_version)
+@timed("fetch.cordis.get_objects", items=count_objects)
+def get_objects(from_date, fields=None):
     """Get all arXiv articles from a given start date.
 
     Args:
         from_date (str, optional): Min article creation date.
+        fields (tuple, optional): Only select these `FIELDS`, e.g. ("id", "created")
 
     Returns:
-        articles (list): List of arXiv article data.
+        articles (list): List of arXiv article data, or if `fields` are
+                         specified then a dict of {field: array}.
     """
     logging.info(f"Retrieving projects from at least {from_date}")
     engine = get_mysql_engine()
     with db_session(engine) as session:
-        query = session.query(
-            Project.rcn,
-            Project.objective,
-            Project.title,
-            Project.start_date_code,
-            Project.total_cost,
-        )
+        query = session.query(*(FIELDS[field] for field in fields or FIELDS))
         query = query.filter(Project.start_date_code > from_date)
+        # Order consistently, since the topic labels are aligned by row
+        query = query.order_by(Project.rcn)
+        if fields is not None:
+            return to_columns(query.all(), fields)
         return [
             dict(id=rcn, text=text, title=title, created=date, funding=funding)
             for rcn, text, title, date, funding in query.all()
         ]
+
+
+# Independent DB queries, which can be prefetched concurrently
+prefetch_queries = (get_iso2_to_id,)
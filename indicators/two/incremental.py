@@ -0,0 +1,363 @@
+"""
+incremental
+===========
+
+Incremental updates of the thematic indicators, for when only a few new
+objects (e.g. a week's worth of NIH projects) have arrived since the last run:
+
+    python incremental.py --datasets nih
+
+Every indicator is derived from sums of the (weighted) topic labels of the
+objects in each geography, split by covid-relatedness and date window. These
+sums are persisted as the additive state of each set of indicators (see
+`incremental` in `indicators.yaml`):
+
+    {state_dir}/{label}.pkl
+
+Each update adds the labels of only the objects which are new since the last
+update to the state, re-derives the indicators of only the geographies which
+contain new objects, and then rewrites only the output files (i.e. of each
+topic and level of geography) in which any indicator has changed. New objects
+which aren't yet in the label store are first labelled with the saved topic
+model (if `label_new_objects`), and are otherwise left for a later update.
+
+The state is rebuilt from all objects (i.e. as by `thematic_indicators.py`)
+if the topic model, the date ranges or the weighting have changed since it
+was saved, or if forced with `--full`. Sampled (preview) objects, bootstrap
+intervals and topic networks aren't additive, and so aren't supported.
+"""
+
+from argparse import ArgumentParser
+from collections import defaultdict
+from importlib import import_module
+from pathlib import Path
+import json
+import logging
+
+from indicators.core.config import INDICATORS
+from indicators.core.core_utils import INDICATOR_FIELDS, make_id_index, to_positions
+from indicators.core.indicator_utils import (
+    make_filename,
+    make_sinks,
+    prepare_file_data,
+    safe_divide,
+    sort_and_filter_data,
+    write_to_sinks,
+)
+from indicators.core.label_utils import load_labels
+from indicators.core.lazy_utils import LazyConfig, LazyModule
+from indicators.core.nlp_utils import (
+    get_clean_topics,
+    get_label_store_path,
+    has_label_store,
+    label_new_objects,
+    parse_corex_paths,
+)
+from indicators.core.nuts_utils import get_geo_lookup
+from indicators.core.pipeline_utils import digest
+from indicators.core.shard_utils import dump, load
+from indicators.two.thematic_indicators import (
+    BOOTSTRAP,
+    DATE_LABELS,
+    TOPIC_NETWORK,
+    alpha_diversity,
+    covid_topic_indexer,
+    date_norm,
+    date_slicer,
+    get_objects_and_topics,
+    indicator_jobs,
+)
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+INCREMENTAL = LazyConfig(lambda: INDICATORS["incremental"])
+DATASETS = ("arxiv", "nih", "cordis")
+
+
+def make_fingerprint(topic_module, weight_field, topics):
+    """Digest of everything other than the objects on which the state of a set
+    of indicators depends, i.e. the topic model and the clean topics, the date
+    ranges and the weighting"""
+    corex_topics = parse_corex_paths(topic_module)["topics"].read_bytes()
+    spec = {
+        "corex_topics": digest(corex_topics),
+        "topics": sorted(topics),
+        "dates": {label: INDICATORS[label] for label in DATE_LABELS},
+        "weight_field": weight_field,
+    }
+    return digest(json.dumps(spec, sort_keys=True, default=str).encode())
+
+
+def make_state(fingerprint, topics, ids):
+    """An empty state, for objects of the same id type as `ids`
+
+    Returns:
+        state (dict): The ids of the objects which have been added, the topics
+                      (in order), and the `activity_sums` and indicators of
+                      each geography
+    """
+    return {
+        "fingerprint": fingerprint,
+        "topics": list(topics),
+        "ids": np.asarray(ids)[:0],
+        "sums": {},
+        "indicators": {},
+    }
+
+
+def date_indexer(objects):
+    """Boolean indexer of the objects in each of the `DATE_LABELS` date ranges
+    (as `date_slicer`), and since the start of "covid times" (as
+    `thematic_diversity`), of shape (n_objects, 3)"""
+    slicers = [np.asarray(date_slicer(objects, label)[0]) for label in DATE_LABELS]
+    from_date = INDICATORS["covid_dates"]["from_date"]
+    since_covid = np.asarray(objects["created"] > pd.to_datetime(from_date))
+    return np.column_stack([*slicers, since_covid])
+
+
+def activity_sums(objects, topics, is_covid):
+    """Sums of the (weighted) topic labels of the objects, from which every
+    indicator of `generate_indicators` can be derived, and which can therefore
+    be updated by adding the sums of new objects.
+
+    Args:
+        objects (DataFrame): Objects over which to sum activity
+        topics (DataFrame): CorEx's binary labels matrix (or reweighted equivalent)
+        is_covid (Series): boolean indexer of the covid-related objects
+    Returns:
+        sums (np.array): Of shape (2, 3, n_topics), i.e. by non-covid/covid, by
+                         date range (see `date_indexer`) and by topic
+    """
+    is_covid = np.asarray(is_covid)
+    by_covid = np.column_stack([~is_covid, is_covid]).astype(np.float64)
+    by_date = date_indexer(objects).astype(np.float64)
+    # NaN weights count for nothing, as when summing with pandas
+    values = np.nan_to_num(topics.to_numpy(dtype=np.float64))
+    return np.einsum("oc,od,ot->cdt", by_covid, by_date, values, optimize=True)
+
+
+def derive_indicators(sums, topics):
+    """The indicators of `generate_indicators`, from the `activity_sums` of
+    the objects in a geography"""
+    norm_covid, norm_precovid = (date_norm(label) for label in DATE_LABELS)
+
+    def activity(values, norm):
+        return norm * pd.Series(values, index=topics).sort_values()
+
+    def relative_activity(sums):
+        return safe_divide(
+            activity(sums[0], norm_covid), activity(sums[1], norm_precovid)
+        )
+
+    noncovid, covid = sums
+    total = noncovid + covid
+    indicators = {
+        "total_activity": activity(total[0], norm_covid),
+        "relative_activity": relative_activity(total),
+        "relative_activity_covid": relative_activity(covid),
+        "relative_activity_noncovid": relative_activity(noncovid),
+        "thematic_diversity": {
+            "covid-related-projects": alpha_diversity.shannon(
+                pd.Series(covid[2], index=topics)
+            ),
+            "non-covid-related-projects": alpha_diversity.shannon(
+                pd.Series(noncovid[2], index=topics)
+            ),
+        },
+    }
+    indicators["overrepresentation_activity"] = safe_divide(
+        indicators["relative_activity_covid"], indicators["relative_activity_noncovid"]
+    )
+    return {k: dict(v) for k, v in indicators.items()}
+
+
+def changed_topics(indicators, previous):
+    """Topics (or equivalent, for thematic diversity) of any indicator whose
+    value differs from its previous value"""
+    return {
+        topic
+        for name, values in indicators.items()
+        for topic, value in values.items()
+        if previous.get(name, {}).get(topic) != value
+    }
+
+
+def label_pending(topic_module, ids):
+    """Label the objects (of the given ids) which aren't yet in the label store
+    with the saved topic model, see `label_new_objects`
+
+    Returns:
+        n_labelled (int): Number of objects labelled
+    """
+    stored_ids, _ = load_labels(get_label_store_path(topic_module), ids=ids)
+    unlabelled = set(np.setdiff1d(ids, stored_ids).tolist())
+    if not unlabelled:
+        return 0
+    from_date = INDICATORS["precovid_dates"]["from_date"]
+    objects = [
+        obj
+        for obj in topic_module.get_objects(from_date=from_date)
+        if obj["id"] in unlabelled
+    ]
+    logging.info(f"Labelling {len(objects)} new objects of {topic_module.__name__}")
+    label_new_objects(topic_module, objects)
+    return len(objects)
+
+
+def update_indicators(topic_module, weight_field, state, full=False):
+    """Add the objects which are new since the state was last updated to the
+    state, and re-derive the indicators of the geographies containing them
+
+    Args:
+        topic_module (module): A topic module, e.g. nih_topics
+        weight_field (str): As for `generate_indicators`
+        state (dict): The saved state, or None to build a new one
+        full (bool): Rebuild the state from all objects, regardless.
+    Returns:
+        state (dict): The updated state, which is unsaved
+        changed (dict): Topics whose indicators have changed, by geography
+    Raises:
+        ValueError: If the indicators can't be updated incrementally
+    """
+    if getattr(topic_module, "sample_strata", None) is not None:
+        raise ValueError("Indicators of sampled objects can't be updated")
+    if BOOTSTRAP["enabled"]:
+        raise ValueError("Bootstrap intervals can't be updated, run in full instead")
+    if TOPIC_NETWORK["enabled"]:
+        raise ValueError("Topic networks can't be updated, run in full instead")
+    if not has_label_store(topic_module):
+        raise ValueError(
+            f"{topic_module.__name__} has no label store, run make_topics.py first"
+        )
+    from_date = INDICATORS["precovid_dates"]["from_date"]
+    objects = topic_module.get_objects(from_date=from_date, fields=INDICATOR_FIELDS)
+    ids = np.asarray(objects["id"])
+    topics = get_clean_topics(topic_module)
+    fingerprint = make_fingerprint(topic_module, weight_field, topics)
+    if state is not None and state["fingerprint"] != fingerprint:
+        logging.info(f"The state of {topic_module.__name__} is out of date")
+    if full or state is None or state["fingerprint"] != fingerprint:
+        logging.info(f"Building the state of {topic_module.__name__} from scratch")
+        state = make_state(fingerprint, topics, ids)
+
+    is_new = ~np.isin(ids, state["ids"])
+    if INCREMENTAL["label_new_objects"]:
+        label_pending(topic_module, ids[is_new])
+    # Objects which still aren't labelled are left for a later update
+    stored_ids, _ = load_labels(get_label_store_path(topic_module), ids=ids[is_new])
+    n_unlabelled = is_new.sum() - len(stored_ids)
+    is_new &= np.isin(ids, stored_ids)
+    positions = np.flatnonzero(is_new)
+    logging.info(
+        f"Adding {len(positions)} new objects of {topic_module.__name__} "
+        f"({n_unlabelled} are unlabelled, and so are left for a later update)"
+    )
+    if len(positions) == 0:
+        return state, {}
+
+    new_objects, new_topics = get_objects_and_topics(
+        topic_module, positions, weight_field
+    )
+    # In the order of the state, such that the same covid topic is chosen
+    new_topics = new_topics[state["topics"]]
+    is_covid = covid_topic_indexer(new_topics)
+    id_index = make_id_index(new_objects["id"].values)
+    changed = {}
+    for geo_code, geo_ids in get_geo_lookup(topic_module).items():
+        rows = to_positions(id_index, geo_ids)
+        if len(rows) == 0:
+            continue
+        sums = activity_sums(
+            new_objects.iloc[rows], new_topics.iloc[rows], is_covid.iloc[rows]
+        )
+        if geo_code in state["sums"]:
+            sums += state["sums"][geo_code]
+        state["sums"][geo_code] = sums
+        indicators = derive_indicators(sums, state["topics"])
+        previous = state["indicators"].get(geo_code, {})
+        changed[geo_code] = changed_topics(indicators, previous)
+        state["indicators"][geo_code] = indicators
+    state["ids"] = np.union1d(state["ids"], ids[positions])
+    return state, changed
+
+
+def select_partitions(indicators, changed):
+    """The indicators of every geography in each output file (i.e. of a topic
+    and level of geography) which contains any changed indicator, such that
+    only those files are rewritten, in full
+
+    Args:
+        indicators (dict): Indicators of every geography, from the state
+        changed (dict): Topics whose indicators have changed, by geography
+    """
+    partitions = {
+        (topic, make_filename(geo_code))
+        for geo_code, topics in changed.items()
+        for topic in topics
+    }
+    filenames = {filename for _, filename in partitions}
+    selected = {}
+    for geo_code, geo_indicators in indicators.items():
+        filename = make_filename(geo_code)
+        if filename not in filenames:
+            continue
+        selected[geo_code] = {
+            name: {
+                topic: value
+                for topic, value in values.items()
+                if (topic, filename) in partitions
+            }
+            for name, values in geo_indicators.items()
+        }
+    return selected
+
+
+def run_incremental(modules, state_dir=None, full=False, sinks=None):
+    """Update the indicators of each topic module with its new objects, and
+    rewrite only the changed output files with the output sinks. Each state is
+    only saved once the output has been written, such that an update which
+    fails is simply repeated.
+
+    Args:
+        modules (list): Topic modules, e.g. [nih_topics]
+        state_dir (path-like, optional): Directory of the state of each set of
+                                         indicators, by default as in the config
+        full (bool): Rebuild every state (and output file) from all objects.
+        sinks (list, optional): Output sinks, by default as in `output_sinks`.
+    Returns:
+        sorted_file_data (dict): The rewritten indicators, by file path
+    """
+    state_dir = INCREMENTAL["state_dir"] if state_dir is None else state_dir
+    states = {}
+    indicators = defaultdict(dict)
+    for label, entity, module, weight_field in indicator_jobs(modules):
+        path = Path(state_dir) / f"{label}.pkl"
+        state = load(path) if path.exists() else None
+        state, changed = update_indicators(module, weight_field, state, full=full)
+        logging.info(f"Indicators of {len(changed)} geographies changed for {label}")
+        indicators[label][entity] = select_partitions(state["indicators"], changed)
+        states[path] = state
+    sorted_file_data = sort_and_filter_data(prepare_file_data(indicators))
+    if sinks is None:
+        sinks = make_sinks(INDICATORS["output_sinks"])
+    write_to_sinks(sorted_file_data, sinks)
+    for path, state in states.items():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        dump(path, state)
+    logging.info(f"Rewrote {len(sorted_file_data)} sets of indicators")
+    return sorted_file_data
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Update indicators with new objects only")
+    parser.add_argument("--datasets", nargs="+", choices=DATASETS, default=DATASETS)
+    parser.add_argument("--state-dir", default=INCREMENTAL["state_dir"])
+    parser.add_argument(
+        "--full", action="store_true", help="Rebuild the state from all objects"
+    )
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    modules = [import_module(f"indicators.two.{name}_topics") for name in args.datasets]
+    run_incremental(modules, state_dir=args.state_dir, full=args.full)
@@ -0,0 +1,45 @@
+"""
+list_topics
+===========
+
+List the clean topics of each topic model, for example:
+
+    python -m indicators.two.list_topics arxiv nih
+
+This reads only the CorEx output and config, and so (unlike importing the
+topic modules, which import the database ORMs) starts quickly.
+"""
+
+from argparse import ArgumentParser
+from pathlib import Path
+from types import ModuleType
+
+from indicators.core.config import load_yaml
+from indicators.core.nlp_utils import parse_clean_topics
+
+DATASETS = ("arxiv", "nih", "cordis")
+
+
+def make_config_module(dataset):
+    """A stand-in for a topic module, with only the attributes required for
+    locating its CorEx output (i.e. `model_config` and `__file__`)"""
+    module = ModuleType(f"{dataset}_topics")
+    module.__file__ = str(Path(__file__).parent / f"{dataset}_topics.py")
+    module.model_config = load_yaml(dataset)
+    return module
+
+
+def list_topics(dataset):
+    """Clean topics of the dataset's topic model, in order of popularity"""
+    labels = parse_clean_topics(make_config_module(dataset))
+    return labels.sum(axis=0).sort_values(ascending=False)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="List the clean topics of each topic model")
+    parser.add_argument("datasets", nargs="*", choices=DATASETS, default=DATASETS)
+    args = parser.parse_args()
+    for dataset in args.datasets:
+        print(f"{dataset}:")
+        for topic, count in list_topics(dataset).items():
+            print(f"    {topic} ({count})")
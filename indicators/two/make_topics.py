@@ -1,9 +1,57 @@
+"""
+make_topics
+===========
+
+Fit the topic model of each dataset, with each dataset's fetch, vectorise and
+fit running in its own process:
+
+    python make_topics.py --datasets arxiv nih --max-workers 2
+
+The concurrency, memory budget and log directory default to `topic_jobs` in
+`indicators.yaml`. Each dataset's log and exit status are written to the log
+directory, and a failure in one dataset doesn't affect the others' models.
+"""
+
+from argparse import ArgumentParser
+from importlib import import_module
+import logging
+import sys
+
+from indicators.core.config import INDICATORS
+from indicators.core.job_utils import run_jobs
 from indicators.core.nlp_utils import fit_topic_model
-from indicators.two import arxiv_topics, nih_topics, cordis_topics
-
-for module in (
-    arxiv_topics,
-    nih_topics,
-    cordis_topics,
-):  # Can append new modules as they arise
-    fit_topic_model(module)
+
+DATASETS = ("arxiv", "nih", "cordis")  # Can append new modules as they arise
+
+
+def fit_dataset(dataset):
+    """Fit the topic model of the dataset. The topic module is imported here,
+    so that each job makes its own database connections"""
+    fit_topic_model(import_module(f"indicators.two.{dataset}_topics"))
+
+
+def make_topics(datasets=DATASETS, **job_config):
+    """Fit the topic model of each dataset, each as a job in its own process
+
+    Returns:
+        exitcodes (dict): Exit code of each dataset's job
+    """
+    jobs = {dataset: (fit_dataset, (dataset,)) for dataset in datasets}
+    return run_jobs(jobs, **{**INDICATORS["topic_jobs"], **job_config})
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Fit the topic model of each dataset")
+    parser.add_argument("--datasets", nargs="+", choices=DATASETS, default=DATASETS)
+    parser.add_argument("--max-workers", type=int)
+    parser.add_argument("--memory-budget-mb", type=float)
+    parser.add_argument("--log-dir")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    job_config = {k: v for k, v in vars(args).items() if v is not None}
+    exitcodes = make_topics(**job_config)
+    failed = sorted(dataset for dataset, code in exitcodes.items() if code != 0)
+    if failed:
+        logging.error(f"Topic modelling failed for: {', '.join(failed)}")
+        sys.exit(1)
@@ -5,19 +5,39 @@ nih_topics
 Topic modelling of the NIH data.
 """
 
-from functools import lru_cache
 import logging
 
+from sqlalchemy import or_
+
 from indicators.core.config import NIH_CONFIG
+from indicators.core.core_utils import count_objects, to_columns
 from indicators.core.nlp_utils import join_text
-from indicators.core.db import get_mysql_engine
+from indicators.core.cache_utils import disk_cache, memory_cache
+from indicators.core.db import data_version, get_mysql_engine
+from indicators.core.profiling_utils import timed
 from nesta.core.orms.general_orm import NihProject as Project
 from nesta.core.orms.orm_utils import db_session
 
 model_config = NIH_CONFIG  # Specify the model config here
+# Fields which can be selected in `get_objects`, and their columns (NB: "text"
+# is not selectable, since it is joined from the phr and abstract)
+FIELDS = {
+    "id": Project.application_id,
+    "title": Project.project_title,
+    "created": Project.project_start,
+    "funding": Project.total_cost,
+}
+
+
+@memory_cache()
+def get_data_version():
+    """Version of the NIH data, for keying the cached query results"""
+    return data_version(Project.application_id, Project.project_start)
 
 
-@lru_cache()
+@memory_cache()
+@disk_cache("nih", version=get_data_version)
+@timed("fetch.nih.get_projects")
 def get_projects():
     logging.info("Retrieving all projects geography")
     engine = get_mysql_engine()
@@ -28,7 +48,8 @@ def get_projects():
         return query.all()
 
 
-@lru_cache()
+@memory_cache()
+@timed("fetch.nih.get_lat_lon")
 def get_lat_lon():
     """Get all institutes in NIH which are in Europe
 
@@ -43,7 +64,8 @@ def get_lat_lon():
     ]
 
 
-@lru_cache()
+@memory_cache()
+@timed("fetch.nih.get_iso2_to_id")
 def get_iso2_to_id():
     """
     Fetch and curate a lookup table of ISO2 code to
@@ -53,28 +75,43 @@ def get_iso2_to_id():
     return [(id, iso_code) for id, _, _, iso_code in projects]
 
 
-@lru_cache()
-def get_objects(from_date):
+@memory_cache()
+@disk_cache("nih", version=get_data_version)
+@timed("fetch.nih.get_objects", items=count_objects)
+def get_objects(from_date, fields=None):
     """Get all arXiv articles from a given start date.
 
     Args:
         from_date (str, optional): Min article creation date.
+        fields (tuple, optional): Only select these `FIELDS`, e.g. ("id", "created")
 
     Returns:
-        articles (list): List of arXiv article data.
+        articles (list): List of arXiv article data, or if `fields` are
+                         specified then a dict of {field: array}.
     """
     logging.info(f"Retrieving projects from at least {from_date}")
     engine = get_mysql_engine()
     with db_session(engine) as session:
-        query = session.query(
-            Project.application_id,
-            Project.phr,
-            Project.abstract_text,
-            Project.project_title,
-            Project.project_start,
-            Project.total_cost,
-        )
+        if fields is not None:
+            query = session.query(*(FIELDS[field] for field in fields))
+        else:
+            query = session.query(
+                Project.application_id,
+                Project.phr,
+                Project.abstract_text,
+                Project.project_title,
+                Project.project_start,
+                Project.total_cost,
+            )
         query = query.filter(Project.project_start > from_date)
+        # Skip projects without text (in SQL, so that the text isn't selected)
+        query = query.filter(
+            or_(Project.phr.isnot(None), Project.abstract_text.isnot(None))
+        )
+        # Order consistently, since the topic labels are aligned by row
+        query = query.order_by(Project.application_id)
+        if fields is not None:
+            return to_columns(query.all(), fields)
         projects = [
             dict(
                 id=id,
@@ -84,6 +121,10 @@ def get_objects(from_date):
                 funding=funding,
             )
             for id, phr, abstract, title, start_date, funding in query.all()
-            if not ((phr is None) and (abstract is None))
         ]
     return projects
+
+
+# Independent DB queries, which can be prefetched concurrently (NB: get_lat_lon
+# and get_iso2_to_id are both derived from get_projects)
+prefetch_queries = (get_projects,)
@@ -0,0 +1,246 @@
+"""
+pipeline
+========
+
+Checkpointed, resumable equivalent of running `make_topics.py` followed by
+`thematic_indicators.py`, with stages for each dataset:
+
+    fetch --> dedup --> vectorise --> fit --> label --> indicators --> publish
+    geo-lookup ------------------------------------------^
+
+Each stage writes a content-addressed artifact, and is skipped on rerun if
+its inputs are unchanged. Source stages (`fetch` and `geo-lookup`) are
+addressed by the version of the topic module's data (see `get_data_version`),
+and so are rerun once the data changes, or when forced:
+
+    python pipeline.py --force arxiv.fetch arxiv.geo-lookup
+"""
+
+from argparse import ArgumentParser
+from functools import lru_cache, partial
+from pathlib import Path
+from types import ModuleType
+import logging
+
+from indicators.core.config import INDICATORS
+from indicators.core.core_utils import project
+from indicators.core.indicator_utils import sort_save_and_upload
+from indicators.core.label_utils import select_positions, sort_labels
+from indicators.core.lazy_utils import LazyModule
+from indicators.core.nlp_utils import (
+    deduplicate,
+    get_clean_topics,
+    get_corex_labels,
+    make_model_label,
+    make_strata,
+    parse_corex_paths,
+    parse_corex_topics,
+    train_topic_model,
+    vectorise_docs,
+    write_object_labels,
+    write_topic_model,
+)
+from indicators.core.nuts_utils import get_geo_lookup
+from indicators.core.pipeline_utils import ArtifactStore, Stage, run_pipeline
+from indicators.two.thematic_indicators import make_indicators
+
+pd = LazyModule("pandas")
+
+
+def source_version(topic_module):
+    """Version of the topic module's data, if it can be probed, by which the
+    source stages are addressed"""
+    get_data_version = getattr(topic_module, "get_data_version", None)
+    return None if get_data_version is None else get_data_version()
+
+
+def fetch(topic_module, from_date, data_version=None):
+    """Fetch the objects. The `data_version` is only a parameter for addressing
+    the artifact, such that the objects are refetched once the data changes"""
+    return topic_module.get_objects(from_date=from_date)
+
+
+def geo_lookup(topic_module, data_version=None):
+    """Make the geographic lookup, addressed by `data_version` as for `fetch`"""
+    return get_geo_lookup(topic_module)
+
+
+def dedup(objects, **dedup_config):
+    return deduplicate([obj["text"] for obj in objects], **dedup_config)
+
+
+def vectorise(objects, deduplicated):
+    """Vectorise only the representative of each cluster of near-duplicates"""
+    representatives, _ = deduplicated
+    return vectorise_docs([objects[i]["text"] for i in representatives])
+
+
+def fit(vectorised, objects, deduplicated, dataset_label, **model_config):
+    doc_vectors, feature_names = vectorised
+    _, duplicate_of = deduplicated
+    titles = [obj["title"] for obj in objects]
+    strata = make_strata(objects)  # only used if `sample_size` is in the config
+    return train_topic_model(
+        doc_vectors,
+        feature_names,
+        titles,
+        strata=strata,
+        duplicate_of=duplicate_of,
+        **model_config,
+    )
+
+
+def label(topic_model, vectorised, objects, topic_module):
+    """Write the CorEx output (and label store) where the topic module expects
+    it, as `make_topics.py` does, and then return the topic probabilities of
+    each object (by id) and the clean topics, from which indicators are made"""
+    _, feature_names = vectorised
+    model_label = make_model_label(**topic_module.model_config)
+    directory = Path(topic_module.__file__).parent
+    write_topic_model(topic_model, feature_names, model_label, directory)
+    write_object_labels(topic_module, objects, topic_model)
+    for cached_func in (parse_corex_paths, parse_corex_topics, get_corex_labels):
+        cached_func.cache_clear()  # in case stale outputs have been read
+    labels = sort_labels(
+        ids=[obj["id"] for obj in objects],
+        created=[obj["created"] for obj in objects],
+        probs=topic_model.p_y_given_x,
+    )
+    labels["topics"] = parse_corex_topics(topic_module)
+    labels["clean_topics"] = get_clean_topics(topic_module)
+    return labels
+
+
+def artifact_topic_labels(labels, ids=None, from_date=None, to_date=None):
+    """Topic probabilities by object id from a `label` artifact, as they would
+    be read from the label store by `get_topic_labels`"""
+    positions = select_positions(
+        labels["ids"], labels["created"], ids, from_date, to_date
+    )
+    return pd.DataFrame(
+        labels["probs"][positions],
+        columns=labels["topics"],
+        index=pd.Index(labels["ids"][positions], name="id"),
+    )
+
+
+def make_artifact_module(topic_module, objects, geo_lookup, labels=None):
+    """A stand-in for `topic_module` which serves objects, geographies and
+    (if given) topic labels from artifacts, rather than from the database and
+    the CorEx output"""
+    module = ModuleType(f"{topic_module.__name__}_artifacts")
+    module.__file__ = topic_module.__file__
+    module.model_config = topic_module.model_config
+    module.get_objects = lru_cache()(
+        lambda from_date, fields=None: (
+            objects if fields is None else project(objects, fields)
+        )
+    )
+    module.get_nuts_to_id = lambda: [
+        (id, code)
+        for code, ids in geo_lookup.items()
+        if not code.startswith("iso_")
+        for id in ids
+    ]
+    module.get_iso2_to_id = lambda: [
+        (id, code[4:])
+        for code, ids in geo_lookup.items()
+        if code.startswith("iso_")
+        for id in ids
+    ]
+    if labels is not None:
+        module.get_topic_labels = partial(artifact_topic_labels, labels)
+        module.get_clean_topics = lambda: list(labels["clean_topics"])
+    return module
+
+
+def indicators(objects, labels, geo_lookup, topic_module, **dates):
+    """Make indicators from the artifacts. The `dates` are read from the config
+    by `make_indicators`, and so are only a parameter for addressing the artifact"""
+    module = make_artifact_module(topic_module, objects, geo_lookup, labels)
+    return make_indicators(module)
+
+
+def publish(*indicators):
+    merged = {k: v for _indicators in indicators for k, v in _indicators.items()}
+    sort_save_and_upload(merged)
+    return sorted(merged)
+
+
+def make_stages(topic_module):
+    """All stages of the pipeline for one topic module, up to `indicators`"""
+    dataset = topic_module.model_config["dataset_label"]
+    model_config = {
+        k: v for k, v in topic_module.model_config.items() if k != "metadata"
+    }
+    name = partial("{}.{}".format, dataset)
+    from_date = INDICATORS["precovid_dates"]["from_date"]
+    data_version = source_version(topic_module)
+    return [
+        Stage(
+            name("fetch"),
+            partial(fetch, topic_module),
+            params={"from_date": from_date, "data_version": data_version},
+        ),
+        Stage(
+            name("dedup"),
+            dedup,
+            inputs=[name("fetch")],
+            params=INDICATORS["topic_dedup"],
+        ),
+        Stage(name("vectorise"), vectorise, inputs=[name("fetch"), name("dedup")]),
+        Stage(
+            name("fit"),
+            fit,
+            inputs=[name("vectorise"), name("fetch"), name("dedup")],
+            params=model_config,
+        ),
+        Stage(
+            name("label"),
+            partial(label, topic_module=topic_module),
+            inputs=[name("fit"), name("vectorise"), name("fetch")],
+        ),
+        Stage(
+            name("geo-lookup"),
+            partial(geo_lookup, topic_module),
+            params={"data_version": data_version},
+        ),
+        Stage(
+            name("indicators"),
+            partial(indicators, topic_module=topic_module),
+            inputs=[name("fetch"), name("label"), name("geo-lookup")],
+            params={
+                date_label: INDICATORS[date_label]
+                for date_label in ("precovid_dates", "covid_dates")
+            },
+        ),
+    ]
+
+
+def make_pipeline(*topic_modules):
+    """All stages for all topic modules, and a final stage to publish them"""
+    stages = [stage for module in topic_modules for stage in make_stages(module)]
+    indicator_stages = [s.name for s in stages if s.name.endswith(".indicators")]
+    return stages + [Stage("publish", publish, inputs=indicator_stages)]
+
+
+if __name__ == "__main__":
+    from indicators.two import arxiv_topics, nih_topics, cordis_topics
+
+    MODULES = {"arxiv": arxiv_topics, "nih": nih_topics, "cordis": cordis_topics}
+    parser = ArgumentParser(description="Checkpointed topic and indicator pipeline")
+    parser.add_argument("--datasets", nargs="+", choices=MODULES, default=list(MODULES))
+    parser.add_argument(
+        "--until",
+        nargs="+",
+        help="Final stage(s) to run, e.g. 'arxiv.label' (default: publish)",
+    )
+    parser.add_argument("--force", nargs="+", default=[], help="Stage(s) to rerun")
+    parser.add_argument("--artifacts", default="pipeline-artifacts")
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    stages = make_pipeline(*(MODULES[dataset] for dataset in args.datasets))
+    run_pipeline(
+        stages, ArtifactStore(args.artifacts), force=args.force, until=args.until
+    )
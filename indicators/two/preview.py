@@ -0,0 +1,209 @@
+"""
+preview
+=======
+
+A quick, approximate preview of the thematic indicators (e.g. for checking a
+change to `indicators.yaml`) from a random sample of the objects of each
+dataset, rather than all of them:
+
+    python preview.py --datasets nih --fraction 0.01
+
+The sample is stratified by year of creation (see `preview` in
+`indicators.yaml`), and each sampled object is weighted by the inverse of its
+stratum's sampling fraction, such that activity is scaled back up to the
+population. The standard error of the total activity is written alongside it,
+as `indicator_se`. Ratios of activity (e.g. relative activity) are estimated
+from the scaled-up totals, and so are approximately unbiased for large samples.
+
+The topic labels are read by object id from the label store, so each dataset's
+topic model must have been fitted (with `make_topics.py`) beforehand. The
+preview is only written locally, and is never uploaded to S3.
+"""
+
+from argparse import ArgumentParser
+from functools import lru_cache
+from importlib import import_module
+from types import ModuleType
+import logging
+
+from indicators.core.config import INDICATORS
+from indicators.core.indicator_utils import (
+    LocalSink,
+    prepare_file_data,
+    sort_and_filter_data,
+)
+from indicators.core.lazy_utils import CONFIGURED, LazyConfig, LazyModule
+from indicators.core.nlp_utils import has_label_store, stratified_sample
+from indicators.two.thematic_indicators import make_indicators
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+PREVIEW = LazyConfig(lambda: INDICATORS["preview"])
+DATASETS = ("arxiv", "nih", "cordis")
+GEO_FUNCTIONS = ("get_lat_lon", "get_iso2_to_id", "get_nuts_to_id")
+
+
+def draw_sample(ids, created, fraction, stratify_by="year", seed=0):
+    """Stratified random sample of objects, allocated to each stratum in
+    proportion to its size
+
+    Args:
+        ids (array-like): Id of each object.
+        created (array-like): Creation date of each object.
+        fraction (float): Fraction of the objects to sample.
+        stratify_by (str, optional): Attribute of the creation date by which to
+                                     stratify (e.g. "year"), or None for a
+                                     uniform sample.
+        seed (int): Random seed.
+    Returns:
+        sample (DataFrame): The `sample_weight` (population size over sample
+                            size of its stratum) and `sample_stratum` of each
+                            sampled object, indexed by id
+        sample_strata (dict): Sample size and weight of each stratum, by stratum
+    """
+    created = pd.to_datetime(pd.Series(created))
+    if stratify_by is None:
+        strata = np.zeros(len(created), dtype=int)
+    else:
+        strata = getattr(created.dt, stratify_by).to_numpy()
+    sample_size = max(1, round(fraction * len(strata)))
+    positions = stratified_sample(strata, sample_size, seed=seed)
+    population_sizes = pd.Series(strata).value_counts()
+    sample_sizes = pd.Series(strata[positions]).value_counts()
+    sample_strata = {
+        stratum: (int(n), population_sizes[stratum] / n)
+        for stratum, n in sample_sizes.items()
+    }
+    sample = pd.DataFrame(
+        {
+            "sample_weight": [sample_strata[h][1] for h in strata[positions]],
+            "sample_stratum": strata[positions],
+        },
+        index=np.asarray(ids)[positions],
+    )
+    return sample, sample_strata
+
+
+def filter_geo_function(get_ids_to_geo, ids):
+    """Restrict a geographic function of a topic module (e.g. `get_iso2_to_id`),
+    of the form [(id, ...)], to the given object ids"""
+
+    @lru_cache()
+    def _get_ids_to_geo():
+        return [row for row in get_ids_to_geo() if row[0] in ids]
+
+    return _get_ids_to_geo
+
+
+def make_sampled_module(
+    topic_module,
+    fraction=None,
+    stratify_by=CONFIGURED,
+    seed=None,
+):
+    """A topic module whose objects are a stratified random sample of those of
+    `topic_module`, with their `sample_weight` and `sample_stratum`, and which
+    can be passed anywhere that `topic_module` can be passed.
+
+    The sampling arguments are as for `draw_sample`, and default to `preview`
+    in the config.
+
+    Raises:
+        ValueError: If `topic_module` has no label store, since the sampled
+                    objects' labels are read by id
+    """
+    fraction = PREVIEW["fraction"] if fraction is None else fraction
+    stratify_by = PREVIEW["stratify_by"] if stratify_by is CONFIGURED else stratify_by
+    seed = PREVIEW["seed"] if seed is None else seed
+    if not has_label_store(topic_module):
+        raise ValueError(
+            f"{topic_module.__name__} has no label store, run make_topics.py first"
+        )
+    sample_from_date = INDICATORS["precovid_dates"]["from_date"]
+    population = topic_module.get_objects(
+        from_date=sample_from_date, fields=("id", "created")
+    )
+    sample, sample_strata = draw_sample(
+        population["id"], population["created"], fraction, stratify_by, seed
+    )
+    sample_info = sample.to_dict("index")
+    logging.info(
+        f"Sampled {len(sample)} of {len(population['id'])} objects "
+        f"from {topic_module.__name__}"
+    )
+
+    module = ModuleType(f"{topic_module.__name__}_preview")
+    module.__file__ = topic_module.__file__  # i.e. for the topic model output
+    module.model_config = topic_module.model_config
+    module.sample_strata = sample_strata
+
+    @lru_cache()
+    def get_objects(from_date, fields=None):
+        if from_date != sample_from_date:
+            raise ValueError(f"Objects were only sampled from {sample_from_date}")
+        if fields is None:
+            objects = topic_module.get_objects(from_date=from_date)
+            return [
+                {**obj, **sample_info[obj["id"]]}
+                for obj in objects
+                if obj["id"] in sample_info
+            ]
+        # Always fetch the id, by which the sample is selected
+        columns = topic_module.get_objects(
+            from_date=from_date, fields=tuple(dict.fromkeys(("id", *fields)))
+        )
+        ids = np.asarray(columns["id"])
+        keep = np.isin(ids, sample.index)
+        sampled = sample.loc[ids[keep]]
+        return {
+            **{field: np.asarray(columns[field])[keep] for field in fields},
+            "sample_weight": sampled["sample_weight"].to_numpy(),
+            "sample_stratum": sampled["sample_stratum"].to_numpy(),
+        }
+
+    module.get_objects = get_objects
+    for name in GEO_FUNCTIONS:
+        if hasattr(topic_module, name):
+            setattr(
+                module,
+                name,
+                filter_geo_function(getattr(topic_module, name), sample_info),
+            )
+    return module
+
+
+def run_preview(
+    modules,
+    fraction=None,
+    directory=None,
+    **sample_kwargs,
+):
+    """Make indicators from a sample of the objects of each topic module, and
+    save them (locally only) under `directory` (by default, as in the config)
+
+    Returns:
+        sorted_file_data (dict): The saved indicators, by file path
+    """
+    directory = PREVIEW["directory"] if directory is None else directory
+    sampled_modules = [
+        make_sampled_module(module, fraction=fraction, **sample_kwargs)
+        for module in modules
+    ]
+    indicators = make_indicators(*sampled_modules)
+    sorted_file_data = sort_and_filter_data(prepare_file_data(indicators))
+    LocalSink(directory).write(sorted_file_data)
+    logging.info(f"Wrote {len(sorted_file_data)} preview files to {directory}")
+    return sorted_file_data
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Preview indicators from a sample of objects")
+    parser.add_argument("--datasets", nargs="+", choices=DATASETS, default=DATASETS)
+    parser.add_argument("--fraction", type=float, default=PREVIEW["fraction"])
+    parser.add_argument("--output", default=PREVIEW["directory"])
+    args = parser.parse_args()
+
+    logging.getLogger().setLevel(logging.INFO)
+    modules = [import_module(f"indicators.two.{name}_topics") for name in args.datasets]
+    run_preview(modules, fraction=args.fraction, directory=args.output)
@@ -0,0 +1,125 @@
+"""
+region_similarity
+=================
+
+Which regions have a research response most like that of a given region?
+The topic activity of each region (e.g. `total_activity` by topic, from
+`generate_indicators`) is assembled into a matrix of regions by topics for
+each dataset, and each region's `k` most similar regions (by the cosine
+similarity of their topic activity) are found with `top_k_similar`. By
+default, regions are only compared with regions of the same level, i.e. of
+the same output file (countries, or NUTS regions of one level).
+
+The neighbours are written alongside the indicators of each dataset, to
+`{dataset}/similar-regions.csv` (see `region_similarity` in
+`indicators.yaml`), with a row for each region and neighbour:
+
+    nuts_code,nuts_level,neighbour_code,neighbour_level,rank,similarity
+"""
+
+import logging
+
+from indicators.core.config import INDICATORS
+from indicators.core.indicator_utils import (
+    ParquetSink,
+    compress_value,
+    make_ctry_metadata,
+    make_filename,
+    make_sinks,
+    write_to_sinks,
+)
+from indicators.core.lazy_utils import LazyConfig, LazyModule
+from indicators.core.similarity_utils import top_k_similar
+
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+
+SIMILARITY = LazyConfig(lambda: INDICATORS["region_similarity"])
+
+
+def activity_matrix(geo_indicators, indicator_name=None):
+    """The activity of each region by topic, of the form given by
+    `indicators_by_geo`, as a matrix of regions by topics
+
+    Returns:
+        activity (DataFrame): Indexed by geography code, with a column per topic
+    """
+    if indicator_name is None:
+        indicator_name = SIMILARITY["indicator_name"]
+    return pd.DataFrame.from_dict(
+        {
+            geo_code: indicators.get(indicator_name, {})
+            for geo_code, indicators in geo_indicators.items()
+        },
+        orient="index",
+    ).fillna(0)
+
+
+def similar_regions(
+    geo_indicators,
+    k=None,
+    same_level=None,
+    indicator_name=None,
+    block_size=None,
+):
+    """The `k` regions whose topic activity is most similar to that of each
+    region, of those regions with any activity. Arguments which aren't given
+    are as in `region_similarity` in the config.
+
+    Args:
+        geo_indicators (dict): Indicators by region, from `indicators_by_geo`
+        k (int): Number of neighbours of each region
+        same_level (bool): Only compare regions of the same level
+        indicator_name (str): Indicator of activity by topic to compare
+        block_size (int): See `top_k_similar`
+    Returns:
+        neighbours (DataFrame): A row per region and neighbour, ranked from 1
+    """
+    k = SIMILARITY["k"] if k is None else k
+    same_level = SIMILARITY["same_level"] if same_level is None else same_level
+    block_size = SIMILARITY["block_size"] if block_size is None else block_size
+    activity = activity_matrix(geo_indicators, indicator_name)
+    geo_codes = activity.index.to_numpy()
+    groups = [make_filename(geo_code) for geo_code in geo_codes] if same_level else None
+    neighbours, similarities = top_k_similar(
+        activity.to_numpy(), k, groups=groups, block_size=block_size
+    )
+    metadata = [make_ctry_metadata(geo_code) for geo_code in geo_codes]
+    nuts_codes = np.array([_metadata["nuts_code"] for _metadata in metadata])
+    nuts_levels = np.array([_metadata["nuts_level"] for _metadata in metadata])
+    rows, ranks = (neighbours >= 0).nonzero()
+    columns = neighbours[rows, ranks]
+    return pd.DataFrame(
+        {
+            "nuts_code": nuts_codes[rows],
+            "nuts_level": nuts_levels[rows],
+            "neighbour_code": nuts_codes[columns],
+            "neighbour_level": nuts_levels[columns],
+            "rank": ranks + 1,
+            "similarity": similarities[rows, ranks],
+        }
+    )
+
+
+def prepare_neighbour_data(indicators, **kwargs):
+    """The neighbours of each region of each dataset, from `make_indicators`,
+    by output file path, ready for the (non-Parquet) output sinks"""
+    file_data = {}
+    for dataset_name, by_entity in indicators.items():
+        for geo_indicators in by_entity.values():
+            neighbours = similar_regions(geo_indicators, **kwargs)
+            neighbours.similarity = neighbours.similarity.apply(compress_value)
+            file_data[f"{dataset_name}/{SIMILARITY['filename']}"] = neighbours
+    return file_data
+
+
+def save_similar_regions(indicators, sinks=None):
+    """Save the neighbours of each region with the output sinks specified in
+    the config, except for Parquet, which is only for the indicators"""
+    file_data = prepare_neighbour_data(indicators)
+    if sinks is None:
+        sinks = make_sinks(INDICATORS["output_sinks"])
+    sinks = [sink for sink in sinks if not isinstance(sink, ParquetSink)]
+    write_to_sinks(file_data, sinks)
+    logging.info(f"Saved the similar regions of {len(file_data)} datasets")
+    return file_data
@@ -1,3 +1,4 @@
+import numpy as np
 from unittest import mock
 from indicators.two.arxiv_topics import get_lat_lon, get_iso2_to_id, get_objects
 
@@ -28,7 +29,7 @@ def test_get_iso2_to_id(mocked_db_session, mocked_engine):
 @mock.patch(PATH.format("get_mysql_engine"))
 @mock.patch(PATH.format("db_session"))
 def test_get_objects(mocked_db_session, mocked_get_mysql_engine):
-    query = mocked_db_session().__enter__().query().filter().filter()
+    query = mocked_db_session().__enter__().query().filter().filter().order_by()
     query.all.return_value = [
         (1, "some text", "a title", "01-01-2020"),
         (2, "more text", "another title", "02-01-2020"),
@@ -43,3 +44,13 @@ def test_get_objects(mocked_db_session, mocked_get_mysql_engine):
             "created": "02-01-2020",
         },
     ]
+
+
+@mock.patch(PATH.format("get_mysql_engine"))
+@mock.patch(PATH.format("db_session"))
+def test_get_objects_fields(mocked_db_session, mocked_get_mysql_engine):
+    query = mocked_db_session().__enter__().query().filter().filter().order_by()
+    query.all.return_value = [("a1", "2020-01-01"), ("a2", "2020-01-02")]
+    objects = get_objects("2020-01-01", fields=("id", "created"))
+    assert list(objects["id"]) == ["a1", "a2"]
+    assert objects["created"].dtype == np.dtype("datetime64[ns]")
@@ -1,3 +1,4 @@
+import numpy as np
 from unittest import mock
 from indicators.two.cordis_topics import (
     get_nuts_to_id,
@@ -34,7 +35,7 @@ def test_get_iso2_to_id(mocked_db_session, mocked_get_mysql_engine):
 @mock.patch(PATH.format("get_mysql_engine"))
 @mock.patch(PATH.format("db_session"))
 def test_get_objects(mocked_db_session, mocked_get_mysql_engine):
-    query = mocked_db_session().__enter__().query().filter()
+    query = mocked_db_session().__enter__().query().filter().order_by()
     query.all.return_value = [
         (1, "the text", "the title", "01-01-2020", "funding1"),
         (2, "more text", "more title", "02-01-2020", "funding2"),
@@ -56,3 +57,14 @@ def test_get_objects(mocked_db_session, mocked_get_mysql_engine):
             "funding": "funding2",
         },
     ]
+
+
+@mock.patch(PATH.format("get_mysql_engine"))
+@mock.patch(PATH.format("db_session"))
+def test_get_objects_fields(mocked_db_session, mocked_get_mysql_engine):
+    query = mocked_db_session().__enter__().query().filter().order_by()
+    query.all.return_value = [(1, "2020-01-01", 10.5), (2, "2020-01-02", None)]
+    objects = get_objects("2020-01-01", fields=("id", "created", "funding"))
+    assert objects["id"].tolist() == [1, 2]
+    assert objects["created"].dtype == np.dtype("datetime64[ns]")
+    assert objects["funding"][0] == 10.5 and np.isnan(objects["funding"][1])
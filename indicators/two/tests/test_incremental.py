@@ -0,0 +1,184 @@
+from types import ModuleType
+from unittest import mock
+import pytest
+import numpy as np
+import pandas as pd
+from pandas.testing import assert_frame_equal
+
+from indicators.benchmarks.synthetic import make_topic_module
+from indicators.core.cache_utils import REGISTRY
+from indicators.core.core_utils import project
+from indicators.core.indicator_utils import (
+    LocalSink,
+    prepare_file_data,
+    sort_and_filter_data,
+)
+from indicators.two.incremental import (
+    activity_sums,
+    derive_indicators,
+    run_incremental,
+    select_partitions,
+    update_indicators,
+)
+from indicators.two.thematic_indicators import (
+    covid_topic_indexer,
+    generate_indicators,
+    make_indicators,
+)
+
+PATH = "indicators.two.incremental.{}"
+
+
+@pytest.fixture
+def topic_module(tmp_path):
+    return make_topic_module(tmp_path / "topics", n_objects=600, n_geos=8, n_topics=5)
+
+
+def make_growing_module(topic_module, n_objects):
+    """A topic module of only the first `n_objects` objects of `topic_module`,
+    to which more objects can be added by increasing `module.n_objects`"""
+    module = ModuleType(f"{topic_module.__name__}_growing")
+    module.__file__ = topic_module.__file__
+    module.model_config = topic_module.model_config
+    module.n_objects = n_objects
+
+    def get_objects(from_date, fields=None):
+        objects = [
+            obj
+            for obj in topic_module.get_objects(from_date)
+            if obj["id"] < module.n_objects
+        ]
+        return objects if fields is None else project(objects, fields)
+
+    def get_iso2_to_id():
+        return [
+            row for row in topic_module.get_iso2_to_id() if row[0] < module.n_objects
+        ]
+
+    def get_nuts_to_id():
+        return [
+            row for row in topic_module.get_nuts_to_id() if row[0] < module.n_objects
+        ]
+
+    module.get_objects = get_objects
+    module.get_iso2_to_id = get_iso2_to_id
+    module.get_nuts_to_id = get_nuts_to_id
+    return module
+
+
+def full_file_data(topic_module):
+    return sort_and_filter_data(prepare_file_data(make_indicators(topic_module)))
+
+
+@pytest.fixture
+def nuts_info_lookup(topic_module):
+    with mock.patch(
+        "indicators.core.indicator_utils.get_nuts_info_lookup",
+        return_value=topic_module.nuts_info_lookup,
+    ):
+        yield
+
+
+@pytest.fixture
+def many_objects():
+    rng = np.random.default_rng(1)
+    created = pd.to_datetime("2016-01-01") + pd.to_timedelta(
+        rng.integers(0, 365 * 5, 2000), unit="D"
+    )
+    objects = pd.DataFrame({"created": created})
+    topics = pd.DataFrame(
+        (rng.random((2000, 3)) < [0.1, 0.3, 0.5]) * rng.lognormal(size=(2000, 1)),
+        columns=["covid", "cells", "genes"],
+    )
+    return objects, topics
+
+
+@mock.patch("indicators.two.thematic_indicators.get_objects_and_topics")
+def test_derive_indicators(mocked_getter, many_objects):
+    objects, topics = many_objects
+    mocked_getter.return_value = many_objects
+    expected = generate_indicators(None, None, None)
+    # Derived from the sums of any split of the objects
+    is_covid = covid_topic_indexer(topics)
+    sums = activity_sums(objects[:500], topics[:500], is_covid[:500])
+    sums += activity_sums(objects[500:], topics[500:], is_covid[500:])
+    indicators = derive_indicators(sums, topics.columns)
+    assert indicators.keys() == expected.keys()
+    for name, values in expected.items():
+        assert indicators[name].keys() == values.keys()
+        for topic, value in values.items():
+            assert indicators[name][topic] == pytest.approx(value)
+
+
+def test_select_partitions():
+    indicators = {
+        code: {"total_activity": {"cells": 1, "genes": 2}}
+        for code in ("UKC", "UKD", "UKC1", "iso_UK")
+    }
+    selected = select_partitions(indicators, {"UKC": {"cells"}})
+    # Every region of the same level, but only for the changed topic
+    assert selected == {
+        "UKC": {"total_activity": {"cells": 1}},
+        "UKD": {"total_activity": {"cells": 1}},
+    }
+    assert select_partitions(indicators, {}) == {}
+
+
+def test_run_incremental(topic_module, nuts_info_lookup, tmp_path):
+    module = make_growing_module(topic_module, n_objects=590)
+    state_dir, output_dir = tmp_path / "state", tmp_path / "output"
+    # The first update is in full
+    sorted_file_data = run_incremental(
+        [module], state_dir=state_dir, sinks=[LocalSink(output_dir)]
+    )
+    expected = full_file_data(module)
+    assert sorted_file_data.keys() == expected.keys()
+    assert (state_dir / "synthetic.pkl").exists()
+
+    # Subsequent updates only rewrite the files which have changed...
+    module.n_objects = 600
+    REGISTRY.clear(module)  # i.e. the geographic lookup
+    sorted_file_data = run_incremental(
+        [module], state_dir=state_dir, sinks=[LocalSink(output_dir)]
+    )
+    expected = full_file_data(module)
+    assert 0 < len(sorted_file_data) < len(expected)
+    # ...such that all of the output is as if made in full
+    for path, data in expected.items():
+        output = pd.read_csv(output_dir / path, dtype=str, keep_default_na=False)
+        assert_frame_equal(output, data.astype(str), check_dtype=False)
+    # Nothing is rewritten if there are no new objects
+    assert run_incremental([module], state_dir=state_dir, sinks=[]) == {}
+
+
+def test_update_indicators_rebuild(topic_module):
+    module = make_growing_module(topic_module, n_objects=500)
+    state, changed = update_indicators(module, None, None)
+    assert len(state["ids"]) == len(module.get_objects("2015-01-01"))
+    assert changed.keys() == state["indicators"].keys()
+    # The state is rebuilt if out of date, or if forced
+    _, changed = update_indicators(module, None, state)
+    assert changed == {}
+    for kwargs in ({"full": True}, {"state": {**state, "fingerprint": "old"}}):
+        kwargs = {"state": state, **kwargs}
+        rebuilt, changed = update_indicators(module, None, **kwargs)
+        assert np.array_equal(rebuilt["ids"], state["ids"])
+        assert changed.keys() == state["indicators"].keys()
+
+
+@mock.patch.dict(PATH.format("INCREMENTAL"), {"label_new_objects": False})
+def test_update_indicators_unlabelled(topic_module):
+    # Objects which aren't in the label store are left for a later update
+    module = make_growing_module(topic_module, n_objects=700)
+    module.get_objects = lambda from_date, fields=None: {
+        "id": np.arange(700),
+        "created": np.full(700, np.datetime64("2020-06-01")),
+    }
+    state, _ = update_indicators(module, None, None)
+    assert state["ids"].tolist() == list(range(600))
+
+
+@mock.patch(PATH.format("BOOTSTRAP"), {"enabled": True})
+def test_update_indicators_unsupported(topic_module):
+    with pytest.raises(ValueError):
+        update_indicators(topic_module, None, None)
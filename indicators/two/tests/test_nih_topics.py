@@ -1,3 +1,4 @@
+import numpy as np
 from unittest import mock
 from indicators.two.nih_topics import (
     get_projects,
@@ -47,7 +48,7 @@ def test_get_iso2_to_id(mocked_get_projects):
 @mock.patch(PATH.format("get_mysql_engine"))
 @mock.patch(PATH.format("db_session"))
 def test_get_objects(mocked_db_session, mocked_get_mysql_engine):
-    query = mocked_db_session().__enter__().query().filter()
+    query = mocked_db_session().__enter__().query().filter().filter().order_by()
     query.all.return_value = [
         (1, "phr text", "abstract text", "title text", "01-01-2020", "funding1"),
         (
@@ -76,3 +77,17 @@ def test_get_objects(mocked_db_session, mocked_get_mysql_engine):
             "funding": "funding2",
         },
     ]
+
+
+@mock.patch(PATH.format("get_mysql_engine"))
+@mock.patch(PATH.format("db_session"))
+def test_get_objects_fields(mocked_db_session, mocked_get_mysql_engine):
+    session = mocked_db_session().__enter__()
+    query = session.query().filter().filter().order_by()
+    query.all.return_value = [(1, "2020-01-01"), (2, "2020-01-02")]
+    objects = get_objects("2020-01-01", fields=("id", "created"))
+    assert objects["id"].tolist() == [1, 2]
+    assert objects["created"].dtype == np.dtype("datetime64[ns]")
+    # i.e. only the requested columns are selected, not the text
+    columns, _ = session.query.call_args
+    assert [column.key for column in columns] == ["application_id", "project_start"]
@@ -0,0 +1,101 @@
+from unittest import mock
+import shutil
+import numpy as np
+
+from indicators.benchmarks.synthetic import make_topic_module
+from indicators.core.label_utils import load_labels, sort_labels
+from indicators.core.nlp_utils import (
+    get_clean_topics,
+    get_label_store_path,
+    get_model_path,
+    get_topic_labels,
+    has_label_store,
+    parse_corex_topics,
+)
+from indicators.two.pipeline import make_artifact_module, make_pipeline, publish
+from indicators.two.thematic_indicators import make_indicators
+from indicators.two import arxiv_topics, nih_topics
+
+PATH = "indicators.two.pipeline.{}"
+
+
+@mock.patch(PATH.format("source_version"), return_value=(("10", "2021-01-01"),))
+def test_make_pipeline(mocked_version):
+    stages = {stage.name: stage for stage in make_pipeline(arxiv_topics, nih_topics)}
+    assert set(stages) == {
+        f"{dataset}.{name}"
+        for dataset in ("arxiv", "nih")
+        for name in (
+            "fetch",
+            "dedup",
+            "vectorise",
+            "fit",
+            "label",
+            "geo-lookup",
+            "indicators",
+        )
+    } | {"publish"}
+    assert stages["publish"].inputs == ["arxiv.indicators", "nih.indicators"]
+    assert stages["nih.indicators"].inputs == [
+        "nih.fetch",
+        "nih.label",
+        "nih.geo-lookup",
+    ]
+    assert stages["arxiv.vectorise"].inputs == ["arxiv.fetch", "arxiv.dedup"]
+    # Source stages are addressed by the version of the data
+    for stage_name in ("nih.fetch", "nih.geo-lookup"):
+        assert stages[stage_name].params["data_version"] == (("10", "2021-01-01"),)
+    assert "metadata" not in stages["arxiv.fit"].params
+    assert (
+        stages["arxiv.fit"].params["n_topics"] == arxiv_topics.model_config["n_topics"]
+    )
+
+
+def test_make_artifact_module():
+    objects = [{"id": 1}, {"id": 2}]
+    geo_lookup = {"UK": {1, 2}, "UKI": {2}, "iso_GB": {1, 2}}
+    module = make_artifact_module(arxiv_topics, objects, geo_lookup)
+    assert module.__file__ == arxiv_topics.__file__
+    assert module.model_config is arxiv_topics.model_config
+    assert module.get_objects(from_date="2015-01-01") is objects
+    assert sorted(module.get_nuts_to_id()) == [(1, "UK"), (2, "UK"), (2, "UKI")]
+    assert sorted(module.get_iso2_to_id()) == [(1, "GB"), (2, "GB")]
+    assert not hasattr(module, "get_lat_lon")
+
+
+@mock.patch(PATH.format("sort_save_and_upload"))
+def test_publish(mocked_save):
+    assert publish({"arxiv": 1}, {"nih": 2, "nih-funding": 3}) == [
+        "arxiv",
+        "nih",
+        "nih-funding",
+    ]
+    assert mocked_save.call_args == mock.call({"arxiv": 1, "nih": 2, "nih-funding": 3})
+
+
+def test_make_artifact_module_labels(tmp_path):
+    topic_module = make_topic_module(tmp_path, n_objects=300, n_geos=4, n_topics=5)
+    objects = topic_module.get_objects(from_date="2015-01-01")
+    geo_lookup = {
+        f"iso_{code}": [
+            id for id, _code in topic_module.get_iso2_to_id() if _code == code
+        ]
+        for code in {code for _, code in topic_module.get_iso2_to_id()}
+    }
+    path = get_label_store_path(topic_module)
+    ids, probs = load_labels(path)
+    labels = sort_labels(ids, np.load(path / "created.npy"), probs)
+    labels["topics"] = parse_corex_topics(topic_module)
+    labels["clean_topics"] = get_clean_topics(topic_module)
+    module = make_artifact_module(topic_module, objects, geo_lookup)
+    expected = make_indicators(module)
+
+    # The labels are served from the artifact, not from the CorEx output
+    module = make_artifact_module(topic_module, objects, geo_lookup, labels)
+    shutil.rmtree(get_model_path(topic_module))
+    assert has_label_store(module)
+    assert get_clean_topics(module) == labels["clean_topics"]
+    served = get_topic_labels(module, ids=ids[[3, 1]], binary_threshold=None)
+    assert served.index.tolist() == sorted(ids[[3, 1]])
+    assert np.allclose(served.to_numpy(), probs[[1, 3]])
+    assert make_indicators(module) == expected
@@ -0,0 +1,101 @@
+from unittest import mock
+import pytest
+import numpy as np
+import pandas as pd
+
+from indicators.benchmarks.synthetic import make_topic_module
+from indicators.core.config import INDICATORS
+from indicators.core.core_utils import INDICATOR_FIELDS
+from indicators.two.preview import draw_sample, make_sampled_module, run_preview
+from indicators.two.thematic_indicators import make_indicators
+
+PATH = "indicators.two.preview.{}"
+FROM_DATE = INDICATORS["precovid_dates"]["from_date"]
+
+
+@pytest.fixture
+def topic_module(tmp_path):
+    return make_topic_module(tmp_path / "topics", n_objects=600, n_geos=8, n_topics=5)
+
+
+@pytest.fixture
+def no_diversity():
+    # i.e. skbio isn't required for these tests
+    with mock.patch(
+        "indicators.two.thematic_indicators.thematic_diversity", return_value=1
+    ):
+        yield
+
+
+def test_draw_sample():
+    created = pd.to_datetime(["2016-06-01"] * 300 + ["2019-06-01"] * 100)
+    sample, sample_strata = draw_sample(np.arange(400) + 1000, created, 0.1, seed=1)
+    assert sample_strata == {2016: (30, 10.0), 2019: (10, 10.0)}
+    assert len(sample) == 40
+    assert sample.index.isin(np.arange(400) + 1000).all()
+    # The weights scale the sample up to the population of each stratum
+    assert sample.groupby("sample_stratum").sample_weight.sum().to_dict() == {
+        2016: 300,
+        2019: 100,
+    }
+    # Without stratification, there is only one stratum
+    _, sample_strata = draw_sample(np.arange(400), created, 0.25, stratify_by=None)
+    assert sample_strata == {0: (100, 4.0)}
+
+
+@mock.patch(PATH.format("has_label_store"), return_value=False)
+def test_make_sampled_module_requires_label_store(mocked_has_label_store):
+    with pytest.raises(ValueError):
+        make_sampled_module(mock.Mock(__name__="topics"))
+
+
+def test_make_sampled_module(topic_module):
+    module = make_sampled_module(topic_module, fraction=0.2, seed=0)
+    population = topic_module.get_objects(from_date=FROM_DATE, fields=INDICATOR_FIELDS)
+    objects = module.get_objects(from_date=FROM_DATE, fields=INDICATOR_FIELDS)
+    sample_size = sum(n for n, _ in module.sample_strata.values())
+    assert len(objects["id"]) == sample_size == pytest.approx(0.2 * 600, abs=10)
+    assert set(objects) == {*INDICATOR_FIELDS, "sample_weight", "sample_stratum"}
+    assert np.isin(objects["id"], population["id"]).all()
+    assert objects["sample_weight"].sum() == pytest.approx(len(population["id"]))
+    # All fields, as a list of objects
+    full_objects = module.get_objects(from_date=FROM_DATE)
+    assert [obj["id"] for obj in full_objects] == list(objects["id"])
+    assert {"text", "sample_weight"} <= set(full_objects[0])
+    # The geographic lookups only include the sampled objects
+    assert {id for id, _ in module.get_iso2_to_id()} == set(objects["id"])
+    assert {id for id, _ in module.get_nuts_to_id()} == set(objects["id"])
+    assert not hasattr(module, "get_lat_lon")
+    # The sample is only valid for the date from which it was drawn
+    with pytest.raises(ValueError):
+        module.get_objects(from_date="2020-01-01")
+
+
+def test_make_sampled_module_census(topic_module, no_diversity):
+    # A "sample" of every object gives the same indicators, without error
+    module = make_sampled_module(topic_module, fraction=1.0)
+    (indicators,) = make_indicators(topic_module)["synthetic"].values()
+    (sampled,) = make_indicators(module)["synthetic"].values()
+    assert indicators.keys() == sampled.keys()
+    for geo_code, geo_indicators in indicators.items():
+        for name, values in geo_indicators.items():
+            for topic, value in values.items():
+                assert sampled[geo_code][name][topic] == pytest.approx(value)
+        assert set(sampled[geo_code]["total_activity_se"].values()) == {0}
+
+
+def test_run_preview(topic_module, no_diversity, tmp_path):
+    with mock.patch(
+        "indicators.core.indicator_utils.get_nuts_info_lookup",
+        return_value=topic_module.nuts_info_lookup,
+    ), mock.patch("indicators.core.indicator_utils.boto3") as mocked_boto3:
+        sorted_file_data = run_preview(
+            [topic_module], fraction=0.5, directory=tmp_path / "preview"
+        )
+    mocked_boto3.resource.assert_not_called()  # i.e. nothing is uploaded
+    assert len(sorted_file_data) > 0
+    for path, data in sorted_file_data.items():
+        assert (tmp_path / "preview" / path).exists()
+    data = pd.concat(sorted_file_data.values())
+    total_activity = data.loc[data.indicator_name == "total_activity"]
+    assert (total_activity.indicator_se != "").any()
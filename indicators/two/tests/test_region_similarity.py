@@ -0,0 +1,82 @@
+from unittest import mock
+import pytest
+import pandas as pd
+
+from indicators.benchmarks.synthetic import make_topic_module
+from indicators.core.indicator_utils import LocalSink, ParquetSink
+from indicators.two.region_similarity import (
+    activity_matrix,
+    save_similar_regions,
+    similar_regions,
+)
+from indicators.two.thematic_indicators import make_indicators
+
+
+@pytest.fixture
+def topic_module(tmp_path):
+    return make_topic_module(tmp_path / "topics", n_objects=500, n_geos=8, n_topics=5)
+
+
+@pytest.fixture
+def nuts_info_lookup(topic_module):
+    with mock.patch(
+        "indicators.core.indicator_utils.get_nuts_info_lookup",
+        return_value=topic_module.nuts_info_lookup,
+    ):
+        yield
+
+
+@pytest.fixture
+def indicators(topic_module, nuts_info_lookup):
+    return make_indicators(topic_module)
+
+
+@pytest.fixture
+def geo_indicators(indicators):
+    (by_entity,) = indicators.values()
+    (geo_indicators,) = by_entity.values()
+    return geo_indicators
+
+
+def test_activity_matrix():
+    activity = activity_matrix(
+        {
+            "UKC": {"total_activity": {"cells": 1, "genes": 2}},
+            "UKD": {"total_activity": {"genes": 3}},
+        }
+    )
+    assert activity.loc["UKD"].to_dict() == {"cells": 0, "genes": 3}
+
+
+def test_similar_regions(geo_indicators):
+    neighbours = similar_regions(geo_indicators, k=3)
+    assert list(neighbours.columns) == [
+        "nuts_code",
+        "nuts_level",
+        "neighbour_code",
+        "neighbour_level",
+        "rank",
+        "similarity",
+    ]
+    # Regions are only compared with other regions of the same level
+    assert (neighbours.nuts_level == neighbours.neighbour_level).all()
+    assert (neighbours.nuts_code != neighbours.neighbour_code).all()
+    for _, _neighbours in neighbours.groupby(["nuts_code", "nuts_level"]):
+        assert _neighbours["rank"].tolist() == list(range(1, len(_neighbours) + 1))
+        assert _neighbours.similarity.is_monotonic_decreasing
+    # Unless regions of any level are to be compared
+    neighbours = similar_regions(geo_indicators, k=3, same_level=False)
+    assert (neighbours.nuts_level != neighbours.neighbour_level).any()
+
+
+def test_save_similar_regions(indicators, geo_indicators, tmp_path):
+    parquet_sink = mock.MagicMock(spec=ParquetSink)
+    file_data = save_similar_regions(
+        indicators, sinks=[LocalSink(tmp_path), parquet_sink]
+    )
+    ((path, data),) = file_data.items()
+    assert path == "synthetic/similar-regions.csv"
+    output = pd.read_csv(tmp_path / path)
+    assert len(output) == len(data) > 0
+    assert output.nuts_code.nunique() <= len(geo_indicators)
+    parquet_sink.write.assert_not_called()
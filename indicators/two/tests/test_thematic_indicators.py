@@ -1,19 +1,30 @@
+from functools import partial
 import pytest
+import numpy as np
 from unittest import mock
 from pandas.testing import assert_frame_equal
 from numpy.testing import assert_almost_equal
+import networkx as nx
 from indicators.two.thematic_indicators import (
     sum_activity,
+    bootstrap_relative_activity,
     pd,
     covid_filterer,
     covid_topic_indexer,
     relative_activity,
+    sampling_standard_error,
+    date_slicer,
     get_objects_and_topics,
     generate_indicators,
     thematic_diversity,
+    topic_network_indicators,
     indicators_by_geo,
     make_indicators,
 )
+from indicators.benchmarks.synthetic import make_topic_module
+from indicators.core.core_utils import object_getter
+from indicators.core.network_utils import topic_network
+from indicators.core.shard_utils import WorkQueue
 from indicators.two import arxiv_topics, nih_topics, cordis_topics
 
 PATH = "indicators.two.thematic_indicators.{}"
@@ -49,8 +60,7 @@ def topic_counts():
 
 @pytest.fixture
 def geo_index():
-    data = [True, True, True, False, True]
-    return pd.Series(data)
+    return np.array([0, 1, 2, 4], dtype=np.int32)  # i.e. positions
 
 
 def test_sum_activity(objects, topic_counts):
@@ -88,11 +98,17 @@ def test_relative_activity(mocked_divide):
     relative_activity(lambda x: len(x)) == 11 / 14
 
 
-@mock.patch(PATH.format("parse_clean_topics"))
-def test_get_objects_and_topics(mocked_parser, objects, topic_counts, geo_index):
+@mock.patch(PATH.format("get_topic_labels"))
+@mock.patch(PATH.format("has_label_store"), return_value=True)
+@mock.patch(PATH.format("get_clean_topics"))
+def test_get_objects_and_topics(
+    mocked_clean, mocked_has_store, mocked_labels, objects, topic_counts, geo_index
+):
+    objects = objects.assign(id=range(len(objects)))
     topic_module = mock.Mock()
     topic_module.get_objects.return_value = objects
-    mocked_parser.return_value = topic_counts
+    mocked_clean.return_value = list(topic_counts.columns)
+    mocked_labels.return_value = topic_counts
 
     # No reweight
     _objects, _topics = get_objects_and_topics(
@@ -118,6 +134,49 @@ def test_get_objects_and_topics(mocked_parser, objects, topic_counts, geo_index)
     assert_frame_equal(_topics.reset_index(drop=True), expected_counts)
 
 
+@mock.patch(PATH.format("get_topic_labels"))
+@mock.patch(PATH.format("has_label_store"), return_value=True)
+@mock.patch(PATH.format("get_clean_topics"))
+def test_get_objects_and_topics_by_id(
+    mocked_clean, mocked_has_store, mocked_labels, objects, topic_counts, geo_index
+):
+    objects = objects.assign(id=[50, 40, 30, 20, 10])
+    topic_module = mock.Mock(__name__="some_topics")
+    topic_module.get_objects.return_value = objects
+    mocked_clean.return_value = list(topic_counts.columns)
+    # Labels by id, in a different order to the objects
+    mocked_labels.return_value = pd.DataFrame(
+        {
+            "covid": [1, 0, 1, 0],
+            "something else": [0, 1, 1, 1],
+            "not clean": [1, 1, 1, 1],
+        },
+        index=[10, 30, 40, 50],
+    )
+    _objects, _topics = get_objects_and_topics(
+        topic_module, geo_index, weight_field=None
+    )
+    assert mocked_labels.call_args[1]["ids"].tolist() == [50, 40, 30, 10]
+    assert_frame_equal(_objects, objects.loc[geo_index])
+    expected = pd.DataFrame(
+        {"covid": [0, 1, 0, 1], "something else": [1, 1, 1, 0]}, index=[0, 1, 2, 4]
+    )
+    assert_frame_equal(_topics, expected)
+
+    # Objects which aren't in the label store aren't silently unlabelled
+    mocked_labels.return_value = mocked_labels.return_value.drop(index=30)
+    with pytest.raises(ValueError, match="1 objects"):
+        get_objects_and_topics(topic_module, geo_index, weight_field=None)
+
+
+@mock.patch(PATH.format("has_label_store"), return_value=False)
+def test_get_objects_and_topics_requires_label_store(mocked_has_store, geo_index):
+    topic_module = mock.Mock(__name__="some_topics")
+    with pytest.raises(ValueError, match="some_topics has no label store"):
+        get_objects_and_topics(topic_module, geo_index, weight_field=None)
+    assert topic_module.get_objects.call_count == 0
+
+
 @mock.patch(PATH.format("thematic_diversity"))
 @mock.patch(PATH.format("get_objects_and_topics"))
 def test_generate_indicators(mocked_getter, mocked_diversity, objects, topic_counts):
@@ -151,6 +210,84 @@ def test_generate_indicators(mocked_getter, mocked_diversity, objects, topic_cou
             assert_almost_equal(indicators[name][topic], value, decimal=1)
 
 
+@pytest.fixture
+def many_objects():
+    rng = np.random.default_rng(1)
+    created = pd.to_datetime("2016-01-01") + pd.to_timedelta(
+        rng.integers(0, 365 * 5, 2000), unit="D"
+    )
+    objects = pd.DataFrame({"created": created})
+    topics = pd.DataFrame(
+        (rng.random((2000, 3)) < [0.1, 0.3, 0.5]).astype(int),
+        columns=["covid", "cells", "genes"],
+    )
+    return objects, topics
+
+
+def test_bootstrap_relative_activity(many_objects):
+    objects, topics = many_objects
+    is_covid = covid_topic_indexer(topics)
+    intervals = bootstrap_relative_activity(
+        objects, topics, is_covid, n_replicates=500, confidence=0.9, seed=0
+    )
+    assert set(intervals) == {
+        "relative_activity",
+        "relative_activity_covid",
+        "relative_activity_noncovid",
+        "overrepresentation_activity",
+    }
+    # The point estimates are within their intervals
+    sum_activity_ = partial(sum_activity, objects, topics)
+    for name, indexer in [
+        ("relative_activity", None),
+        ("relative_activity_covid", is_covid),
+        ("relative_activity_noncovid", ~is_covid),
+    ]:
+        lower, upper = intervals[name]
+        estimate = relative_activity(partial(sum_activity_, indexer=indexer))
+        assert (lower <= estimate[lower.index]).all()
+        assert (estimate[upper.index] <= upper).all()
+        assert (upper - lower > 0).any()
+    # Batching the replicates doesn't change the intervals
+    batched = bootstrap_relative_activity(
+        objects, topics, is_covid, 500, 0.9, seed=0, max_elements=3000
+    )
+    for name, (lower, upper) in intervals.items():
+        assert_almost_equal(batched[name][0].values, lower.values)
+        assert_almost_equal(batched[name][1].values, upper.values)
+
+
+def test_sampling_standard_error(many_objects):
+    objects, topics = many_objects
+    # A uniform sample of 500 of the 2000 objects, scaled up by 4
+    sample = np.random.default_rng(2).choice(2000, 500, replace=False)
+    objects = objects.iloc[sample].assign(sample_weight=4.0, sample_stratum=0)
+    topics = topics.iloc[sample] * 4.0
+    se = sampling_standard_error(objects, topics, "covid_dates", {0: (500, 4.0)})
+    # As for a simple random sample, where objects out of the date range are 0
+    slicer, norm = date_slicer(objects, "covid_dates")
+    values = (topics / 4.0).where(slicer, 0)
+    expected = norm * np.sqrt(2000**2 * (1 - 500 / 2000) * values.var() / 500)
+    assert_almost_equal(se[expected.index].values, expected.values)
+    # There is no sampling error for a census
+    census = sampling_standard_error(
+        objects.assign(sample_weight=1.0), topics / 4.0, "covid_dates", {0: (500, 1.0)}
+    )
+    assert (census == 0).all()
+
+
+@mock.patch(PATH.format("thematic_diversity"), return_value=123)
+@mock.patch(PATH.format("get_objects_and_topics"))
+def test_generate_indicators_bootstrap(mocked_getter, mocked_diversity, many_objects):
+    mocked_getter.return_value = many_objects
+    with mock.patch.dict(PATH.format("BOOTSTRAP"), {"enabled": True}):
+        indicators = generate_indicators(None, None, None)
+    lower = indicators["overrepresentation_activity_lower"]
+    upper = indicators["overrepresentation_activity_upper"]
+    assert lower.keys() == upper.keys() == {"covid", "cells", "genes"}
+    assert all(lower[topic] <= upper[topic] for topic in lower)
+
+
 def test_thematic_diversity(objects, topic_counts):
     diversity = thematic_diversity(
         objects, topic_counts, [True, True, True, True, True]
@@ -167,6 +304,52 @@ def test_indicators_by_geo(mocked_getter, mocked_generate):
     assert indicators_by_geo(None) == {"geo one": 101, "geo two": 101}
 
 
+@pytest.fixture
+def synthetic_module(tmp_path):
+    return make_topic_module(tmp_path, n_objects=500, n_geos=6, n_topics=8)
+
+
+def test_topic_network_indicators(synthetic_module):
+    geo_indices = {
+        geo_code: geo_idx
+        for geo_idx, geo_code in object_getter(synthetic_module, geo_split=True)
+    }
+    indicators = topic_network_indicators(
+        synthetic_module, geo_indices, "funding", batch_size=4
+    )
+    assert indicators.keys() == geo_indices.keys()
+    for geo_code, geo_idx in geo_indices.items():
+        # As the co-occurrence matrices of each geography in turn
+        objects, topics = get_objects_and_topics(synthetic_module, geo_idx, "funding")
+        is_covid = covid_topic_indexer(topics)
+        since_covid = objects.created > pd.to_datetime("2020-03-01")
+        labels = (topics > 0).astype(float)
+        for name, indexer in [
+            ("covid-related-projects", is_covid),
+            ("non-covid-related-projects", ~is_covid),
+        ]:
+            weights = objects.funding * (since_covid & indexer)
+            cooccurrence = labels.T.values @ np.diag(weights) @ labels.values
+            graph = topic_network(cooccurrence, list(topics.columns))
+            density = indicators[geo_code]["topic_network_density"][name]
+            assert density == pytest.approx(nx.density(graph))
+        ((topic, centrality),) = indicators[geo_code]["covid_topic_centrality"].items()
+        assert covid_filterer(topic) and 0 <= centrality <= 1
+    assert topic_network_indicators(synthetic_module, {}, None) == {}
+
+
+def test_indicators_by_geo_topic_network(synthetic_module):
+    with mock.patch.dict(PATH.format("TOPIC_NETWORK"), {"enabled": True}):
+        indicators = indicators_by_geo(synthetic_module)
+    for geo_indicators in indicators.values():
+        assert {
+            "total_activity",
+            "topic_network_density",
+            "topic_network_modularity",
+            "covid_topic_centrality",
+        } <= set(geo_indicators)
+
+
 @mock.patch(PATH.format("indicators_by_geo"), return_value=102)
 def test_make_indicators(mocked_by_geo):
     output = make_indicators(arxiv_topics, nih_topics, cordis_topics)
@@ -175,3 +358,52 @@ def test_make_indicators(mocked_by_geo):
         "nih": {"projects": 102},
         "cordis": {"projects": 102},
     }
+
+
+GEO_LOOKUPS = {
+    dataset: {f"{dataset}-{i}": np.arange(i) for i in range(10)}
+    for dataset in ("arxiv", "nih", "cordis")
+}
+
+
+def mocked_indicators_by_geo(topic_module, weight_field=None, geo_lookup=None):
+    dataset = topic_module.model_config["dataset_label"]
+    geo_lookup = GEO_LOOKUPS[dataset] if geo_lookup is None else geo_lookup
+    return {code: (dataset, weight_field, len(ids)) for code, ids in geo_lookup.items()}
+
+
+@mock.patch(
+    "indicators.core.nuts_utils.get_geo_lookup",
+    side_effect=lambda module: GEO_LOOKUPS[module.model_config["dataset_label"]],
+)
+@mock.patch(PATH.format("indicators_by_geo"), side_effect=mocked_indicators_by_geo)
+@mock.patch.object(arxiv_topics, "get_data_version", return_value="v1")
+@mock.patch.object(nih_topics, "get_data_version", return_value="v1")
+@mock.patch.object(cordis_topics, "get_data_version", return_value="v1")
+def test_make_indicators_sharded(
+    mocked_cordis, mocked_nih, mocked_arxiv, mocked_by_geo, mocked_geo_lookup, tmp_path
+):
+    modules = (arxiv_topics, nih_topics, cordis_topics)
+    expected = make_indicators(*modules)
+    queue = WorkQueue(tmp_path)
+    output = make_indicators(*modules, queue=queue)
+    assert output == expected
+    for label in expected:  # i.e. merged in the same order
+        for entity in expected[label]:
+            assert list(output[label][entity]) == list(expected[label][entity])
+    assert len(queue.shard_ids("done")) == 3 * 10  # i.e. one geography per shard
+    # Rerunning resumes (and merges) the existing queue
+    mocked_by_geo.reset_mock()
+    assert make_indicators(*modules, queue=queue) == expected
+    assert mocked_by_geo.call_count == 0
+    # Failed shards are retried on rerunning
+    shard_id = queue.shard_ids("done")[0]
+    queue.fail(shard_id, "Traceback")
+    queue.path("done", shard_id).unlink()
+    assert make_indicators(*modules, queue=queue) == expected
+    assert mocked_by_geo.call_count == 1
+    # If the data has changed since, the shards are published afresh
+    mocked_by_geo.reset_mock()
+    with mock.patch.object(arxiv_topics, "get_data_version", return_value="v2"):
+        assert make_indicators(*modules, queue=queue) == expected
+    assert mocked_by_geo.call_count == 3 * 10
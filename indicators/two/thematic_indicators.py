@@ -1,19 +1,48 @@
 from indicators.core.config import INDICATORS
+from indicators.core import indicator_utils
 from indicators.core.indicator_utils import (
-    days_of_covid,
     sort_save_and_upload,
     safe_divide,
 )
-from indicators.core.nlp_utils import parse_clean_topics
-from indicators.core.core_utils import object_getter
+from indicators.core.nlp_utils import (
+    get_clean_topics,
+    get_topic_labels,
+    has_label_store,
+)
+from indicators.core.core_utils import INDICATOR_FIELDS, object_getter, prefetch
+from indicators.core.lazy_utils import CONFIGURED, LazyConfig, LazyModule
+from indicators.core.network_utils import (
+    cooccurrence_matrices,
+    degree_centrality,
+    membership_matrix,
+    network_modularity,
+    topic_network,
+    topic_pairs,
+)
+from indicators.core.pipeline_utils import digest
+from indicators.core.profiling_utils import span, timed, write_report
+from indicators.core.shard_utils import WorkQueue, partition, run_worker
 
 
+from argparse import ArgumentParser
 from collections import defaultdict
-import pandas as pd
 from functools import partial
-from skbio.diversity.alpha import shannon
+import json
 import logging
 
+np = LazyModule("numpy")
+pd = LazyModule("pandas")
+alpha_diversity = LazyModule("skbio.diversity.alpha")
+nx = LazyModule("networkx")
+sparse = LazyModule("scipy.sparse")
+nuts_utils = LazyModule("indicators.core.nuts_utils")
+
+SHARDING = LazyConfig(lambda: INDICATORS["indicator_sharding"])
+BOOTSTRAP = LazyConfig(lambda: INDICATORS["bootstrap"])
+TOPIC_NETWORK = LazyConfig(lambda: INDICATORS["topic_network"])
+# Date ranges of the relative activity indicators
+DATE_LABELS = ("covid_dates", "precovid_dates")
+
 
 def sum_activity(objs, labels, date_label, indexer=None):
     """
@@ -32,14 +61,31 @@ def sum_activity(objs, labels, date_label, indexer=None):
     if indexer is not None:
         objs = objs.loc[indexer]
         labels = labels.loc[indexer]
+    slicer, norm = date_slicer(objs, date_label)
+    activity = labels[slicer].sum(axis=0).sort_values()
+    return norm * activity
+
+
+def date_slicer(objs, date_label):
+    """Boolean indexer of the objects in the given date range, and the factor by
+    which to scale activity in this date range to the length of "covid times"
+    """
     from_date = INDICATORS[date_label]["from_date"]
     to_date = INDICATORS[date_label]["to_date"]
     _date = objs["created"]  # "created" is the name of the date field in all datasets
-    total_days = (pd.to_datetime(to_date) - pd.to_datetime(from_date)).days
-    norm = days_of_covid / (total_days + 1)  # + 1 to be inclusive of days
     slicer = (_date > pd.to_datetime(from_date)) & (_date < pd.to_datetime(to_date))
-    activity = labels[slicer].sum(axis=0).sort_values()
-    return norm * activity
+    return slicer, date_norm(date_label)
+
+
+def date_norm(date_label):
+    """The factor by which to scale activity in the given date range to the
+    length of "covid times"
+    """
+    from_date = INDICATORS[date_label]["from_date"]
+    to_date = INDICATORS[date_label]["to_date"]
+    total_days = (pd.to_datetime(to_date) - pd.to_datetime(from_date)).days
+    # + 1 to be inclusive of days
+    return indicator_utils.days_of_covid / (total_days + 1)
 
 
 def thematic_diversity(objs, labels, is_covid):
@@ -59,7 +105,7 @@ def thematic_diversity(objs, labels, is_covid):
     _date = objs["created"]
     from_date = INDICATORS["covid_dates"]["from_date"]
     in_date_range = _date > pd.to_datetime(from_date)
-    return shannon(labels.loc[in_date_range & is_covid].sum(axis=0))
+    return alpha_diversity.shannon(labels.loc[in_date_range & is_covid].sum(axis=0))
 
 
 def covid_filterer(topic):
@@ -76,7 +122,7 @@ def covid_topic_indexer(topics):
     Returns an indexer over topic labels, indicating which are covid-related.
     """
     covid_topics = list(filter(covid_filterer, topics))[0]
-    return topics[covid_topics] == 1
+    return topics[covid_topics] > 0  # i.e. also if topics have been reweighted
 
 
 def relative_activity(activity_summer):
@@ -89,23 +135,167 @@ def relative_activity(activity_summer):
     return safe_divide(total_activity, norm_past_activity)
 
 
+def sampling_standard_error(objs, labels, date_label, sample_strata):
+    """
+    Standard error of `sum_activity` when the objects are a stratified random
+    sample (see `indicators.two.preview`), which has been scaled back up to the
+    population by each object's `sample_weight`.
+
+    Args:
+        objs (DataFrame): Sampled objects, with `sample_weight` and `sample_stratum`
+        labels (DataFrame): CorEx's binary labels matrix, scaled by `sample_weight`
+        date_label (str): Name in the indicator.yaml config file of the
+                          date set to use
+        sample_strata (dict): Sample size and weight of each stratum (over all
+                              geographies), by stratum
+    Returns:
+        standard_error (Series): Standard error of the total activity, by topic
+    """
+    slicer, norm = date_slicer(objs, date_label)
+    weight = objs.loc[slicer, "sample_weight"]
+    values = labels.loc[slicer].div(weight, axis=0)  # i.e. unscaled
+    strata = objs.loc[slicer, "sample_stratum"].values
+    sums = values.groupby(strata).sum()
+    sums_of_squares = (values**2).groupby(strata).sum()
+    n, w = (pd.Series({h: sample_strata[h][i] for h in sums.index}) for i in (0, 1))
+    # Sample variance of each stratum, in which objects in other geographies are 0
+    variance = (sums_of_squares - (sums**2).div(n, axis=0)).div(
+        (n - 1).clip(lower=1), axis=0
+    )
+    # Stratified variance of the estimated total, with finite population correction
+    total_variance = variance.mul(n * w * (w - 1), axis=0).sum(axis=0)
+    return norm * np.sqrt(total_variance)
+
+
+def bootstrap_relative_activity(
+    objs,
+    labels,
+    is_covid,
+    n_replicates=None,
+    confidence=None,
+    seed=CONFIGURED,
+    max_elements=None,
+):
+    """
+    Bootstrap confidence intervals of the relative activity indicators (and of
+    the overrepresentation of covid-related activity), by Poisson resampling of
+    the objects. Each replicate weights every object by a Poisson(1) count, such
+    that the activity of a batch of replicates is a matrix product of the
+    weights and the label matrix, rather than a loop over replicates. The
+    bootstrap arguments default to `bootstrap` in the config.
+
+    Args:
+        objs (DataFrame): Objects over which to calculate activity
+        labels (DataFrame): CorEx's binary labels matrix (or reweighted equivalent)
+        is_covid (Series): boolean indexer of the covid-related objects
+        n_replicates (int): Number of bootstrap replicates
+        confidence (float): Confidence level of the intervals, e.g. 0.95
+        seed (int): Random seed, such that intervals are reproducible (or None
+                    for a different seed each time)
+        max_elements (int): Maximum size of each batch of weights, which
+                            bounds the memory used
+    Returns:
+        intervals (dict): Lower and upper bounds (each a Series by topic)
+                          of each indicator, by indicator name
+    """
+    if n_replicates is None:
+        n_replicates = BOOTSTRAP["n_replicates"]
+    if confidence is None:
+        confidence = BOOTSTRAP["confidence"]
+    if seed is CONFIGURED:
+        seed = BOOTSTRAP["seed"]
+    if max_elements is None:
+        max_elements = BOOTSTRAP["max_elements"]
+    is_covid = np.asarray(is_covid)
+    slicers = [date_slicer(objs, label) for label in ("covid_dates", "precovid_dates")]
+    # Only objects in either date range contribute to any activity
+    relevant = np.logical_or.reduce([np.asarray(slicer) for slicer, _ in slicers])
+    values = labels.to_numpy(dtype=np.float64)[relevant]
+    # Each object is in at most one cell of (non-covid, covid) x each date range,
+    # so the activity of each cell is a product over only its objects
+    cells = [
+        (icovid, idate, np.flatnonzero((indexer & np.asarray(slicer))[relevant]), norm)
+        for icovid, indexer in enumerate((~is_covid, is_covid))
+        for idate, (slicer, norm) in enumerate(slicers)
+    ]
+    rng = np.random.default_rng(seed)
+    n_objects, n_topics = values.shape
+    batch_size = max(1, max_elements // max(1, n_objects))
+    activity = np.zeros((n_replicates, 2, len(slicers), n_topics))
+    for start in range(0, n_replicates, batch_size):
+        stop = min(start + batch_size, n_replicates)
+        weights = rng.poisson(1.0, size=(stop - start, n_objects)).astype(np.float64)
+        for icovid, idate, rows, norm in cells:
+            activity[start:stop, icovid, idate] = norm * (
+                weights[:, rows] @ values[rows]
+            )
+    # Activity of all, covid-related and non-covid-related objects
+    activity = np.stack([activity.sum(axis=1), activity[:, 1], activity[:, 0]], axis=1)
+    # As `safe_divide`, taking 1 as the upper bound of zero past activity
+    covid, precovid = activity[:, :, 0], activity[:, :, 1]
+    relative = covid / np.where(precovid == 0, 1, precovid)
+    noncovid = relative[:, 2]
+    overrepresentation = relative[:, 1] / np.where(noncovid == 0, 1, noncovid)
+    names = (
+        "relative_activity",
+        "relative_activity_covid",
+        "relative_activity_noncovid",
+    )
+    replicates = dict(zip(names, relative.transpose(1, 0, 2)))
+    replicates["overrepresentation_activity"] = overrepresentation
+    quantiles = [(1 - confidence) / 2, (1 + confidence) / 2]
+    intervals = {}
+    for name, _replicates in replicates.items():
+        lower, upper = np.quantile(_replicates, quantiles, axis=0)
+        intervals[name] = (
+            pd.Series(lower, index=labels.columns),
+            pd.Series(upper, index=labels.columns),
+        )
+    return intervals
+
+
+@timed("get_objects_and_topics", items=lambda result: len(result[0]))
 def get_objects_and_topics(topic_module, geo_index, weight_field):
     # Get objects and topics for this topic module
     from_date = INDICATORS["precovid_dates"]["from_date"]
-    object_generator = topic_module.get_objects(from_date=from_date)
-    objects = pd.DataFrame(object_generator)
-    topics = parse_clean_topics(topic_module)
+    # Only fetch the fields required for indicators, i.e. not the text
+    fields = INDICATOR_FIELDS + (() if weight_field is None else (weight_field,))
+    # Labels are selected by object id, since the row order of the objects
+    # needn't match the order in which they were fitted
+    if not has_label_store(topic_module):
+        raise ValueError(
+            f"{topic_module.__name__} has no label store, run make_topics.py first"
+        )
+    objects = pd.DataFrame(topic_module.get_objects(from_date=from_date, fields=fields))
 
     # Filter out those in this geography
-    objects = objects.loc[geo_index]
-    topics = topics.loc[geo_index]
+    objects = objects.iloc[geo_index]
+    ids = objects["id"].values
+    labels = get_topic_labels(topic_module, ids=ids)
+    n_missing = (~np.isin(ids, labels.index)).sum()
+    if n_missing:
+        raise ValueError(
+            f"{n_missing} objects of {topic_module.__name__} aren't in its label"
+            " store, label them with incremental.py or refit with make_topics.py"
+        )
+    topics = labels.loc[ids, get_clean_topics(topic_module)]
+    topics.index = objects.index
 
     # Reweight by funding, if specified, instead of raw counts
-    weight = 1 if weight_field is None else objects[weight_field]
-    topics = topics.multiply(weight, axis=0)
+    topics = topics.multiply(object_weights(objects, weight_field), axis=0)
     return objects, topics
 
 
+def object_weights(objects, weight_field):
+    """Weight of the activity of each object, i.e. its funding if `weight_field`
+    is specified (otherwise 1), scaled up to the population if a sample"""
+    weight = 1 if weight_field is None else objects[weight_field]
+    if "sample_weight" in objects:  # i.e. scale a sample up to the population
+        weight = objects["sample_weight"] * weight
+    return weight
+
+
+@timed("generate_indicators", items=None)
 def generate_indicators(topic_module, geo_index, weight_field):
     """Generate a suite of indicators for a given set of objects"""
     objects, topics = get_objects_and_topics(topic_module, geo_index, weight_field)
@@ -138,46 +328,300 @@ def generate_indicators(topic_module, geo_index, weight_field):
         indicators["relative_activity_covid"], indicators["relative_activity_noncovid"]
     )
 
+    # Standard error of additive indicators, if estimated from a sample
+    sample_strata = getattr(topic_module, "sample_strata", None)
+    if sample_strata is not None:
+        indicators["total_activity_se"] = sampling_standard_error(
+            objects, topics, "covid_dates", sample_strata
+        )
+
+    # Confidence intervals, as e.g. "relative_activity_lower"
+    if BOOTSTRAP["enabled"]:
+        intervals = bootstrap_relative_activity(objects, topics, is_covid)
+        for name, (lower, upper) in intervals.items():
+            indicators[f"{name}_lower"] = lower
+            indicators[f"{name}_upper"] = upper
+
     # Convert all to dict
     return {k: dict(v) for k, v in indicators.items()}
 
 
-def indicators_by_geo(topic_module, weight_field=None):
-    """Generate indicators for all available geographic splits of this dataset"""
-    indicators = {
-        geo_name: generate_indicators(topic_module, geo_idx, weight_field)
-        for geo_idx, geo_name in object_getter(topic_module, geo_split=True)
-    }
+@timed("topic_network_indicators")
+def topic_network_indicators(topic_module, geo_indices, weight_field, batch_size=None):
+    """
+    Summaries of the networks of co-occurring topics of the covid-related and
+    non-covid-related objects of each geography (since "covid times" began,
+    as for `thematic_diversity`), i.e. the density and modularity of each
+    network, and the degree centrality of the covid topic in the network of
+    all of the objects. The co-occurrence matrices of all geographies are
+    computed as batched sparse products (see `network_utils`), rather than
+    geography by geography.
+
+    Args:
+        topic_module (module): A topic module, e.g. arxiv_topics
+        geo_indices (dict): Positions of the objects (as for `generate_indicators`)
+                            of each geography, by geography code
+        weight_field (str): Weight co-occurrences by this field, e.g. funding
+        batch_size (int, optional): Number of geographies per sparse product,
+                                    by default as in the config
+    Returns:
+        indicators (dict): Of the form [geo_code][indicator_name][topic_name],
+                           where the "topics" of the network density and
+                           modularity are as for `thematic_diversity`
+    """
+    if not geo_indices:
+        return {}
+    if batch_size is None:
+        batch_size = TOPIC_NETWORK["batch_size"]
+    positions = np.unique(np.concatenate(list(geo_indices.values())))
+    objects, topics = get_objects_and_topics(topic_module, positions, weight_field)
+    is_covid = covid_topic_indexer(topics).to_numpy()
+    covid_topic = next(filter(covid_filterer, topics))
+    from_date = INDICATORS["covid_dates"]["from_date"]
+    in_date_range = (objects["created"] > pd.to_datetime(from_date)).to_numpy()
+    weights = np.broadcast_to(object_weights(objects, weight_field), len(objects))
+    weights = np.nan_to_num(weights.astype(float)) * in_date_range
+
+    # The covid-related and then non-covid-related network of each geography
+    rows = [np.searchsorted(positions, geo_idx) for geo_idx in geo_indices.values()]
+    membership = sparse.vstack(
+        [
+            membership_matrix(rows, len(objects), weights * is_covid),
+            membership_matrix(rows, len(objects), weights * ~is_covid),
+        ],
+        format="csr",
+    )[np.arange(2 * len(rows)).reshape(2, -1).T.ravel()]
+    pairs = topic_pairs((topics.to_numpy() > 0).astype(float))
+    matrices = cooccurrence_matrices(membership, pairs, batch_size=2 * batch_size)
+
+    topic_names = list(topics.columns)
+    indicators = {}
+    for geo_code, covid, noncovid in zip(geo_indices, matrices, matrices):
+        networks = {
+            "covid-related-projects": topic_network(covid, topic_names),
+            "non-covid-related-projects": topic_network(noncovid, topic_names),
+        }
+        network = topic_network(covid + noncovid, topic_names)
+        indicators[geo_code] = {
+            "topic_network_density": {
+                name: nx.density(graph) for name, graph in networks.items()
+            },
+            "topic_network_modularity": {
+                name: network_modularity(graph) for name, graph in networks.items()
+            },
+            "covid_topic_centrality": {
+                covid_topic: degree_centrality(network, covid_topic)
+            },
+        }
     return indicators
 
 
-def make_indicators(*modules):
-    """
-    Iterate over all dataset modules to generate indicators in terms of
-    total counts and total funding, split by all available geographic levels
-    """
-    # Generate all indicators
-    indicators = defaultdict(dict)
+def indicators_by_geo(topic_module, weight_field=None, geo_lookup=None):
+    """Generate indicators for all available geographic splits of this dataset,
+    or only for those in `geo_lookup` (e.g. a shard of `get_geo_lookup`)"""
+    with span("indicators_by_geo") as _span:
+        geo_indices = {
+            geo_name: geo_idx
+            for geo_idx, geo_name in object_getter(
+                topic_module, geo_split=True, geo_lookup=geo_lookup
+            )
+        }
+        indicators = {
+            geo_name: generate_indicators(topic_module, geo_idx, weight_field)
+            for geo_name, geo_idx in geo_indices.items()
+        }
+        # Topic co-occurrence networks, of all geographies at once
+        if TOPIC_NETWORK["enabled"]:
+            networks = topic_network_indicators(topic_module, geo_indices, weight_field)
+            for geo_name, network_indicators in networks.items():
+                indicators[geo_name].update(network_indicators)
+        _span.add_items(len(indicators))
+    return indicators
+
+
+def indicator_jobs(modules):
+    """The label, entity type, module and weight field of each set of indicators
+    to make, i.e. in terms of total counts and (where available) total funding"""
     for module in modules:
         dataset = module.model_config["dataset_label"]
         entity = module.model_config["metadata"]["entity_type"]
-        logging.info(f"Making indicators for {dataset}")
         # Indicators wrt to total activity counts
-        indicators[dataset][entity] = indicators_by_geo(module)
+        yield dataset, entity, module, None
         # e.g. arXiv does not have funding info
         if "funding_currency" not in module.model_config["dataset_label"]:
             continue
         # Indicators wrt to total funding
-        label = f"{dataset}-funding"
-        indicators[label][entity] = indicators_by_geo(module, weight_field="funding")
+        yield f"{dataset}-funding", entity, module, "funding"
+
+
+def make_indicators(*modules, queue=None):
+    """
+    Iterate over all dataset modules to generate indicators in terms of
+    total counts and total funding, split by all available geographic levels.
+    If a `WorkQueue` is given, the geographies are instead processed in shards
+    (see `make_sharded_indicators`).
+    """
+    if queue is not None:
+        return make_sharded_indicators(queue, *modules)
+    # Generate all indicators
+    indicators = defaultdict(dict)
+    for label, entity, module, weight_field in indicator_jobs(modules):
+        logging.info(f"Making indicators for {label}")
+        indicators[label][entity] = indicators_by_geo(module, weight_field)
+    return indicators
+
+
+def indicator_fingerprint(modules):
+    """Digest of what the indicators of the modules depend on, other than the
+    code, i.e. the version of each module's data (where it can be probed),
+    the date ranges and the weighting of each set of indicators"""
+    spec = {
+        "data_versions": {
+            module.model_config["dataset_label"]: (
+                module.get_data_version()
+                if hasattr(module, "get_data_version")
+                else None
+            )
+            for module in modules
+        },
+        "dates": {label: INDICATORS[label] for label in DATE_LABELS},
+        "weightings": [
+            (label, weight_field)
+            for label, _, _, weight_field in indicator_jobs(modules)
+        ],
+    }
+    return digest(json.dumps(spec, sort_keys=True, default=str).encode())
+
+
+def publish_indicator_shards(queue, *modules, n_shards=None, fingerprint=None):
+    """Partition the geographies of each set of indicators into (up to)
+    `n_shards` shards of similar size, and publish them to the queue.
+    Each shard carries its part of the geographic lookup, so that workers
+    needn't repeat the geocoding. By default, `n_shards` is as in the config,
+    and the `fingerprint` is that of `indicator_fingerprint`."""
+    if n_shards is None:
+        n_shards = SHARDING["n_shards"]
+    if fingerprint is None:
+        fingerprint = indicator_fingerprint(modules)
+    shards, manifest = {}, {"jobs": [], "shards": {}}
+    for label, entity, module, weight_field in indicator_jobs(modules):
+        geo_lookup = nuts_utils.get_geo_lookup(module)
+        sizes = {geo_code: len(ids) for geo_code, ids in geo_lookup.items()}
+        for ishard, geo_codes in enumerate(partition(sizes, n_shards)):
+            shard_id = f"{label}-{ishard:04d}"
+            shards[shard_id] = {
+                "dataset": module.model_config["dataset_label"],
+                "weight_field": weight_field,
+                "geo_lookup": {code: geo_lookup[code] for code in geo_codes},
+            }
+            manifest["shards"][shard_id] = label
+        # For merging the results in the same order as `make_indicators`
+        manifest["jobs"].append((label, entity, list(geo_lookup)))
+    queue.publish(shards, manifest, fingerprint=fingerprint)
+
+
+def process_indicator_shard(modules, spec):
+    """Make the indicators of a shard's geographies
+
+    Args:
+        modules (dict): Topic module of each dataset
+        spec (dict): A shard, from `publish_indicator_shards`
+    """
+    return indicators_by_geo(
+        modules[spec["dataset"]], spec["weight_field"], geo_lookup=spec["geo_lookup"]
+    )
+
+
+def work_on_indicator_shards(queue, *modules, wait=True):
+    """Process indicator shards from the queue, as one of any number of workers.
+    By default, wait until all shards (including those of other workers) are
+    finished, such that the queue can then be merged.
+
+    Returns:
+        n_processed (int): Number of shards processed by this worker
+    """
+    modules = {module.model_config["dataset_label"]: module for module in modules}
+    return run_worker(
+        queue,
+        partial(process_indicator_shard, modules),
+        wait=wait,
+        poll_interval=SHARDING["poll_interval"],
+        stale_timeout=SHARDING["stale_timeout"],
+    )
+
+
+def merge_indicator_shards(queue):
+    """Merge the results of the shards, in the same form and order as
+    `make_indicators`, regardless of which workers processed them or when"""
+    manifest = queue.load_manifest()
+    by_label = defaultdict(dict)
+    for shard_id, indicators in queue.results().items():
+        by_label[manifest["shards"][shard_id]].update(indicators)
+    indicators = defaultdict(dict)
+    for label, entity, geo_codes in manifest["jobs"]:
+        indicators[label][entity] = {code: by_label[label][code] for code in geo_codes}
     return indicators
 
 
+def make_sharded_indicators(queue, *modules):
+    """As `make_indicators`, except that the geographies are partitioned into
+    shards and published to a (shared-directory) work queue, which is then
+    processed by this and any other workers (see `work_on_indicator_shards`).
+    A rerun resumes the existing queue, retrying any failed shards, unless the
+    queue is out of date (see `indicator_fingerprint`), in which case it is
+    cleared and published afresh."""
+    fingerprint = indicator_fingerprint(modules)
+    if queue.is_published() and queue.is_out_of_date(fingerprint):
+        logging.info(f"The shards in {queue.directory} are out of date")
+        queue.clear()
+    if queue.is_published():
+        queue.requeue_failed()
+    else:
+        publish_indicator_shards(queue, *modules, fingerprint=fingerprint)
+    n_processed = work_on_indicator_shards(queue, *modules)
+    logging.info(f"Processed {n_processed} shards, merging results")
+    return merge_indicator_shards(queue)
+
+
 if __name__ == "__main__":
     from indicators.two import arxiv_topics, nih_topics, cordis_topics
+    from indicators.core.nlp_utils import get_corex_labels
+    from indicators.core.nuts_utils import get_geo_lookup
+    from indicators.two.region_similarity import save_similar_regions
+
+    parser = ArgumentParser(description="Generate thematic indicators")
+    parser.add_argument(
+        "--queue", help="Shared directory of a work queue, for sharded indicators"
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="Only process shards from the queue, e.g. on another host",
+    )
+    args = parser.parse_args()
+    if args.worker and args.queue is None:
+        parser.error("--worker requires --queue")
 
     logging.getLogger().setLevel(logging.INFO)
+    modules = (arxiv_topics, nih_topics, cordis_topics)
+    queue = None if args.queue is None else WorkQueue(args.queue)
+    if args.worker:
+        work_on_indicator_shards(queue, *modules)
+        raise SystemExit
+    # Run the slow DB queries concurrently, and cache the results
+    prefetch(*modules)
     # Indicators in the form [dataset][geo][indicator_name][topic_name]
-    indicators = make_indicators(arxiv_topics, nih_topics, cordis_topics)
+    indicators = make_indicators(*modules, queue=queue)
     # Flatten, sort, save locally, then upload to S3
     sort_save_and_upload(indicators)
+    # The most similar regions of each region, alongside the indicators
+    if INDICATORS["region_similarity"]["enabled"]:
+        save_similar_regions(indicators)
+    # Write the run report, if INDICATORS_PROFILE is set
+    write_report(
+        get_geo_lookup=get_geo_lookup,
+        get_corex_labels=get_corex_labels,
+        arxiv_objects=arxiv_topics.get_objects,
+        nih_objects=nih_topics.get_objects,
+        cordis_objects=cordis_topics.get_objects,
+    )